@@ -1,23 +1,113 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, g, Response, Request
+from flask import before_render_template, template_rendered
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
+import atexit
+import bisect
+import click
+import csv
+import io
+import itertools
 import os
 import json
-from datetime import datetime
+import math
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+import hashlib
+import hmac
 import sqlite3
-import uuid
-from werkzeug.utils import secure_filename
+import tempfile
+import threading
+import time
+import zlib
+import multiprocessing
+import operator
+import queue
+import random
+import secrets
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+from contextlib import contextmanager
+from urllib.parse import urlencode
+from werkzeug.datastructures import CallbackDict
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import check_password_hash, generate_password_hash
 from flask import session, jsonify
 
-def get_db_connection():
-    conn = sqlite3.connect('terrazen.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Sin Pillow se guardan solo los originales
+    Image = None
 
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 app.secret_key = 'clave_secreta_terra_zen_2024'
+app.config['DATABASE'] = os.environ.get('DATABASE_PATH', 'terrazen.db')
+
+# Pool de conexiones SQLite (por proceso / worker de gunicorn)
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 8))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+app.config['DB_CACHE_SIZE_KB'] = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))  # 16MB
+app.config['DB_MMAP_SIZE'] = int(os.environ.get('DB_MMAP_SIZE', 128 * 1024 * 1024))  # 128MB
+
+# Caché de páginas públicas renderizadas
+app.config['PAGE_CACHE_ENABLED'] = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1'
+app.config['PAGE_CACHE_PATH'] = os.environ.get('PAGE_CACHE_PATH', 'terrazen_cache.db')
+app.config['PAGE_CACHE_MEMORY_BYTES'] = int(os.environ.get('PAGE_CACHE_MEMORY_BYTES', 32 * 1024 * 1024))  # 32MB por worker
+app.config['PAGE_CACHE_DISK_BYTES'] = int(os.environ.get('PAGE_CACHE_DISK_BYTES', 256 * 1024 * 1024))  # 256MB compartidos
+# Prefijo de las claves; vacío = huella de app.py y las plantillas, calculada al configurar la app
+app.config['PAGE_CACHE_VERSION'] = os.environ.get('PAGE_CACHE_VERSION', '')
+
+# Cola de trabajos en segundo plano (0 procesos = ejecutar en la misma petición)
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_TIMEOUT'] = int(os.environ.get('JOB_TIMEOUT', 300))  # segundos antes de reintentar
+app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+
+# Ingesta de prospectos por lotes (0 = guardar cada prospecto en su propia transacción)
+app.config['LEAD_BATCHING'] = os.environ.get('LEAD_BATCHING', '1') == '1'
+app.config['LEAD_BATCH_SIZE'] = int(os.environ.get('LEAD_BATCH_SIZE', 50))
+app.config['LEAD_BATCH_MS'] = int(os.environ.get('LEAD_BATCH_MS', 200))  # espera máxima antes de escribir
+app.config['LEAD_QUEUE_SIZE'] = int(os.environ.get('LEAD_QUEUE_SIZE', 1000))
+app.config['LEAD_QUEUE_TIMEOUT'] = float(os.environ.get('LEAD_QUEUE_TIMEOUT', 0.5))
+# Lotes que no se pudieron guardar (base bloqueada) se apartan en disco y se reintentan
+app.config['LEAD_SPOOL_PATH'] = os.environ.get('LEAD_SPOOL_PATH', 'terrazen_prospectos_pendientes')
+app.config['LEAD_SPOOL_RETRY'] = float(os.environ.get('LEAD_SPOOL_RETRY', 30))  # segundos entre reintentos
+
+# Instrumentación: latencias, SQL y plantillas por petición en /metrics
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')  # Authorization: Bearer <token> para Prometheus
+app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', 500))
+
+# Sesiones: 'servidor' guarda los datos en SQLite y la cookie solo lleva el id; 'cookie' = cookie firmada de Flask
+app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'servidor')
+app.config['SESSION_DB_PATH'] = os.environ.get('SESSION_DB_PATH', 'terrazen_sessions.db')
+app.config['SESSION_SWEEP_SECONDS'] = int(os.environ.get('SESSION_SWEEP_SECONDS', 3600))
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=int(os.environ.get('SESSION_LIFETIME_HOURS', 7 * 24)))
+
+# Autenticación del CRM: método de hash de werkzeug (factor de trabajo incluido) y límites de CPU
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+app.config['AUTH_WORKERS'] = int(os.environ.get('AUTH_WORKERS', 2))  # hashes simultáneos por worker
+app.config['AUTH_QUEUE_SIZE'] = int(os.environ.get('AUTH_QUEUE_SIZE', 8))  # logins en espera antes de responder 503
+app.config['AUTH_TIMEOUT'] = float(os.environ.get('AUTH_TIMEOUT', 5))
+app.config['AUTH_CACHE_SECONDS'] = int(os.environ.get('AUTH_CACHE_SECONDS', 30))
+app.config['LOGIN_RATE_PER_MINUTE'] = float(os.environ.get('LOGIN_RATE_PER_MINUTE', 6))  # por usuario e IP
+app.config['LOGIN_BURST'] = int(os.environ.get('LOGIN_BURST', 5))
+app.config['LOGIN_IP_RATE_PER_MINUTE'] = float(os.environ.get('LOGIN_IP_RATE_PER_MINUTE', 30))  # por IP, cualquier usuario
+app.config['LOGIN_IP_BURST'] = int(os.environ.get('LOGIN_IP_BURST', 20))
+
+# Proxies de confianza delante de la app (el router de Heroku = 1): la IP del cliente sale de
+# X-Forwarded-For. Con 0 se usa la dirección de la conexión; no subirlo si no hay proxy, o el
+# cliente podría elegir su propia IP
+app.config['TRUSTED_PROXY_HOPS'] = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
 
 # Uploads
 UPLOAD_FOLDER = 'static/uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Werkzeug rechaza con 413 las peticiones más grandes antes de leer el cuerpo
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 128 * 1024 * 1024))  # 128MB
+app.config['UPLOAD_ORPHAN_DAYS'] = int(os.environ.get('UPLOAD_ORPHAN_DAYS', 2))
 
 # Crear directorio de uploads
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -25,32 +115,317 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def detect_image_type(cabecera):
+    """Extensión real de la imagen según sus primeros bytes (firma), o None"""
+    if cabecera.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if cabecera.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if cabecera[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if cabecera[:4] == b'RIFF' and cabecera[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+class UploadStream:
+    """Archivo temporal en disco que calcula SHA-256 y tamaño mientras se escribe por bloques"""
+
+    def __init__(self, folder, limite=MAX_FILE_SIZE):
+        os.makedirs(folder, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=folder, prefix='.subida-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.limite = limite
+        self.size = 0
+        self.cabecera = b''
+        self.guardado = False
+
+    @classmethod
+    def from_file(cls, origen, folder, limite=MAX_FILE_SIZE):
+        """Copia por bloques un archivo ya recibido (p. ej. fuera de UploadRequest)"""
+        stream = cls(folder, limite)
+        try:
+            for bloque in iter(lambda: origen.read(UPLOAD_CHUNK_SIZE), b''):
+                stream.write(bloque)
+        except Exception:
+            stream.close()
+            raise
+        stream.seek(0)
+        return stream
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limite:
+            raise RequestEntityTooLarge(f'Cada imagen puede pesar como máximo {self.limite // (1024 * 1024)}MB')
+        if len(self.cabecera) < 16:
+            self.cabecera += data[:16 - len(self.cabecera)]
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def readline(self, *args):
+        return self._file.readline(*args)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        return self._file.flush()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        """Cierra y, si el archivo no se almacenó, borra el temporal"""
+        self._file.close()
+        if not self.guardado:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+class UploadRequest(Request):
+    """Escribe cada imagen del multipart directo a disco, sin acumularla en memoria"""
+
+    # Solo las rutas de imágenes; el resto (p. ej. el CSV de /crm/importar) usa el stream de Werkzeug
+    STREAMED_ENDPOINTS = {'upload_images'}
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint not in self.STREAMED_ENDPOINTS:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        stream = UploadStream(app.config['UPLOAD_FOLDER'])
+        self.__dict__.setdefault('_upload_streams', []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        # Temporales de un multipart interrumpido (p. ej. 413 a medio archivo)
+        for stream in self.__dict__.pop('_upload_streams', []):
+            stream.close()
+
+app.request_class = UploadRequest
+
+# Variantes generadas por cada imagen subida (anchos en px y formatos por prioridad)
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+IMAGE_VARIANT_FORMATS = ('avif', 'webp', 'jpeg')
+IMAGE_VARIANT_QUALITY = {'avif': 55, 'webp': 75, 'jpeg': 80}
+VARIANTES_FOLDER = 'variantes'
+
+def _image_format_supported(formato):
+    try:
+        from PIL import features
+        return formato == 'jpeg' or features.check(formato)
+    except Exception:
+        return False
+
+def process_image(ruta, static_folder=None):
+    """Quita EXIF al original y genera miniaturas AVIF/WebP/JPEG; retorna el dict de variantes"""
+    if Image is None:
+        return None
+
+    origen = os.path.join(static_folder or app.static_folder, ruta)
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    carpeta = os.path.join(os.path.dirname(origen), VARIANTES_FOLDER)
+    os.makedirs(carpeta, exist_ok=True)
+
+    with Image.open(origen) as im:
+        formato_original = im.format
+        animada = getattr(im, 'is_animated', False)
+        # Aplica la orientación EXIF antes de descartar los metadatos
+        im = ImageOps.exif_transpose(im)
+        ancho, alto = im.size
+
+        # Reescribir el original sin EXIF (GPS, cámara...). Los GIF animados se dejan intactos
+        if not animada and formato_original in ('JPEG', 'PNG', 'WEBP'):
+            opciones = {'quality': 90} if formato_original in ('JPEG', 'WEBP') else {'optimize': True}
+            guardar = im.convert('RGB') if formato_original == 'JPEG' and im.mode != 'RGB' else im
+            guardar.save(origen, formato_original, **opciones)
+
+        formatos = {}
+        for formato in IMAGE_VARIANT_FORMATS:
+            if not _image_format_supported(formato):
+                continue
+            tamanos = []
+            for objetivo in IMAGE_VARIANT_WIDTHS:
+                # No se amplía: la imagen más pequeña se usa tal cual en el primer ancho
+                if objetivo > ancho and tamanos:
+                    break
+                copia = im.copy()
+                copia.thumbnail((objetivo, objetivo * 4), Image.LANCZOS)
+                if formato == 'jpeg' and copia.mode != 'RGB':
+                    copia = copia.convert('RGB')
+                extension = 'jpg' if formato == 'jpeg' else formato
+                nombre = f"{base}_{copia.width}.{extension}"
+                copia.save(os.path.join(carpeta, nombre), formato.upper(), quality=IMAGE_VARIANT_QUALITY[formato])
+                tamanos.append([copia.width, f"{os.path.dirname(ruta)}/{VARIANTES_FOLDER}/{nombre}"])
+            formatos[formato] = tamanos
+
+    return {'ancho': ancho, 'alto': alto, 'formatos': formatos}
+
+def save_image_variantes(ruta, variantes):
+    """Registra las variantes generadas para una imagen subida"""
+    try:
+        conn = get_db()
+        conn.execute('''
+            INSERT OR REPLACE INTO imagenes (ruta, ancho, alto, variantes, fecha_creacion)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            ruta,
+            variantes['ancho'],
+            variantes['alto'],
+            json.dumps(variantes['formatos']),
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        ))
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error registrando variantes de imagen: {e}")
+        return False
+
+def get_image_variantes(rutas):
+    """Variantes registradas para las rutas dadas: {ruta: {'ancho', 'alto', 'formatos'}}"""
+    rutas = list(dict.fromkeys(r for r in rutas if r))
+    if not rutas:
+        return {}
+    try:
+        marcas = ', '.join('?' for _ in rutas)
+        rows = get_db().execute(
+            f'SELECT ruta, ancho, alto, variantes FROM imagenes WHERE ruta IN ({marcas})', rutas
+        ).fetchall()
+        return {
+            row['ruta']: {'ancho': row['ancho'], 'alto': row['alto'], 'formatos': json.loads(row['variantes'])}
+            for row in rows
+        }
+    except Exception as e:
+        print(f"Error obteniendo variantes de imágenes: {e}")
+        return {}
+
+def attach_variantes(propiedades, solo_portada=False):
+    """Agrega a cada propiedad el dict 'variantes' de sus imágenes (una sola consulta)"""
+    rutas = []
+    for p in propiedades:
+        rutas.extend(p['imagenes'][:1] if solo_portada else p['imagenes'])
+    variantes = get_image_variantes(rutas)
+    for p in propiedades:
+        p['variantes'] = {r: variantes[r] for r in p['imagenes'] if r in variantes}
+    return propiedades
+
+@app.template_global()
+def srcset(variantes, formato):
+    """Atributo srcset ("url 320w, url 640w") de un formato de las variantes"""
+    return ', '.join(
+        f"{url_for('static', filename=ruta)} {ancho}w"
+        for ancho, ruta in variantes['formatos'].get(formato, [])
+    )
+
+def store_upload(stream, extension):
+    """Guarda el archivo bajo el hash de su contenido; si ya existía se reutiliza. Retorna la ruta"""
+    nombre = f"{stream.hexdigest()}.{extension}"
+    destino = os.path.join(app.config['UPLOAD_FOLDER'], nombre)
+    stream.flush()
+    # link() es atómico y no sobrescribe: una copia ya procesada (sin EXIF) queda intacta
+    try:
+        os.link(stream.path, destino)
+    except FileExistsError:
+        pass
+    except OSError:
+        if not os.path.exists(destino):
+            os.replace(stream.path, destino)
+            stream.guardado = True
+    stream.close()
+
+    ruta = f"uploads/{nombre}"
+    conn = get_db()
+    conn.execute('''
+        INSERT INTO archivos (hash, ruta, bytes, referencias, fecha_creacion)
+        VALUES (?, ?, ?, 0, ?)
+        ON CONFLICT(hash) DO NOTHING
+    ''', (stream.hexdigest(), ruta, stream.size, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    conn.commit()
+    return ruta
+
 def save_uploaded_images(files):
-    """Guarda imágenes subidas y retorna sus rutas"""
+    """Guarda imágenes subidas (una sola copia por contenido) y retorna sus rutas"""
     saved_paths = []
     
     for file in files:
         if file and file.filename != '' and allowed_file(file.filename):
-            if file.content_length > MAX_FILE_SIZE:
-                continue  # Saltar archivos muy grandes
-                
-            # Generar nombre único 
-            filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4().hex}_{filename}"
-            
-            # Guardar archivo
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
-            
-            # Guardar ruta relativa para la base de datos
-            saved_paths.append(f"uploads/{unique_filename}")
+            stream = file.stream
+            if not isinstance(stream, UploadStream):
+                stream = UploadStream.from_file(stream, app.config['UPLOAD_FOLDER'])
+
+            # El tipo se decide por la firma del contenido, no por la extensión del nombre
+            extension = detect_image_type(stream.cabecera)
+            if extension is None:
+                stream.close()
+                continue
+
+            saved_paths.append(store_upload(stream, extension))
     
     return saved_paths
 
+def update_image_refs(conn, anteriores, nuevas):
+    """Ajusta el conteo de referencias de los archivos según las imágenes que entran y salen"""
+    anteriores = Counter(anteriores)
+    nuevas = Counter(nuevas)
+    cambios = [(n, ruta) for ruta, n in (nuevas - anteriores).items()]
+    cambios += [(-n, ruta) for ruta, n in (anteriores - nuevas).items()]
+    if cambios:
+        conn.executemany(
+            'UPDATE archivos SET referencias = MAX(referencias + ?, 0) WHERE ruta = ?', cambios
+        )
+
+def delete_orphan_uploads(dias):
+    """Borra archivos sin referencias de más de `dias` días (y sus variantes); retorna cuántos"""
+    limite = datetime.fromtimestamp(time.time() - dias * 86400).strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_db()
+    rows = conn.execute(
+        'SELECT ruta FROM archivos WHERE referencias = 0 AND fecha_creacion < ?', (limite,)
+    ).fetchall()
+    rutas = [row['ruta'] for row in rows]
+    variantes = get_image_variantes(rutas)
+    for ruta in rutas:
+        archivos = [ruta]
+        for tamanos in variantes.get(ruta, {}).get('formatos', {}).values():
+            archivos.extend(r for _, r in tamanos)
+        for archivo in archivos:
+            try:
+                os.remove(os.path.join(app.static_folder, archivo))
+            except FileNotFoundError:
+                pass
+        conn.execute('DELETE FROM imagenes WHERE ruta = ?', (ruta,))
+        conn.execute('DELETE FROM archivos WHERE ruta = ? AND referencias = 0', (ruta,))
+    conn.commit()
+    return len(rutas)
+
+@app.cli.command('gc-uploads')
+@click.option('--dias', default=None, type=int, help='Antigüedad mínima de los archivos sin usar')
+def gc_uploads_command(dias):
+    """Elimina imágenes subidas que ninguna propiedad usa"""
+    borrados = delete_orphan_uploads(app.config['UPLOAD_ORPHAN_DAYS'] if dias is None else dias)
+    click.echo(f"✅ {borrados} archivo(s) sin referencias eliminado(s)")
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    if request.path == '/upload_images':
+        return jsonify({'success': False, 'error': e.description}), 413
+    return e
+
 # Ruta para subir imágenes via AJAX 
 @app.route('/upload_images', methods=['POST'])
 def upload_images():
@@ -66,195 +441,2055 @@ def upload_images():
         saved_paths = save_uploaded_images(files)
         
         if saved_paths:
+            # Miniaturas y formatos modernos en segundo plano; el formulario consulta el estado.
+            # Las imágenes repetidas ya tienen sus variantes y no se vuelven a procesar
+            trabajos = []
+            if Image is not None:
+                procesadas = get_image_variantes(saved_paths)
+                trabajos = [
+                    enqueue_job('imagen', {'ruta': ruta, 'static_folder': app.static_folder})
+                    for ruta in dict.fromkeys(saved_paths) if ruta not in procesadas
+                ]
             return jsonify({
                 'success': True, 
                 'paths': saved_paths,
+                'trabajos': [t for t in trabajos if t],
                 'message': f'{len(saved_paths)} imagen(es) subida(s) correctamente'
             })
         else:
             return jsonify({'success': False, 'error': 'No se pudieron subir las imágenes'})
             
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/upload_images/estado')
+def upload_images_estado():
+    """Estado de los trabajos de procesamiento de imágenes (?ids=1,2,3)"""
+    if not session.get('crm_logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    try:
+        ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({'success': False, 'error': 'ids inválidos'}), 400
+
+    get_dispatcher().start()
+    trabajos = get_jobs(ids[:100])
+    return jsonify({
+        'success': True,
+        'trabajos': trabajos,
+        'pendientes': sum(1 for t in trabajos if t['estado'] in ('pendiente', 'procesando'))
+    })
+
 # CONFIGURACIÓN 
 UPLOAD_FOLDER = 'static/uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # BASE DE DATOS
 def get_db_path():
-    return 'terrazen.db'
+    return app.config['DATABASE']
 
-def init_db():
-    """Inicializa todas las tablas de la base de datos"""
-    try:
-        conn = sqlite3.connect(get_db_path())
-        cursor = conn.cursor()
-        
-        # Tabla de propietarios
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS propietarios (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                email TEXT,
-                telefono TEXT,
-                fecha_registro TEXT NOT NULL,
-                activo INTEGER DEFAULT 1
-            )
+def sql_lower(valor):
+    """lower() de SQLite solo pasa a minúsculas ASCII; esta versión usa Python para 'PETÉN' → 'petén'"""
+    return valor.lower() if isinstance(valor, str) else valor
+
+class ConnectionPool:
+    """Pool acotado y thread-safe de conexiones SQLite para un proceso"""
+
+    def __init__(self, db_path, max_size=8, timeout=10.0, cache_size_kb=16384, mmap_size=0, prepare=None):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.prepare = prepare
+        # Sobrevive al fork: si el maestro ya preparó la base, los workers no la tocan al arrancar
+        self._prepared = prepare is None
+        self._prepare_lock = threading.Lock()
+        self._cond = threading.Condition(threading.Lock())
+        self._reset()
+
+    def _reset(self):
+        # Las conexiones no sobreviven a un fork: cada worker arranca su propio pool
+        self._pid = os.getpid()
+        self._idle = []
+        self._created = 0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._readers = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path, timeout=self.timeout, check_same_thread=False,
+            factory=InstrumentedConnection if app.config['METRICS_ENABLED'] else sqlite3.Connection
+        )
+        conn.row_factory = sqlite3.Row
+        conn.create_function('unicode_lower', 1, sql_lower, deterministic=True)
+        # PRAGMAs aplicados una sola vez por conexión
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def acquire(self):
+        """Entrega una conexión libre, creando una nueva si el pool no está lleno"""
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+
+            started = None
+            while not self._idle and self._created >= self.max_size:
+                if started is None:
+                    started = time.perf_counter()
+                    self._waits += 1
+                remaining = self.timeout - (time.perf_counter() - started)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._created >= self.max_size:
+                        self._timeouts += 1
+                        raise sqlite3.OperationalError(
+                            f"Pool de conexiones agotado ({self.max_size}) tras {self.timeout}s"
+                        )
+
+            if started is not None:
+                waited = time.perf_counter() - started
+                self._wait_time_total += waited
+                self._wait_time_max = max(self._wait_time_max, waited)
+
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                self._created += 1
+                conn = None
+
+            self._in_use += 1
+            self._checkouts += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+        if not self._prepared:
+            try:
+                self._prepare(conn)
+            except Exception:
+                self.release(conn)
+                raise
+        return conn
+
+    def _prepare(self, conn):
+        # Una vez por pool; los demás hilos esperan aquí hasta que la base esté lista
+        with self._prepare_lock:
+            if not self._prepared:
+                self.prepare(conn)
+                self._prepared = True
+
+    def release(self, conn):
+        """Devuelve una conexión al pool descartando transacciones abiertas"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            conn = None
+
+        with self._cond:
+            self._in_use -= 1
+            if conn is None:
+                self._created -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager para usar el pool fuera de una petición (CLI, hilos)"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def reader(self):
+        """Conexión de solo lectura fuera del pool, para lecturas que duran lo que tarde el cliente"""
+        if not self._prepared:
+            self.release(self.acquire())
+        conn = self._connect()
+        conn.execute('PRAGMA query_only = ON')
+        with self._cond:
+            self._readers += 1
+        try:
+            yield conn
+        finally:
+            conn.close()
+            with self._cond:
+                self._readers -= 1
+
+    def close_all(self):
+        with self._cond:
+            for conn in self._idle:
+                conn.close()
+            self._created -= len(self._idle)
+            self._idle = []
+
+    def stats(self):
+        """Contadores de ocupación y espera para dimensionar el pool"""
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'readers': self._readers,
+                'peak_in_use': self._peak_in_use,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'wait_time_total_ms': round(self._wait_time_total * 1000, 3),
+                'wait_time_max_ms': round(self._wait_time_max * 1000, 3),
+            }
+
+def get_pool():
+    """Obtiene (o crea) el pool de conexiones de la aplicación"""
+    pool = app.extensions.get('db_pool')
+    if pool is None or pool.db_path != get_db_path():
+        if pool is not None:
+            pool.close_all()
+        pool = ConnectionPool(
+            get_db_path(),
+            max_size=app.config['DB_POOL_SIZE'],
+            timeout=app.config['DB_POOL_TIMEOUT'],
+            cache_size_kb=app.config['DB_CACHE_SIZE_KB'],
+            mmap_size=app.config['DB_MMAP_SIZE'],
+            prepare=prepare_database,
+        )
+        app.extensions['db_pool'] = pool
+    return pool
+
+def get_db():
+    """Conexión del pool ligada al contexto de aplicación actual"""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+# INSTRUMENTACIÓN
+# Latencia por ruta, consultas SQL, render de plantillas y tamaño de respuesta de este
+# worker; se exponen en formato de texto de Prometheus en /metrics
+LATENCIA_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICAS_MAX_CONSULTAS = 200  # consultas SQL distintas con serie propia; el resto va a "otras"
+_MARCAS_SQL = re.compile(r'\?(?:\s*,\s*\?)+')
+_sql_normalizado = {}
+_medicion = threading.local()  # estado de la petición en curso en este hilo
+
+def normalize_sql(sql):
+    """Consulta en una sola línea y con las listas IN (?, ?, ...) colapsadas"""
+    clave = _sql_normalizado.get(sql)
+    if clave is None:
+        clave = _MARCAS_SQL.sub('?, ...', ' '.join(sql.split()))[:200]
+        if len(_sql_normalizado) > 1000:
+            _sql_normalizado.clear()
+        _sql_normalizado[sql] = clave
+    return clave
+
+class Histogram:
+    """Histograma acumulativo al estilo Prometheus, con una serie por etiqueta"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}  # etiqueta -> [conteo por bucket (+Inf al final), suma]
+
+    def observe(self, etiqueta, valor):
+        serie = self.series.get(etiqueta)
+        if serie is None:
+            serie = self.series[etiqueta] = [[0] * (len(self.buckets) + 1), 0.0]
+        serie[0][bisect.bisect_left(self.buckets, valor)] += 1
+        serie[1] += valor
+
+class RequestMetrics:
+    """Contadores de rendimiento de las peticiones y consultas de este worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = Histogram(LATENCIA_BUCKETS)  # por endpoint
+        self.plantillas = Histogram(LATENCIA_BUCKETS)  # por plantilla
+        self.peticiones = Counter()  # (endpoint, método, status)
+        self.bytes = Counter()  # endpoint -> bytes de respuestas con tamaño conocido
+        self.sql_consultas = Counter()  # endpoint -> consultas
+        self.sql_segundos = Counter()  # endpoint -> segundos en SQL
+        self.consultas = {}  # sql normalizado -> [ejecuciones, segundos]
+        self.lentas = 0
+
+    def record_sql(self, sql, segundos, nueva):
+        clave = normalize_sql(sql)
+        with self._lock:
+            consulta = self.consultas.get(clave)
+            if consulta is None:
+                if len(self.consultas) >= METRICAS_MAX_CONSULTAS:
+                    clave = 'otras'
+                consulta = self.consultas.setdefault(clave, [0, 0.0])
+            consulta[0] += nueva
+            consulta[1] += segundos
+        return clave
+
+    def record_template(self, nombre, segundos):
+        with self._lock:
+            self.plantillas.observe(nombre, segundos)
+
+    def record_request(self, endpoint, metodo, status, segundos, tamano, consultas, sql_segundos):
+        with self._lock:
+            self.peticiones[(endpoint, metodo, str(status))] += 1
+            self.latencias.observe(endpoint, segundos)
+            if tamano is not None:
+                self.bytes[endpoint] += tamano
+            self.sql_consultas[endpoint] += consultas
+            self.sql_segundos[endpoint] += sql_segundos
+
+    def render(self, gauges=()):
+        """Texto de exposición de Prometheus (versión 0.0.4)"""
+        lineas = []
+
+        def cabecera(nombre, tipo, ayuda):
+            lineas.append(f'# HELP {nombre} {ayuda}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+
+        def histograma(nombre, etiqueta, hist):
+            for valor, (conteos, suma) in sorted(hist.series.items()):
+                acumulado = 0
+                for limite, conteo in zip(hist.buckets + ('+Inf',), conteos):
+                    acumulado += conteo
+                    lineas.append(f'{nombre}_bucket{{{etiqueta}="{_prom_label(valor)}",le="{limite}"}} {acumulado}')
+                lineas.append(f'{nombre}_sum{{{etiqueta}="{_prom_label(valor)}"}} {suma:.6f}')
+                lineas.append(f'{nombre}_count{{{etiqueta}="{_prom_label(valor)}"}} {acumulado}')
+
+        with self._lock:
+            cabecera('terrazen_http_requests_total', 'counter', 'Peticiones atendidas por endpoint, método y status')
+            for (endpoint, metodo, status), total in sorted(self.peticiones.items()):
+                lineas.append(
+                    f'terrazen_http_requests_total{{endpoint="{_prom_label(endpoint)}",method="{metodo}",status="{status}"}} {total}'
+                )
+            cabecera('terrazen_http_request_duration_seconds', 'histogram', 'Latencia de las peticiones por endpoint')
+            histograma('terrazen_http_request_duration_seconds', 'endpoint', self.latencias)
+            cabecera('terrazen_http_response_bytes_total', 'counter', 'Bytes de respuesta por endpoint (sin streaming)')
+            for endpoint, total in sorted(self.bytes.items()):
+                lineas.append(f'terrazen_http_response_bytes_total{{endpoint="{_prom_label(endpoint)}"}} {total}')
+            cabecera('terrazen_request_sql_queries_total', 'counter', 'Consultas SQL ejecutadas por las peticiones de cada endpoint')
+            for endpoint, total in sorted(self.sql_consultas.items()):
+                lineas.append(f'terrazen_request_sql_queries_total{{endpoint="{_prom_label(endpoint)}"}} {total}')
+            cabecera('terrazen_request_sql_seconds_total', 'counter', 'Tiempo en SQL de las peticiones de cada endpoint')
+            for endpoint, total in sorted(self.sql_segundos.items()):
+                lineas.append(f'terrazen_request_sql_seconds_total{{endpoint="{_prom_label(endpoint)}"}} {total:.6f}')
+            cabecera('terrazen_template_render_seconds', 'histogram', 'Tiempo de render por plantilla')
+            histograma('terrazen_template_render_seconds', 'template', self.plantillas)
+            cabecera('terrazen_sql_executions_total', 'counter', 'Ejecuciones por consulta SQL (peticiones, CLI e hilos)')
+            for sql, (total, _) in sorted(self.consultas.items()):
+                lineas.append(f'terrazen_sql_executions_total{{query="{_prom_label(sql)}"}} {total}')
+            cabecera('terrazen_sql_seconds_total', 'counter', 'Tiempo de ejecución y lectura por consulta SQL')
+            for sql, (_, segundos) in sorted(self.consultas.items()):
+                lineas.append(f'terrazen_sql_seconds_total{{query="{_prom_label(sql)}"}} {segundos:.6f}')
+            cabecera('terrazen_slow_requests_total', 'counter', 'Peticiones por encima de SLOW_REQUEST_MS')
+            lineas.append(f'terrazen_slow_requests_total {self.lentas}')
+
+        for nombre, ayuda, valor in gauges:
+            cabecera(nombre, 'gauge', ayuda)
+            lineas.append(f'{nombre} {valor}')
+        return '\n'.join(lineas) + '\n'
+
+def _prom_label(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def get_request_metrics():
+    metricas = app.extensions.get('request_metrics')
+    if metricas is None:
+        metricas = app.extensions.setdefault('request_metrics', RequestMetrics())
+    return metricas
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor que mide cada consulta: ejecución y lectura con fetchone/fetchmany/fetchall"""
+    _sql = None
+    _segundos = 0.0
+
+    def _record(self, inicio, sql=None):
+        segundos = time.perf_counter() - inicio
+        if sql is not None:
+            self._sql = sql
+            self._segundos = 0.0
+        self._segundos += segundos
+        clave = get_request_metrics().record_sql(self._sql, segundos, sql is not None)
+        if getattr(_medicion, 'activa', False):
+            _medicion.sql_consultas += sql is not None
+            _medicion.sql_segundos += segundos
+            if self._segundos > _medicion.sql_max[0]:
+                _medicion.sql_max = (self._segundos, clave)
+
+    def execute(self, sql, parameters=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(inicio, sql)
+
+    def executemany(self, sql, seq_of_parameters):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(inicio, sql)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._record(inicio)
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._record(inicio)
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._record(inicio)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Conexión cuyos cursores (incluidos los de conn.execute) se miden"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute de C no pasa por cursor(): se redirige explícitamente
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+@app.before_request
+def start_request_metrics():
+    if not app.config['METRICS_ENABLED']:
+        return
+    _medicion.activa = True
+    _medicion.inicio = time.perf_counter()
+    _medicion.sql_consultas = 0
+    _medicion.sql_segundos = 0.0
+    _medicion.sql_max = (0.0, None)
+    _medicion.plantillas = []
+    _medicion.plantilla_segundos = 0.0
+
+@app.after_request
+def record_request_metrics(response):
+    if not getattr(_medicion, 'activa', False):
+        return response
+    _medicion.activa = False
+    segundos = time.perf_counter() - _medicion.inicio
+    endpoint = request.endpoint or 'sin_ruta'
+    # Las respuestas en streaming no tienen tamaño conocido aquí
+    tamano = None if response.is_streamed else response.content_length
+    metricas = get_request_metrics()
+    metricas.record_request(
+        endpoint, request.method, response.status_code, segundos, tamano,
+        _medicion.sql_consultas, _medicion.sql_segundos
+    )
+    if segundos * 1000 >= app.config['SLOW_REQUEST_MS']:
+        with metricas._lock:
+            metricas.lentas += 1
+        app.logger.warning('peticion_lenta %s', json.dumps({
+            'metodo': request.method,
+            'ruta': request.full_path.rstrip('?'),
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'duracion_ms': round(segundos * 1000, 1),
+            'sql_consultas': _medicion.sql_consultas,
+            'sql_ms': round(_medicion.sql_segundos * 1000, 1),
+            'sql_mas_lenta_ms': round(_medicion.sql_max[0] * 1000, 1),
+            'sql_mas_lenta': _medicion.sql_max[1],
+            'plantilla_ms': round(_medicion.plantilla_segundos * 1000, 1),
+            'bytes': tamano,
+            'pid': os.getpid(),
+        }, ensure_ascii=False))
+    return response
+
+def _template_started(sender, template, context, **extra):
+    if getattr(_medicion, 'activa', False):
+        _medicion.plantillas.append(time.perf_counter())
+
+def _template_rendered(sender, template, context, **extra):
+    if getattr(_medicion, 'activa', False) and _medicion.plantillas:
+        segundos = time.perf_counter() - _medicion.plantillas.pop()
+        _medicion.plantilla_segundos += segundos
+        get_request_metrics().record_template(template.name or 'sin_nombre', segundos)
+
+before_render_template.connect(_template_started, app)
+template_rendered.connect(_template_rendered, app)
+
+def runtime_gauges():
+    """Contadores numéricos del pool, la caché de páginas y la ingesta de prospectos como gauges"""
+    fuentes = [('db_pool', 'Pool de conexiones', get_pool().stats())]
+    if page_cache_enabled():
+        fuentes.append(('page_cache', 'Caché de páginas', get_page_cache().stats()))
+    if isinstance(app.session_interface, ServerSessionInterface):
+        fuentes.append(('sessions', 'Sesiones en el servidor', get_session_store().stats()))
+    if 'password_hasher' in app.extensions:
+        fuentes.append(('auth', 'Hash de contraseñas', get_password_hasher().stats()))
+    if 'login_limiter' in app.extensions:
+        fuentes.append(('login_limiter', 'Límite de intentos de login por usuario e IP', get_login_limiter().stats()))
+    if 'login_ip_limiter' in app.extensions:
+        fuentes.append(('login_ip_limiter', 'Límite de intentos de login por IP', get_login_ip_limiter().stats()))
+    writer = app.extensions.get('lead_writer')
+    if writer is not None:
+        fuentes.append(('lead_writer', 'Ingesta de prospectos', writer.stats()))
+    gauges = []
+    for prefijo, descripcion, stats in fuentes:
+        for campo, valor in stats.items():
+            if isinstance(valor, (bool, int, float)) and campo != 'pid':
+                gauges.append((f'terrazen_{prefijo}_{campo}', f'{descripcion}: {campo}', int(valor) if isinstance(valor, bool) else valor))
+    arranque_ms = app.extensions.get('arranque_worker_ms')
+    if arranque_ms is not None:
+        gauges.append(('terrazen_worker_boot_ms', 'Arranque del worker: del fork a listo (ms)', arranque_ms))
+    return gauges
+
+# MIGRACIONES
+# Cada migración se aplica una sola vez; la versión actual vive en PRAGMA user_version
+MIGRATIONS = []
+
+def migration(version, descripcion):
+    """Registra una función como migración del esquema"""
+    def decorator(func):
+        MIGRATIONS.append((version, descripcion, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+PROPIEDADES_DDL = '''
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        propietario_id INTEGER,
+        titulo_es TEXT NOT NULL,
+        descripcion_es TEXT,
+        titulo_en TEXT NOT NULL,
+        descripcion_en TEXT,
+        precio TEXT,
+        ubicacion TEXT,
+        tipo TEXT,
+        tipo_es TEXT,
+        tipo_en TEXT,
+        estado TEXT DEFAULT 'disponible',
+        imagenes TEXT,
+        whatsapp TEXT,
+        fecha_creacion TEXT NOT NULL,
+        activo INTEGER DEFAULT 1,
+        FOREIGN KEY (propietario_id) REFERENCES propietarios (id)
+    )
+'''
+
+@migration(1, 'Esquema base')
+def _migration_esquema_base(conn):
+    # Tabla de propietarios
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS propietarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            email TEXT,
+            telefono TEXT,
+            fecha_registro TEXT NOT NULL,
+            activo INTEGER DEFAULT 1
+        )
+    ''')
+
+    # Tabla de propiedades
+    if 'propiedades' not in [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]:
+        conn.execute(PROPIEDADES_DDL.format(name='propiedades'))
+
+    # Tabla de prospectos
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prospects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            email TEXT,
+            telefono TEXT NOT NULL,
+            fuente TEXT,
+            fecha TEXT NOT NULL,
+            propiedad TEXT,
+            propiedad_id INTEGER,
+            idioma TEXT
+        )
+    ''')
+
+    # Tabla de usuarios CRM
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios_crm (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            nombre TEXT NOT NULL,
+            fecha_registro TEXT NOT NULL,
+            activo INTEGER DEFAULT 1
+        )
+    ''')
+
+@migration(2, 'Columna tipo en propiedades')
+def _migration_columna_tipo(conn):
+    # Las BD creadas con el CREATE TABLE antiguo no tienen "tipo". Se reconstruye
+    # la tabla (en vez de ALTER TABLE) para conservar el orden de columnas que
+    # esperan las lecturas posicionales (tipo en la posición 8).
+    columnas = table_columns(conn, 'propiedades')
+    if 'tipo' in columnas:
+        return
+    conn.execute(PROPIEDADES_DDL.format(name='propiedades_nueva'))
+    comunes = ', '.join(columnas)
+    conn.execute(f'INSERT INTO propiedades_nueva ({comunes}) SELECT {comunes} FROM propiedades')
+    conn.execute('DROP TABLE propiedades')
+    conn.execute('ALTER TABLE propiedades_nueva RENAME TO propiedades')
+
+@migration(3, 'Índices para consultas frecuentes')
+def _migration_indices(conn):
+    # Listado público y CRM: WHERE activo = 1 ORDER BY fecha_creacion DESC
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_propiedades_activas_fecha
+        ON propiedades (fecha_creacion DESC) WHERE activo = 1
+    ''')
+    # Detalle de propietario: WHERE propietario_id = ? AND activo = 1 ORDER BY fecha_creacion DESC
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_propiedades_propietario_fecha
+        ON propiedades (propietario_id, fecha_creacion DESC) WHERE activo = 1
+    ''')
+    # Propietarios activos ORDER BY nombre
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_propietarios_activos_nombre
+        ON propietarios (nombre) WHERE activo = 1
+    ''')
+    # Prospectos ORDER BY fecha DESC
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_prospects_fecha
+        ON prospects (fecha DESC)
+    ''')
+    # usuarios_crm WHERE username = ? ya usa el índice UNIQUE de la columna
+
+@migration(4, 'Precio numérico e índice por tipo')
+def _migration_precio_numerico(conn):
+    if 'precio_num' not in table_columns(conn, 'propiedades'):
+        conn.execute('ALTER TABLE propiedades ADD COLUMN precio_num INTEGER')
+    filas = conn.execute('SELECT id, precio FROM propiedades').fetchall()
+    conn.executemany(
+        'UPDATE propiedades SET precio_num = ? WHERE id = ?',
+        ((parse_price(precio)[0], propiedad_id) for propiedad_id, precio in filas)
+    )
+    # Listado filtrado por tipo: WHERE activo = 1 AND tipo = ? ORDER BY fecha_creacion DESC
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_propiedades_tipo_fecha
+        ON propiedades (tipo, fecha_creacion DESC) WHERE activo = 1
+    ''')
+
+@migration(5, 'Moneda del precio e índice por rango de precio')
+def _migration_precio_moneda(conn):
+    if 'precio_moneda' not in table_columns(conn, 'propiedades'):
+        conn.execute('ALTER TABLE propiedades ADD COLUMN precio_moneda TEXT')
+    filas = conn.execute('SELECT id, precio FROM propiedades').fetchall()
+    conn.executemany(
+        'UPDATE propiedades SET precio_num = ?, precio_moneda = ? WHERE id = ?',
+        ((*parse_price(precio), propiedad_id) for propiedad_id, precio in filas)
+    )
+    # Filtro por rango: un rango por moneda sobre (precio_moneda, precio_num)
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_propiedades_moneda_precio
+        ON propiedades (precio_moneda, precio_num) WHERE activo = 1
+    ''')
+
+@migration(6, 'Índice de texto completo (FTS5) de propiedades')
+def _migration_busqueda_texto(conn):
+    # Tabla FTS de contenido externo: guarda solo el índice, el texto vive en propiedades.
+    # remove_diacritics permite que "peten" encuentre "Petén"
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS propiedades_fts USING fts5(
+            titulo_es, titulo_en, descripcion_es, descripcion_en, ubicacion,
+            content='propiedades', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    # Relevancia bm25: pesan más los títulos y la ubicación que las descripciones
+    conn.execute("INSERT INTO propiedades_fts(propiedades_fts, rank) VALUES('rank', 'bm25(10.0, 10.0, 1.0, 1.0, 5.0)')")
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS propiedades_fts_ai AFTER INSERT ON propiedades BEGIN
+            INSERT INTO propiedades_fts (rowid, titulo_es, titulo_en, descripcion_es, descripcion_en, ubicacion)
+            VALUES (new.id, new.titulo_es, new.titulo_en, new.descripcion_es, new.descripcion_en, new.ubicacion);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS propiedades_fts_ad AFTER DELETE ON propiedades BEGIN
+            INSERT INTO propiedades_fts (propiedades_fts, rowid, titulo_es, titulo_en, descripcion_es, descripcion_en, ubicacion)
+            VALUES ('delete', old.id, old.titulo_es, old.titulo_en, old.descripcion_es, old.descripcion_en, old.ubicacion);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS propiedades_fts_au
+        AFTER UPDATE OF titulo_es, titulo_en, descripcion_es, descripcion_en, ubicacion ON propiedades BEGIN
+            INSERT INTO propiedades_fts (propiedades_fts, rowid, titulo_es, titulo_en, descripcion_es, descripcion_en, ubicacion)
+            VALUES ('delete', old.id, old.titulo_es, old.titulo_en, old.descripcion_es, old.descripcion_en, old.ubicacion);
+            INSERT INTO propiedades_fts (rowid, titulo_es, titulo_en, descripcion_es, descripcion_en, ubicacion)
+            VALUES (new.id, new.titulo_es, new.titulo_en, new.descripcion_es, new.descripcion_en, new.ubicacion);
+        END
+    ''')
+    conn.execute("INSERT INTO propiedades_fts(propiedades_fts) VALUES('rebuild')")
+
+@migration(7, 'Revisión y fecha de actualización de propiedades')
+def _migration_revisiones(conn):
+    columnas = table_columns(conn, 'propiedades')
+    if 'revision' not in columnas:
+        conn.execute('ALTER TABLE propiedades ADD COLUMN revision INTEGER NOT NULL DEFAULT 1')
+    if 'fecha_actualizacion' not in columnas:
+        conn.execute('ALTER TABLE propiedades ADD COLUMN fecha_actualizacion TEXT')
+    conn.execute('UPDATE propiedades SET fecha_actualizacion = fecha_creacion WHERE fecha_actualizacion IS NULL')
+
+    # Revisión global del catálogo para validar el listado con una sola lectura
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS revisiones (
+            nombre TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL,
+            fecha_actualizacion TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO revisiones (nombre, revision, fecha_actualizacion)
+        VALUES ('propiedades', 1, COALESCE((SELECT MAX(fecha_actualizacion) FROM propiedades), datetime('now', 'localtime')))
+    ''')
+    for evento in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS propiedades_revision_{evento.lower()} AFTER {evento} ON propiedades BEGIN
+                UPDATE revisiones
+                SET revision = revision + 1, fecha_actualizacion = datetime('now', 'localtime')
+                WHERE nombre = 'propiedades';
+            END
         ''')
-        
-        # Tabla de propiedades
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS propiedades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                propietario_id INTEGER,
-                titulo_es TEXT NOT NULL,
-                descripcion_es TEXT,
-                titulo_en TEXT NOT NULL,
-                descripcion_en TEXT,
-                precio TEXT,
-                ubicacion TEXT,
-                tipo_es TEXT,  
-                tipo_en TEXT,
-                estado TEXT DEFAULT 'disponible',
-                imagenes TEXT,
-                whatsapp TEXT,
-                fecha_creacion TEXT NOT NULL,
-                activo INTEGER DEFAULT 1,
-                FOREIGN KEY (propietario_id) REFERENCES propietarios (id)
-            )
+
+@migration(8, 'Registro de variantes de imágenes')
+def _migration_imagenes(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS imagenes (
+            ruta TEXT PRIMARY KEY,
+            ancho INTEGER,
+            alto INTEGER,
+            variantes TEXT NOT NULL,
+            fecha_creacion TEXT NOT NULL
+        )
+    ''')
+
+@migration(9, 'Cola de trabajos en segundo plano')
+def _migration_trabajos(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS trabajos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            intentos INTEGER NOT NULL DEFAULT 0,
+            resultado TEXT,
+            error TEXT,
+            fecha_creacion TEXT NOT NULL,
+            fecha_actualizacion TEXT NOT NULL
+        )
+    ''')
+    # Reclamar el siguiente pendiente y detectar trabajos colgados sin recorrer la tabla
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_trabajos_estado
+        ON trabajos (estado, id) WHERE estado IN ('pendiente', 'procesando')
+    ''')
+
+@migration(10, 'Archivos subidos direccionados por contenido')
+def _migration_archivos(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archivos (
+            hash TEXT PRIMARY KEY,
+            ruta TEXT NOT NULL UNIQUE,
+            bytes INTEGER NOT NULL,
+            referencias INTEGER NOT NULL DEFAULT 0,
+            fecha_creacion TEXT NOT NULL
+        )
+    ''')
+    # Limpieza de huérfanos sin recorrer los archivos en uso
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_archivos_huerfanos
+        ON archivos (fecha_creacion) WHERE referencias = 0
+    ''')
+
+@migration(11, 'Índices de filtros de prospectos')
+def _migration_indices_prospectos(conn):
+    # La paginación por keyset ordena por (fecha, id): el id va explícito en el índice
+    # para que el desempate no requiera un ordenamiento temporal
+    conn.execute('DROP INDEX IF EXISTS idx_prospects_fecha')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_prospects_fecha_id
+        ON prospects (fecha DESC, id DESC)
+    ''')
+    # Filtros de la consola de prospectos, ya ordenados igual
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_prospects_fuente_fecha
+        ON prospects (fuente, fecha DESC, id DESC)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_prospects_propiedad_fecha
+        ON prospects (propiedad_id, fecha DESC, id DESC)
+    ''')
+
+@migration(12, 'Referencia externa para importaciones idempotentes')
+def _migration_ref_externa(conn):
+    for tabla in ('propietarios', 'propiedades'):
+        if 'ref_externa' not in table_columns(conn, tabla):
+            conn.execute(f'ALTER TABLE {tabla} ADD COLUMN ref_externa TEXT')
+        conn.execute(f'''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{tabla}_ref_externa
+            ON {tabla} (ref_externa) WHERE ref_externa IS NOT NULL
         ''')
-        
-        # Tabla de prospectos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS prospects (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                email TEXT,
-                telefono TEXT NOT NULL,
-                fuente TEXT,
-                fecha TEXT NOT NULL,
-                propiedad TEXT,
-                propiedad_id INTEGER,
-                idioma TEXT
-            )
+
+def create_prospect_metric_triggers(conn):
+    """Triggers que mantienen las métricas con cada alta o baja de prospectos"""
+    # Los triggers cubren todas las escrituras: formulario, lotes, importación y borrados;
+    # solo los propiedad_id enteros cuentan (un texto no entra en la clave INTEGER PRIMARY KEY)
+    for evento, signo, fila in (('INSERT', '+', 'new'), ('DELETE', '-', 'old')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS metricas_prospects_{evento.lower()} AFTER {evento} ON prospects BEGIN
+                INSERT INTO metricas_prospectos (dia, fuente, idioma, total)
+                VALUES (substr({fila}.fecha, 1, 10), COALESCE({fila}.fuente, ''), COALESCE({fila}.idioma, ''), {signo}1)
+                ON CONFLICT (dia, fuente, idioma) DO UPDATE SET total = total {signo} 1;
+                INSERT INTO metricas_propiedades (propiedad_id, prospectos)
+                SELECT {fila}.propiedad_id, {signo}1 WHERE typeof({fila}.propiedad_id) = 'integer'
+                ON CONFLICT (propiedad_id) DO UPDATE SET prospectos = prospectos {signo} 1;
+                UPDATE metricas_propietarios SET prospectos = prospectos {signo} 1
+                WHERE typeof({fila}.propiedad_id) = 'integer'
+                  AND propietario_id = (SELECT propietario_id FROM propiedades WHERE id = {fila}.propiedad_id);
+            END
         ''')
-        
-        # Tabla de usuarios CRM
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS usuarios_crm (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                nombre TEXT NOT NULL,
-                fecha_registro TEXT NOT NULL,
-                activo INTEGER DEFAULT 1
+
+@migration(13, 'Métricas agregadas del CRM')
+def _migration_metricas(conn):
+    # Prospectos por día, fuente e idioma (el embudo del dashboard)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metricas_prospectos (
+            dia TEXT NOT NULL,
+            fuente TEXT NOT NULL,
+            idioma TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, fuente, idioma)
+        ) WITHOUT ROWID
+    ''')
+    # Prospectos por propiedad
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metricas_propiedades (
+            propiedad_id INTEGER PRIMARY KEY,
+            prospectos INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Propiedades activas y prospectos (de todas sus propiedades) por propietario
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metricas_propietarios (
+            propietario_id INTEGER PRIMARY KEY,
+            propiedades INTEGER NOT NULL DEFAULT 0,
+            prospectos INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Rankings del dashboard sin ordenar en memoria
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_metricas_propiedades_prospectos ON metricas_propiedades (prospectos DESC)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_metricas_propietarios_prospectos ON metricas_propietarios (prospectos DESC)')
+
+    # Prospectos sin propiedad guardados con propiedad_id = '' antes de normalizarlo a NULL
+    conn.execute("UPDATE prospects SET propiedad_id = NULL WHERE propiedad_id = ''")
+    create_prospect_metric_triggers(conn)
+
+    # Una propiedad suma sus prospectos a su propietario mientras existe, activa o no
+    resta_propiedad = '''
+        UPDATE metricas_propietarios
+        SET propiedades = propiedades - (old.activo IS 1),
+            prospectos = prospectos - COALESCE((SELECT prospectos FROM metricas_propiedades WHERE propiedad_id = old.id), 0)
+        WHERE propietario_id = old.propietario_id;
+    '''
+    suma_propiedad = '''
+        INSERT INTO metricas_propietarios (propietario_id, propiedades, prospectos)
+        SELECT new.propietario_id, (new.activo IS 1),
+               COALESCE((SELECT prospectos FROM metricas_propiedades WHERE propiedad_id = new.id), 0)
+        WHERE new.propietario_id IS NOT NULL
+        ON CONFLICT (propietario_id) DO UPDATE SET
+            propiedades = propiedades + excluded.propiedades,
+            prospectos = prospectos + excluded.prospectos;
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS metricas_propiedades_insert AFTER INSERT ON propiedades BEGIN
+            {suma_propiedad}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS metricas_propiedades_update AFTER UPDATE OF activo, propietario_id ON propiedades
+        WHEN old.activo IS NOT new.activo OR old.propietario_id IS NOT new.propietario_id BEGIN
+            {resta_propiedad}
+            {suma_propiedad}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS metricas_propiedades_delete AFTER DELETE ON propiedades BEGIN
+            {resta_propiedad}
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS metricas_propietarios_delete AFTER DELETE ON propietarios BEGIN
+            DELETE FROM metricas_propietarios WHERE propietario_id = old.id;
+        END
+    ''')
+    rebuild_metrics(conn)
+
+def is_password_hash(valor):
+    """True si el valor tiene el formato de werkzeug (método$sal$hash)"""
+    partes = valor.split('$')
+    return len(partes) == 3 and partes[0].startswith(('pbkdf2:', 'scrypt'))
+
+@migration(14, 'Contraseñas del CRM con hash')
+def _migration_password_hash(conn):
+    # Las contraseñas en texto plano pasan a hash; los cambios de método se aplican en el siguiente login
+    for user_id, password in conn.execute('SELECT id, password_hash FROM usuarios_crm').fetchall():
+        if not is_password_hash(password):
+            conn.execute(
+                'UPDATE usuarios_crm SET password_hash = ? WHERE id = ?',
+                (generate_password_hash(password, app.config['PASSWORD_HASH_METHOD']), user_id)
             )
-        ''')
-        
-        conn.commit()
-        conn.close()
-        print("✅ Base de datos inicializada correctamente")
-    except Exception as e:
-        print(f"❌ Error inicializando BD: {e}")
 
-def create_default_crm_user():
+@migration(15, 'Prospectos sin propiedad con propiedad_id NULL')
+def _migration_prospectos_sin_propiedad(conn):
+    # Bases que ya aplicaron la 13 con los triggers anteriores
+    conn.execute("UPDATE prospects SET propiedad_id = NULL WHERE propiedad_id = ''")
+    conn.execute('DROP TRIGGER IF EXISTS metricas_prospects_insert')
+    conn.execute('DROP TRIGGER IF EXISTS metricas_prospects_delete')
+    create_prospect_metric_triggers(conn)
+    rebuild_metrics(conn)
+
+@migration(16, 'Precios con punto de miles ("€150.000") recalculados')
+def _migration_precio_miles(conn):
+    # parse_price leía "150.000" como 150; solo se reescriben las filas cuyo monto cambia
+    filas = conn.execute('SELECT id, precio, precio_num, precio_moneda FROM propiedades').fetchall()
+    conn.executemany(
+        'UPDATE propiedades SET precio_num = ?, precio_moneda = ? WHERE id = ?',
+        (
+            (*nuevo, propiedad_id)
+            for propiedad_id, precio, precio_num, precio_moneda in filas
+            for nuevo in [parse_price(precio)]
+            if nuevo != (precio_num, precio_moneda)
+        )
+    )
+
+def run_migrations(conn):
+    """Aplica en orden las migraciones pendientes y retorna las versiones aplicadas"""
+    aplicadas = []
+    for version, descripcion, migrate in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+        # BEGIN IMMEDIATE serializa a los workers que arrancan a la vez
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            migrate(conn)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        aplicadas.append(version)
+        print(f"✅ Migración {version} aplicada: {descripcion}")
+    if aplicadas:
+        conn.execute('PRAGMA optimize')
+    return aplicadas
+
+# Importar app.py no toca la base: la primera conexión del pool en cada proceso la prepara.
+# Con gunicorn.conf.py lo hace el maestro antes de crear los workers, que heredan el pool preparado.
+def prepare_database(conn):
+    """Migraciones pendientes y usuario CRM por defecto; idempotente y seguro entre procesos"""
+    if get_schema_version(conn) < MIGRATIONS[-1][0]:
+        run_migrations(conn)
+    create_default_crm_user(conn)
+
+# CONSULTAS FRECUENTES: ninguna debe recorrer la tabla completa ni ordenar en memoria
+HOT_QUERIES = {
+    'propiedades_activas': ('''
+        SELECT p.*, pr.nombre as propietario_nombre
+        FROM propiedades p
+        LEFT JOIN propietarios pr ON p.propietario_id = pr.id
+        WHERE p.activo = 1
+        ORDER BY p.fecha_creacion DESC
+    ''', ()),
+    'propiedad_por_id': ('''
+        SELECT p.*, pr.nombre as propietario_nombre
+        FROM propiedades p
+        LEFT JOIN propietarios pr ON p.propietario_id = pr.id
+        WHERE p.id = ? AND p.activo = 1
+    ''', (1,)),
+    'propiedades_por_propietario': ('''
+        SELECT * FROM propiedades
+        WHERE propietario_id = ? AND activo = 1
+        ORDER BY fecha_creacion DESC
+    ''', (1,)),
+    'propietarios_activos': ('SELECT * FROM propietarios WHERE activo = 1 ORDER BY nombre', ()),
+    'propietario_por_id': ('SELECT * FROM propietarios WHERE id = ? AND activo = 1', (1,)),
+    'propietario_con_propiedades': ('''
+        SELECT pr.nombre AS propietario_nombre, p.*
+        FROM propietarios pr
+        LEFT JOIN propiedades p ON p.propietario_id = pr.id AND p.activo = 1
+        WHERE pr.id = ? AND pr.activo = 1
+        ORDER BY p.fecha_creacion DESC
+    ''', (1,)),
+    'prospects_recientes': ('SELECT * FROM prospects ORDER BY fecha DESC, id DESC LIMIT 51', ()),
+    'prospects_por_fuente': ('''
+        SELECT * FROM prospects
+        WHERE fuente = ? AND (fecha, id) < (?, ?)
+        ORDER BY fecha DESC, id DESC LIMIT 51
+    ''', ('landing', '2024-01-01 00:00:00', 10)),
+    'prospects_por_propiedad': ('''
+        SELECT * FROM prospects
+        WHERE propiedad_id = ?
+        ORDER BY fecha DESC, id DESC LIMIT 51
+    ''', (1,)),
+    'usuario_crm': ('SELECT * FROM usuarios_crm WHERE username = ? AND activo = 1', ('admin',)),
+    'usuario_crm_por_id': ('SELECT password_hash FROM usuarios_crm WHERE id = ? AND activo = 1', (1,)),
+    'metricas_top_propiedades': ('''
+        SELECT p.id, p.titulo_es, p.titulo_en, m.prospectos
+        FROM metricas_propiedades m
+        JOIN propiedades p ON p.id = m.propiedad_id
+        WHERE p.activo = 1 AND m.prospectos > 0
+        ORDER BY m.prospectos DESC
+        LIMIT 10
+    ''', ()),
+    'metricas_top_propietarios': ('''
+        SELECT pr.id, pr.nombre, m.propiedades, m.prospectos
+        FROM metricas_propietarios m
+        JOIN propietarios pr ON pr.id = m.propietario_id
+        WHERE pr.activo = 1
+        ORDER BY m.prospectos DESC
+        LIMIT 10
+    ''', ()),
+}
+
+def check_query_plans(conn):
+    """Retorna (consulta, detalle) de cada paso de EXPLAIN QUERY PLAN que hace SCAN o sort temporal"""
+    problemas = []
+    for nombre, (sql, params) in HOT_QUERIES.items():
+        detalles = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        busca_por_indice = any(d.startswith('SEARCH') for d in detalles)
+        for detalle in detalles:
+            # "SCAN x USING INDEX" recorre un índice parcial ya ordenado y "SCAN x
+            # VIRTUAL TABLE" es una consulta al índice FTS; se rechaza el recorrido
+            # de la tabla, y el ORDER BY en B-tree temporal salvo que ordene solo
+            # el subconjunto acotado por una búsqueda en índice
+            if detalle.startswith('SCAN') and ' USING ' not in detalle and 'VIRTUAL TABLE' not in detalle:
+                problemas.append((nombre, detalle))
+            elif 'TEMP B-TREE' in detalle and not busca_por_indice:
+                problemas.append((nombre, detalle))
+    return problemas
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Falla si alguna consulta frecuente hace un SCAN completo de tabla"""
+    run_migrations(get_db())
+    problemas = check_query_plans(get_db())
+    for nombre, detalle in problemas:
+        click.echo(f"❌ {nombre}: {detalle}")
+    if problemas:
+        sys.exit(1)
+    click.echo(f"✅ {len(HOT_QUERIES)} consultas frecuentes usan índices")
+
+def create_default_crm_user(conn):
     """Crea usuario por defecto si no existe"""
     try:
-        conn = sqlite3.connect(get_db_path())
         cursor = conn.cursor()
         
-        cursor.execute("SELECT COUNT(*) FROM usuarios_crm")
-        count = cursor.fetchone()[0]
+        cursor.execute("SELECT 1 FROM usuarios_crm LIMIT 1")
         
-        if count == 0:
+        if cursor.fetchone() is None:
+            # INSERT ... WHERE NOT EXISTS: dos procesos que arrancan a la vez no duplican al usuario
             cursor.execute('''
                 INSERT INTO usuarios_crm (username, password_hash, nombre, fecha_registro)
-                VALUES (?, ?, ?, ?)
+                SELECT ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM usuarios_crm)
             ''', (
                 'admin',
-                'admin123',
+                generate_password_hash('admin123', app.config['PASSWORD_HASH_METHOD']),
                 'Administrador Principal',
                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             ))
             conn.commit()
-            print("✅ Usuario CRM por defecto creado: admin/admin123")
+            if cursor.rowcount:
+                print("✅ Usuario CRM por defecto creado: admin/admin123")
         
-        conn.close()
     except Exception as e:
         print(f"❌ Error creando usuario por defecto: {e}")
 
+# SESIONES EN EL SERVIDOR
+class ServerSession(CallbackDict, SessionMixin):
+    """Datos de sesión guardados en el servidor; la cookie solo lleva el id"""
+
+    def __init__(self, datos=None, sid=None, expira=0.0):
+        def on_update(sesion):
+            sesion.modified = True
+            sesion.accessed = True
+        super().__init__(datos, on_update)
+        self.sid = sid
+        self.expira = expira
+        self.sid_anterior = None
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, clave):
+        self.accessed = True
+        return super().__getitem__(clave)
+
+    def get(self, clave, default=None):
+        self.accessed = True
+        return super().get(clave, default)
+
+    def setdefault(self, clave, default=None):
+        self.accessed = True
+        return super().setdefault(clave, default)
+
+    def __setitem__(self, clave, valor):
+        # Reasignar el mismo valor (p. ej. el idioma en cada listado) no obliga a guardar
+        self.accessed = True
+        if dict.__contains__(self, clave) and dict.__getitem__(self, clave) == valor:
+            return
+        super().__setitem__(clave, valor)
+
+    def regenerate(self):
+        """Cambia el id conservando los datos; el id anterior se borra al guardar"""
+        if self.sid:
+            self.sid_anterior = self.sid
+        self.sid = None
+        self.modified = True
+
+class SessionStore:
+    """Sesiones en un archivo SQLite compartido por los workers, con barrido periódico de vencidas"""
+
+    def __init__(self, path, sweep_seconds):
+        self.path = path
+        self.sweep_seconds = sweep_seconds
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+        self._ultimo_barrido = 0.0
+        self._stats = {'lecturas': 0, 'escrituras': 0, 'renovaciones': 0, 'eliminadas': 0, 'barridas': 0}
+
+    def _db(self):
+        # Una conexión por proceso, protegida por self._lock
+        if self._conn is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode = WAL')
+            self._conn.execute('PRAGMA synchronous = NORMAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS sesiones (
+                    id TEXT PRIMARY KEY,
+                    datos TEXT NOT NULL,
+                    expira REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_sesiones_expira ON sesiones (expira)')
+        return self._conn
+
+    def load(self, sid):
+        """Retorna (datos, expira) de una sesión vigente o None"""
+        with self._lock:
+            self._stats['lecturas'] += 1
+            return self._db().execute(
+                'SELECT datos, expira FROM sesiones WHERE id = ? AND expira > ?', (sid, time.time())
+            ).fetchone()
+
+    def save(self, sid, datos, expira):
+        with self._lock:
+            self._stats['escrituras'] += 1
+            self._db().execute(
+                'INSERT OR REPLACE INTO sesiones (id, datos, expira) VALUES (?, ?, ?)', (sid, datos, expira)
+            )
+
+    def touch(self, sid, expira):
+        with self._lock:
+            self._stats['renovaciones'] += 1
+            self._db().execute('UPDATE sesiones SET expira = ? WHERE id = ?', (expira, sid))
+
+    def delete(self, sid):
+        with self._lock:
+            self._stats['eliminadas'] += 1
+            self._db().execute('DELETE FROM sesiones WHERE id = ?', (sid,))
+
+    def sweep(self, forzar=False):
+        """Borra las sesiones vencidas como mucho una vez cada sweep_seconds por worker"""
+        ahora = time.time()
+        if not forzar and ahora - self._ultimo_barrido < self.sweep_seconds:
+            return 0
+        with self._lock:
+            self._ultimo_barrido = ahora
+            borradas = self._db().execute('DELETE FROM sesiones WHERE expira <= ?', (ahora,)).rowcount
+            self._stats['barridas'] += borradas
+            return borradas
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+def get_session_store():
+    store = app.extensions.get('session_store')
+    if store is None:
+        store = SessionStore(app.config['SESSION_DB_PATH'], app.config['SESSION_SWEEP_SECONDS'])
+        app.extensions['session_store'] = store
+    return store
+
+class ServerSessionInterface(SessionInterface):
+    """Sesión en el servidor: solo se escribe si cambió y solo se envía Set-Cookie si cambió el id"""
+
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSession
+    sid_pattern = re.compile(r'^[A-Za-z0-9_-]{43}$')  # secrets.token_urlsafe(32)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and self.sid_pattern.match(sid):
+            fila = get_session_store().load(sid)
+            if fila:
+                return self.session_class(self.serializer.loads(fila[0]), sid, fila[1])
+        return self._nueva(sid)
+
+    def _nueva(self, sid):
+        sesion = self.session_class()
+        # Cookie con un id vencido o inválido: se borra del navegador si la sesión sigue vacía
+        sesion.sid_anterior = sid
+        return sesion
+
+    def save_session(self, app, session, response):
+        store = get_session_store()
+        store.sweep()
+        nombre = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        ruta = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.sid_anterior and session.sid_anterior != session.sid and self.sid_pattern.match(session.sid_anterior):
+            store.delete(session.sid_anterior)
+
+        if not session:
+            # Sesión vacía: no se guarda nada y el visitante anónimo no recibe cookie
+            if session.sid:
+                store.delete(session.sid)
+            if session.sid or session.sid_anterior:
+                response.delete_cookie(nombre, domain=dominio, path=ruta, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        ahora = time.time()
+        vida = app.permanent_session_lifetime.total_seconds()
+        enviar_cookie = False
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+            enviar_cookie = True
+        if session.modified or enviar_cookie:
+            store.save(session.sid, self.serializer.dumps(dict(session)), ahora + vida)
+        elif session.expira - ahora < vida / 2:
+            # Vencimiento deslizante sin reescribir la sesión en cada petición
+            store.touch(session.sid, ahora + vida)
+            enviar_cookie = session.permanent
+        if enviar_cookie:
+            response.set_cookie(nombre, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=httponly, domain=dominio, path=ruta, secure=secure, samesite=samesite)
+            response.vary.add('Cookie')
+
+def rotate_session():
+    """Nuevo id de sesión al autenticarse (evita fijación de sesión); la cookie firmada no lo necesita"""
+    regenerar = getattr(session, 'regenerate', None)
+    if regenerar:
+        regenerar()
+
+@app.cli.command('sweep-sessions')
+def sweep_sessions_command():
+    """Borra del almacén las sesiones vencidas"""
+    click.echo(f"✅ {get_session_store().sweep(forzar=True)} sesiones vencidas eliminadas")
+
+# CACHÉ DE PÁGINAS
+class PageCache:
+    """Caché de páginas renderizadas: LRU en memoria por worker + almacén SQLite compartido"""
+
+    def __init__(self, path, memory_bytes, disk_bytes):
+        self.path = path
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+        self._lru = OrderedDict()  # clave -> (etiqueta, version, cuerpo)
+        self._bytes = 0
+        self._stats = {'hits_memoria': 0, 'hits_disco': 0, 'misses': 0, 'desalojos': 0, 'invalidaciones': 0,
+                       'descartadas': 0}
+
+    def _db(self):
+        # Una conexión por proceso, protegida por self._lock
+        if self._conn is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lru.clear()
+            self._bytes = 0
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode = WAL')
+            self._conn.execute('PRAGMA synchronous = OFF')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS etiquetas (
+                    etiqueta TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            ''')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS entradas (
+                    clave TEXT PRIMARY KEY,
+                    etiqueta TEXT NOT NULL,
+                    cuerpo BLOB NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    ultimo_uso REAL NOT NULL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_entradas_etiqueta ON entradas (etiqueta)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_entradas_uso ON entradas (ultimo_uso)')
+            # Total de bytes del almacén mantenido por triggers: set() no suma toda la tabla
+            # bajo el bloqueo de escritura en cada página guardada
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS total (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        bytes INTEGER NOT NULL
+                    )
+                ''')
+                # Un almacén creado antes de la tabla arranca con la suma actual, una sola vez
+                self._conn.execute('INSERT OR IGNORE INTO total (id, bytes) SELECT 1, COALESCE(SUM(bytes), 0) FROM entradas')
+                self._conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS entradas_total_insert AFTER INSERT ON entradas BEGIN
+                        UPDATE total SET bytes = bytes + new.bytes WHERE id = 1;
+                    END
+                ''')
+                self._conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS entradas_total_update AFTER UPDATE OF bytes ON entradas BEGIN
+                        UPDATE total SET bytes = bytes - old.bytes + new.bytes WHERE id = 1;
+                    END
+                ''')
+                self._conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS entradas_total_delete AFTER DELETE ON entradas BEGIN
+                        UPDATE total SET bytes = bytes - old.bytes WHERE id = 1;
+                    END
+                ''')
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return self._conn
+
+    def _version(self, etiqueta):
+        row = self._db().execute('SELECT version FROM etiquetas WHERE etiqueta = ?', (etiqueta,)).fetchone()
+        return row[0] if row else 0
+
+    def _remember(self, clave, etiqueta, version, cuerpo):
+        anterior = self._lru.pop(clave, None)
+        if anterior:
+            self._bytes -= len(anterior[2])
+        if len(cuerpo) > self.memory_bytes:
+            return
+        self._lru[clave] = (etiqueta, version, cuerpo)
+        self._bytes += len(cuerpo)
+        while self._bytes > self.memory_bytes:
+            _, (_, _, viejo) = self._lru.popitem(last=False)
+            self._bytes -= len(viejo)
+            self._stats['desalojos'] += 1
+
+    def get(self, clave, etiqueta):
+        """Retorna (cuerpo, origen, versión de la etiqueta) o (None, 'MISS', versión)"""
+        with self._lock:
+            version = self._version(etiqueta)
+            entrada = self._lru.get(clave)
+            if entrada and entrada[1] == version:
+                self._lru.move_to_end(clave)
+                self._stats['hits_memoria'] += 1
+                return entrada[2], 'HIT-MEMORIA', version
+
+            row = self._db().execute(
+                'SELECT cuerpo FROM entradas WHERE clave = ? AND etiqueta = ?', (clave, etiqueta)
+            ).fetchone()
+            if row:
+                self._db().execute('UPDATE entradas SET ultimo_uso = ? WHERE clave = ?', (time.time(), clave))
+                self._remember(clave, etiqueta, version, row[0])
+                self._stats['hits_disco'] += 1
+                return row[0], 'HIT-DISCO', version
+
+            self._stats['misses'] += 1
+            return None, 'MISS', version
+
+    def set(self, clave, etiqueta, cuerpo, version):
+        """Guarda la página si la etiqueta sigue en `version`, la leída antes de renderizar"""
+        with self._lock:
+            db = self._db()
+            # Verificación e inserción atómicas frente a invalidate() de otros workers
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                if self._version(etiqueta) != version:
+                    # Hubo una escritura durante el render: el HTML puede ser anterior a ella
+                    self._stats['descartadas'] += 1
+                    db.execute('ROLLBACK')
+                    return False
+                self._store(db, clave, etiqueta, cuerpo)
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+            self._remember(clave, etiqueta, version, cuerpo)
+            return True
+
+    def _store(self, db, clave, etiqueta, cuerpo):
+        # UPSERT en vez de INSERT OR REPLACE: el borrado implícito de REPLACE no dispara los triggers del total
+        db.execute('''
+            INSERT INTO entradas (clave, etiqueta, cuerpo, bytes, ultimo_uso) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (clave) DO UPDATE SET etiqueta = excluded.etiqueta, cuerpo = excluded.cuerpo,
+                                              bytes = excluded.bytes, ultimo_uso = excluded.ultimo_uso
+        ''', (clave, etiqueta, cuerpo, len(cuerpo), time.time()))
+        # Desalojo LRU del almacén compartido al superar el presupuesto
+        total = db.execute('SELECT bytes FROM total WHERE id = 1').fetchone()[0]
+        while total > self.disk_bytes:
+            row = db.execute('SELECT clave, bytes FROM entradas ORDER BY ultimo_uso LIMIT 1').fetchone()
+            if not row:
+                break
+            db.execute('DELETE FROM entradas WHERE clave = ?', (row[0],))
+            total -= row[1]
+            self._stats['desalojos'] += 1
+
+    def invalidate(self, *etiquetas):
+        """Invalida en todos los workers las páginas de las etiquetas indicadas"""
+        with self._lock:
+            db = self._db()
+            for etiqueta in etiquetas:
+                # Subir la versión invalida las copias en memoria de los demás workers
+                db.execute('''
+                    INSERT INTO etiquetas (etiqueta, version) VALUES (?, 1)
+                    ON CONFLICT (etiqueta) DO UPDATE SET version = version + 1
+                ''', (etiqueta,))
+                db.execute('DELETE FROM entradas WHERE etiqueta = ?', (etiqueta,))
+                for clave in [c for c, e in self._lru.items() if e[0] == etiqueta]:
+                    self._bytes -= len(self._lru.pop(clave)[2])
+                self._stats['invalidaciones'] += 1
+
+    def stats(self):
+        with self._lock:
+            bytes_disco = self._db().execute('SELECT bytes FROM total WHERE id = 1').fetchone()[0]
+            return dict(self._stats, entradas_memoria=len(self._lru), bytes_memoria=self._bytes, bytes_disco=bytes_disco)
+
+def get_page_cache():
+    cache = app.extensions.get('page_cache')
+    if cache is None:
+        cache = PageCache(
+            app.config['PAGE_CACHE_PATH'],
+            app.config['PAGE_CACHE_MEMORY_BYTES'],
+            app.config['PAGE_CACHE_DISK_BYTES'],
+        )
+        app.extensions['page_cache'] = cache
+    return cache
+
+def templates_fingerprint():
+    """Huella de app.py y las plantillas: un despliegue nuevo no reutiliza páginas viejas"""
+    mtimes = [os.path.getmtime(__file__)]
+    for raiz, _, archivos in os.walk(app.template_folder and os.path.join(app.root_path, app.template_folder)):
+        mtimes.extend(os.path.getmtime(os.path.join(raiz, nombre)) for nombre in archivos)
+    return format(int(max(mtimes)), 'x')
+
+def page_cache_key(language):
+    """Clave de caché: versión + ruta + argumentos ordenados + idioma"""
+    args = sorted(request.args.items(multi=True))
+    return f"{app.config['PAGE_CACHE_VERSION']}:{request.path}?{urlencode(args)}#{language}"
+
+def page_cache_enabled():
+    # Los usuarios del CRM siempre ven la página recién renderizada
+    return app.config['PAGE_CACHE_ENABLED'] and not session.get('crm_logged_in')
+
+def cached_page(clave, etiqueta):
+    """Busca una página en caché; retorna una respuesta o None"""
+    if not page_cache_enabled():
+        return None
+    cuerpo, origen, version = get_page_cache().get(clave, etiqueta)
+    if cuerpo is None:
+        # Versión vista antes de consultar y renderizar; cache_page la compara al guardar
+        g.page_cache_version = (clave, etiqueta, version)
+        return None
+    return Response(cuerpo, mimetype='text/html', headers={'X-Cache': origen})
+
+def cache_page(clave, etiqueta, html):
+    """Guarda el HTML renderizado y lo devuelve como respuesta"""
+    if not page_cache_enabled():
+        return Response(html, mimetype='text/html', headers={'X-Cache': 'BYPASS'})
+    leida = g.pop('page_cache_version', None)
+    if leida is None or leida[:2] != (clave, etiqueta):
+        return Response(html, mimetype='text/html', headers={'X-Cache': 'BYPASS'})
+    get_page_cache().set(clave, etiqueta, html.encode('utf-8'), leida[2])
+    return Response(html, mimetype='text/html', headers={'X-Cache': 'MISS'})
+
+def invalidate_propiedades(*propiedad_ids):
+    """Invalida el listado y las landings de las propiedades modificadas"""
+    try:
+        get_page_cache().invalidate('listado', *[f'propiedad:{pid}' for pid in propiedad_ids])
+    except Exception as e:
+        print(f"Error invalidando caché de páginas: {e}")
+
+# COLA DE TRABAJOS EN SEGUNDO PLANO
+# tipo -> (función ejecutada en el proceso hijo, función que guarda el resultado)
+JOB_HANDLERS = {}
+
+def job_handler(tipo, on_result):
+    """Registra la función que ejecuta los trabajos de un tipo en el pool de procesos"""
+    def decorator(func):
+        JOB_HANDLERS[tipo] = (func, on_result)
+        return func
+    return decorator
+
+def enqueue_job(tipo, payload):
+    """Encola un trabajo y despierta al despachador; retorna su id"""
+    try:
+        ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = get_db()
+        cursor = conn.execute('''
+            INSERT INTO trabajos (tipo, payload, estado, fecha_creacion, fecha_actualizacion)
+            VALUES (?, ?, 'pendiente', ?, ?)
+        ''', (tipo, json.dumps(payload), ahora, ahora))
+        conn.commit()
+        trabajo_id = cursor.lastrowid
+    except Exception as e:
+        print(f"Error encolando trabajo: {e}")
+        return None
+
+    if app.config['JOB_WORKERS'] <= 0:
+        # Sin pool de procesos: se ejecuta en la misma petición
+        run_job_inline(trabajo_id)
+    else:
+        get_dispatcher().start()
+        get_dispatcher().wake()
+    return trabajo_id
+
+def claim_job(conn):
+    """Marca como 'procesando' el pendiente más antiguo; retorna (id, tipo, payload) o None"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute(
+            "SELECT id, tipo, payload FROM trabajos WHERE estado = 'pendiente' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if row:
+            conn.execute('''
+                UPDATE trabajos SET estado = 'procesando', intentos = intentos + 1, fecha_actualizacion = ?
+                WHERE id = ?
+            ''', (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), row[0]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return (row[0], row[1], json.loads(row[2])) if row else None
+
+def finish_job(conn, trabajo_id, resultado=None, error=None):
+    conn.execute('''
+        UPDATE trabajos SET estado = ?, resultado = ?, error = ?, fecha_actualizacion = ?
+        WHERE id = ?
+    ''', (
+        'error' if error else 'completado',
+        json.dumps(resultado) if resultado is not None else None,
+        error,
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        trabajo_id
+    ))
+    conn.commit()
+
+def requeue_stale_jobs(conn):
+    """Devuelve a la cola los trabajos de workers caídos; agota los que superan los intentos"""
+    limite = datetime.fromtimestamp(time.time() - app.config['JOB_TIMEOUT']).strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute('''
+        UPDATE trabajos
+        SET estado = CASE WHEN intentos >= ? THEN 'error' ELSE 'pendiente' END,
+            error = CASE WHEN intentos >= ? THEN 'Tiempo agotado' ELSE error END
+        WHERE estado = 'procesando' AND fecha_actualizacion < ?
+    ''', (app.config['JOB_MAX_ATTEMPTS'], app.config['JOB_MAX_ATTEMPTS'], limite))
+    conn.commit()
+
+def get_jobs(ids):
+    """Estado de los trabajos indicados"""
+    if not ids:
+        return []
+    try:
+        marcas = ', '.join('?' for _ in ids)
+        rows = get_db().execute(
+            f'SELECT id, tipo, payload, estado, intentos, error FROM trabajos WHERE id IN ({marcas})', ids
+        ).fetchall()
+        return [{
+            'id': row['id'],
+            'tipo': row['tipo'],
+            'payload': json.loads(row['payload']),
+            'estado': row['estado'],
+            'intentos': row['intentos'],
+            'error': row['error']
+        } for row in rows]
+    except Exception as e:
+        print(f"Error obteniendo trabajos: {e}")
+        return []
+
+def _complete_job(conn, trabajo_id, tipo, payload, resultado=None, error=None):
+    if error is None:
+        try:
+            JOB_HANDLERS[tipo][1](payload, resultado)
+        except Exception as e:
+            error = f"Error guardando resultado: {e}"
+    finish_job(conn, trabajo_id, resultado=resultado, error=error)
+    if error:
+        print(f"⚠️ Trabajo {trabajo_id} ({tipo}) falló: {error}")
+
+def run_job_inline(trabajo_id):
+    conn = get_db()
+    trabajo = claim_job(conn)
+    while trabajo:
+        trabajo_actual, tipo, payload = trabajo
+        try:
+            resultado = JOB_HANDLERS[tipo][0](payload)
+            _complete_job(conn, trabajo_actual, tipo, payload, resultado)
+        except Exception as e:
+            _complete_job(conn, trabajo_actual, tipo, payload, error=str(e))
+        if trabajo_actual == trabajo_id:
+            break
+        trabajo = claim_job(conn)
+
+class JobDispatcher:
+    """Hilo por worker que reclama trabajos de SQLite y los ejecuta en un pool de procesos"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._thread = None
+        self._executor = None
+        self._stopping = False
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            # spawn: no se hereda el estado de los hilos del worker de gunicorn
+            self._pid = os.getpid()
+            self._stopping = False
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+            self._thread = threading.Thread(target=self._run, name='job-dispatcher', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def shutdown(self, wait=True):
+        self._stopping = True
+        self._wake.set()
+        if self._thread and self._pid == os.getpid():
+            self._thread.join(timeout=30 if wait else 0)
+
+    def _run(self):
+        en_curso = {}  # future -> (id, tipo, payload)
+        ultima_revision = 0.0
+        with app.app_context():
+            conn = get_db()
+            while not self._stopping or en_curso:
+                try:
+                    if time.time() - ultima_revision > 30:
+                        requeue_stale_jobs(conn)
+                        ultima_revision = time.time()
+
+                    while not self._stopping and len(en_curso) < self.workers:
+                        trabajo = claim_job(conn)
+                        if not trabajo:
+                            break
+                        trabajo_id, tipo, payload = trabajo
+                        if tipo not in JOB_HANDLERS:
+                            finish_job(conn, trabajo_id, error=f"Tipo de trabajo desconocido: {tipo}")
+                            continue
+                        en_curso[self._executor.submit(JOB_HANDLERS[tipo][0], payload)] = trabajo
+
+                    if en_curso:
+                        listos, _ = wait(list(en_curso), timeout=0.5, return_when=FIRST_COMPLETED)
+                        for future in listos:
+                            trabajo_id, tipo, payload = en_curso.pop(future)
+                            try:
+                                _complete_job(conn, trabajo_id, tipo, payload, future.result())
+                            except Exception as e:
+                                _complete_job(conn, trabajo_id, tipo, payload, error=str(e))
+                    else:
+                        self._wake.wait(timeout=2)
+                        self._wake.clear()
+                except Exception as e:
+                    print(f"❌ Error en el despachador de trabajos: {e}")
+                    time.sleep(1)
+        self._executor.shutdown(wait=True)
+
+def get_dispatcher():
+    dispatcher = app.extensions.get('job_dispatcher')
+    if dispatcher is None:
+        dispatcher = JobDispatcher(max(app.config['JOB_WORKERS'], 1))
+        app.extensions['job_dispatcher'] = dispatcher
+    return dispatcher
+
+def _image_job_result(payload, variantes):
+    if not variantes:
+        return
+    save_image_variantes(payload['ruta'], variantes)
+    # Las páginas ya cacheadas con la imagen original deben volver a renderizarse
+    conn = get_db()
+    ids = [row[0] for row in conn.execute(
+        'SELECT id FROM propiedades WHERE instr(imagenes, ?) > 0', (json.dumps(payload['ruta']),)
+    )]
+    if ids:
+        # El HTML cambia aunque la propiedad no: se sube su revisión (y la del catálogo, por trigger)
+        # para que el ETag y Last-Modified cambien y los navegadores no sigan recibiendo 304
+        conn.execute(
+            f"UPDATE propiedades SET revision = revision + 1, fecha_actualizacion = ? "
+            f"WHERE id IN ({', '.join('?' * len(ids))})",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), *ids)
+        )
+        conn.commit()
+        invalidate_propiedades(*ids)
+
+@job_handler('imagen', _image_job_result)
+def process_image_job(payload):
+    """Se ejecuta en un proceso del pool: genera las variantes de una imagen subida"""
+    return process_image(payload['ruta'], payload.get('static_folder'))
+
+@app.cli.command('run-jobs')
+def run_jobs_command():
+    """Procesa la cola de trabajos en primer plano (proceso dedicado)"""
+    dispatcher = get_dispatcher()
+    dispatcher.start()
+    click.echo(f"✅ Despachador de trabajos iniciado con {dispatcher.workers} proceso(s)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        dispatcher.shutdown()
+
+# PETICIONES CONDICIONALES (ETag / Last-Modified)
+def http_date(fecha):
+    """Convierte una fecha local "YYYY-mm-dd HH:MM:SS" de la BD a datetime UTC"""
+    return datetime.strptime(fecha, "%Y-%m-%d %H:%M:%S").astimezone(timezone.utc)
+
+def get_catalog_revision():
+    """Revisión global del catálogo (mantenida por triggers); (revision, fecha) o None"""
+    try:
+        row = get_db().execute(
+            "SELECT revision, fecha_actualizacion FROM revisiones WHERE nombre = 'propiedades'"
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+    except Exception as e:
+        print(f"Error obteniendo revisión del catálogo: {e}")
+        return None
+
+def get_propiedad_revision(propiedad_id):
+    """Revisión de una propiedad activa; (revision, fecha) o None"""
+    try:
+        row = get_db().execute(
+            'SELECT revision, fecha_actualizacion FROM propiedades WHERE id = ? AND activo = 1',
+            (propiedad_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+    except Exception as e:
+        print(f"Error obteniendo revisión de propiedad: {e}")
+        return None
+
+def page_validators(revision, language):
+    """ETag fuerte y Last-Modified de una página pública para esta revisión e idioma"""
+    numero, fecha = revision
+    huella = hashlib.sha1(f"{page_cache_key(language)}|{numero}".encode('utf-8')).hexdigest()[:20]
+    return huella, http_date(fecha)
+
+def not_modified(etag, last_modified):
+    """Retorna una respuesta 304 si el cliente ya tiene esta versión, o None"""
+    if request.if_none_match:
+        # If-None-Match tiene prioridad sobre If-Modified-Since
+        if not request.if_none_match.contains_weak(etag):
+            return None
+    elif not request.if_modified_since or last_modified > request.if_modified_since:
+        return None
+    respuesta = Response(status=304)
+    return with_validators(respuesta, etag, last_modified)
+
+def with_validators(respuesta, etag, last_modified):
+    respuesta.set_etag(etag)
+    respuesta.last_modified = last_modified
+    # El idioma viaja en la cookie de sesión
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    respuesta.vary.add('Cookie')
+    return respuesta
+
 # FUNCIONES DE BASE DE DATOS
+# Diccionario de traducciones de tipos de propiedad
+TIPO_TRANSLATIONS = {
+    'terreno': {'es': 'Terreno', 'en': 'Land'},
+    'casa': {'es': 'Casa', 'en': 'House'},
+    'apartamento': {'es': 'Apartamento', 'en': 'Apartment'},
+    'local': {'es': 'Local Comercial', 'en': 'Commercial premises'},
+    'oficina': {'es': 'Oficina', 'en': 'Office'},
+}
+
+# Monedas reconocidas en el texto del precio; el orden importa ("US$" antes que "$")
+MONEDAS = [
+    ('GTQ', 'GTQ'), ('USD', 'USD'), ('EUR', 'EUR'),
+    ('US$', 'USD'), ('Q', 'GTQ'), ('$', 'USD'), ('€', 'EUR'),
+]
+MONEDA_POR_DEFECTO = 'GTQ'
+# precio_num es un INTEGER de SQLite (64 bits con signo); montos fuera de rango no se guardan
+PRECIO_MAXIMO = 2 ** 63 - 1
+
+# Quetzales por unidad de cada moneda, para traducir los rangos del filtro
+TIPOS_DE_CAMBIO = {
+    'GTQ': 1.0,
+    'USD': float(os.environ.get('TIPO_CAMBIO_USD', 7.8)),
+    'EUR': float(os.environ.get('TIPO_CAMBIO_EUR', 8.4)),
+}
+
+def parse_price(raw_price):
+    """Convierte un precio en texto ("Q150,000", "€150.000", "$ 90000") a (monto entero, código de moneda)"""
+    if not raw_price:
+        return None, None
+    clean = str(raw_price).upper().replace(" ", "").strip()
+
+    moneda = MONEDA_POR_DEFECTO
+    for simbolo, codigo in MONEDAS:
+        if simbolo in clean:
+            moneda = codigo
+            clean = clean.replace(simbolo, "")
+            break
+
+    # Un separador seguido de exactamente tres dígitos finales es de miles ("€150.000", "1,500.000");
+    # si no, el último separador es el decimal ("1,500.50", "1.500,50") y los demás son de miles
+    partes = re.split(r'[.,]', clean)
+    if len(partes) > 1 and len(partes[-1]) != 3:
+        clean = ''.join(partes[:-1]) + '.' + partes[-1]
+    else:
+        clean = ''.join(partes)
+    try:
+        monto = float(clean)
+    except ValueError:
+        return None, None
+    # "inf", "nan" o "1e400" no son montos, y "1e30" no cabe en la columna
+    if not math.isfinite(monto) or abs(monto) >= PRECIO_MAXIMO:
+        return None, None
+    return int(monto), moneda
+
+# MODELOS DE FILAS
+def row_slots(columnas, renombres=None):
+    """Atributos de un modelo para sus COLUMNAS (con RENOMBRES aplicados), en el mismo orden"""
+    renombres = renombres or {}
+    return tuple(renombres.get(c, c) for c in columnas)
+
+class RowModel:
+    """Fila de la BD con atributos fijos (__slots__) y acceso tipo dict (p['id'], p.get(...))"""
+    __slots__ = ()
+    COLUMNAS = ()  # única fuente del mapeo columna -> atributo
+    RENOMBRES = {}  # columnas guardadas bajo otro atributo
+    OPCIONALES = {}  # columnas que no todas las consultas traen, con su valor por defecto
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._lectores = {}
+        cls._atributos = row_slots(cls.COLUMNAS, cls.RENOMBRES)
+
+    def __init__(self, valores):
+        """valores: los de COLUMNAS en orden, como los entrega _lector()"""
+        for atributo, valor in zip(self._atributos, valores):
+            setattr(self, atributo, valor)
+
+    @classmethod
+    def _lector(cls, columnas, prefijo=''):
+        """Extrae por posición los valores de COLUMNAS; las posiciones se resuelven por nombre"""
+        lector = cls._lectores.get((columnas, prefijo))
+        if lector is None:
+            # prefijo: columnas con alias (pr_id, pr_nombre...) en consultas con JOIN
+            indices = {nombre[len(prefijo):]: i for i, nombre in enumerate(columnas) if nombre.startswith(prefijo)}
+            faltantes = [c for c in cls.COLUMNAS if c not in indices]
+            if any(c not in cls.OPCIONALES for c in faltantes):
+                raise KeyError(f"Columnas faltantes para {cls.__name__}: {faltantes}")
+            if faltantes:
+                # Las opcionales van al final de COLUMNAS
+                defaults = tuple(cls.OPCIONALES[c] for c in faltantes)
+                leer = operator.itemgetter(*[indices[c] for c in cls.COLUMNAS if c in indices])
+                lector = lambda row: leer(row) + defaults
+            else:
+                lector = operator.itemgetter(*[indices[c] for c in cls.COLUMNAS])
+            cls._lectores[(columnas, prefijo)] = lector
+        return lector
+
+    @classmethod
+    def from_rows(cls, rows, prefijo=''):
+        if not rows:
+            return []
+        leer = cls._lector(tuple(rows[0].keys()), prefijo)
+        return [cls(leer(row)) for row in rows]
+
+    @classmethod
+    def from_row(cls, row, prefijo=''):
+        return cls(cls._lector(tuple(row.keys()), prefijo)(row))
+
+    def keys(self):
+        return self.COLUMNAS
+
+    def __getitem__(self, clave):
+        try:
+            return getattr(self, clave)
+        except AttributeError:
+            raise KeyError(clave) from None
+
+    def __setitem__(self, clave, valor):
+        setattr(self, clave, valor)
+
+    def __contains__(self, clave):
+        return hasattr(self, clave)
+
+    def get(self, clave, default=None):
+        return getattr(self, clave, default)
+
+    def to_dict(self):
+        return {clave: self[clave] for clave in self.keys()}
+
+    def __repr__(self):
+        return f"{type(self).__name__}(id={self.get('id')!r})"
+
+class Propietario(RowModel):
+    COLUMNAS = ('id', 'nombre', 'email', 'telefono', 'fecha_registro')
+    __slots__ = COLUMNAS
+
+class Prospect(RowModel):
+    COLUMNAS = ('id', 'nombre', 'email', 'telefono', 'fuente', 'fecha', 'propiedad', 'propiedad_id', 'idioma')
+    __slots__ = COLUMNAS
+
+class Propiedad(RowModel):
+    """Propiedad con imagenes decodificadas solo al usarse y, opcionalmente, sus variantes"""
+    COLUMNAS = (
+        'id', 'propietario_id', 'titulo_es', 'descripcion_es', 'titulo_en', 'descripcion_en',
+        'precio', 'precio_num', 'precio_moneda', 'ubicacion', 'tipo', 'tipo_es', 'tipo_en', 'estado',
+        'imagenes', 'whatsapp', 'fecha_creacion', 'activo', 'propietario_nombre'
+    )
+    RENOMBRES = {'imagenes': '_imagenes_json', 'propietario_nombre': '_propietario_nombre'}
+    # Solo las consultas con JOIN a propietarios traen el nombre
+    OPCIONALES = {'propietario_nombre': ''}
+    __slots__ = row_slots(COLUMNAS, RENOMBRES) + ('_imagenes', 'variantes')
+
+    @property
+    def imagenes(self):
+        try:
+            return self._imagenes
+        except AttributeError:
+            pass
+        crudo = self._imagenes_json
+        try:
+            imagenes = json.loads(crudo) if crudo and crudo != '[]' else []
+        except json.JSONDecodeError:
+            print(f"⚠️ Error decodificando JSON de imágenes para propiedad {self.id}: {crudo}")
+            imagenes = []
+        self._imagenes = imagenes
+        return imagenes
+
+    @property
+    def propietario_nombre(self):
+        return self._propietario_nombre or ''
+
+    def keys(self):
+        return self.COLUMNAS + ('variantes',) if hasattr(self, 'variantes') else self.COLUMNAS
+
 def get_all_propietarios():
     """Obtiene todos los propietarios activos"""
     try:
-        conn = sqlite3.connect(get_db_path())
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM propietarios WHERE activo = 1 ORDER BY nombre')
-        rows = cursor.fetchall()
-        
-        propietarios = []
-        for row in rows:
-            propietarios.append({
-                'id': row[0],
-                'nombre': row[1],
-                'email': row[2],
-                'telefono': row[3],
-                'fecha_registro': row[4]
-            })
-        
-        conn.close()
-        return propietarios
+        conn = get_db()
+        rows = conn.execute('SELECT * FROM propietarios WHERE activo = 1 ORDER BY nombre').fetchall()
+        return Propietario.from_rows(rows)
     except Exception as e:
         print(f"Error obteniendo propietarios: {e}")
         return []
 
+def get_propietario_by_id(propietario_id):
+    """Obtiene un propietario activo por ID"""
+    try:
+        conn = get_db()
+        row = conn.execute(
+            'SELECT * FROM propietarios WHERE id = ? AND activo = 1', (propietario_id,)
+        ).fetchone()
+        return Propietario.from_row(row) if row else None
+    except Exception as e:
+        print(f"Error obteniendo propietario: {e}")
+        return None
+
+def get_propietario_con_propiedades(propietario_id):
+    """Obtiene un propietario y sus propiedades activas en una sola consulta; (None, []) si no existe"""
+    try:
+        conn = get_db()
+        rows = conn.execute('''
+            SELECT pr.id AS pr_id, pr.nombre AS pr_nombre, pr.email AS pr_email,
+                   pr.telefono AS pr_telefono, pr.fecha_registro AS pr_fecha_registro,
+                   pr.nombre AS propietario_nombre, p.*
+            FROM propietarios pr
+            LEFT JOIN propiedades p ON p.propietario_id = pr.id AND p.activo = 1
+            WHERE pr.id = ? AND pr.activo = 1
+            ORDER BY p.fecha_creacion DESC
+        ''', (propietario_id,)).fetchall()
+        if not rows:
+            return None, []
+        propietario = Propietario.from_row(rows[0], prefijo='pr_')
+        # Sin propiedades el LEFT JOIN deja una sola fila con las columnas de p en NULL
+        propiedades = Propiedad.from_rows(rows) if rows[0]['id'] is not None else []
+        return propietario, propiedades
+    except Exception as e:
+        print(f"Error obteniendo propietario con propiedades: {e}")
+        return None, []
+
 def get_all_propiedades():
     """Obtiene todas las propiedades activas"""
     try:
-        conn = sqlite3.connect(get_db_path())
-        cursor = conn.cursor()
-        cursor.execute('''
+        conn = get_db()
+        rows = conn.execute('''
             SELECT p.*, pr.nombre as propietario_nombre 
             FROM propiedades p 
             LEFT JOIN propietarios pr ON p.propietario_id = pr.id 
             WHERE p.activo = 1
             ORDER BY p.fecha_creacion DESC
-        ''')
-        rows = cursor.fetchall()
-        
-        propiedades = []
-        for row in rows:
-            # IMPORTANTE: El índice de 'imagenes' ha cambiado por las nuevas columnas
-            # Ahora imagenes está en la posición 12 (antes era 10)
-            imagenes_json = row[12] if len(row) > 12 else '[]'
-            try:
-                imagenes = json.loads(imagenes_json) if imagenes_json and imagenes_json != '[]' else []
-            except json.JSONDecodeError:
-                print(f"⚠️ Error decodificando JSON de imágenes para propiedad {row[0]}: {imagenes_json}")
-                imagenes = []
-            
-            propiedades.append({
-                'id': row[0],
-                'propietario_id': row[1],
-                'titulo_es': row[2],
-                'descripcion_es': row[3],
-                'titulo_en': row[4],
-                'descripcion_en': row[5],
-                'precio': row[6],
-                'ubicacion': row[7],
-                'tipo': row[8],          
-                'tipo_es': row[9],
-                'tipo_en': row[10],
-                'estado': row[11],
-                'imagenes': imagenes,
-                'whatsapp': row[13],
-                'fecha_creacion': row[14],
-                'propietario_nombre': row[16] if len(row) > 16 else ''
-            })
-        
-        conn.close()
-        return propiedades
+        ''').fetchall()
+        return Propiedad.from_rows(rows)
     except Exception as e:
         print(f"Error obteniendo propiedades: {e}")
         return []
@@ -262,48 +2497,14 @@ def get_all_propiedades():
 def get_propiedad_by_id(propiedad_id):
     """Obtiene una propiedad específica por ID"""
     try:
-        conn = sqlite3.connect(get_db_path())
-        cursor = conn.cursor()
-        cursor.execute('''
+        conn = get_db()
+        row = conn.execute('''
             SELECT p.*, pr.nombre as propietario_nombre 
             FROM propiedades p 
             LEFT JOIN propietarios pr ON p.propietario_id = pr.id 
             WHERE p.id = ? AND p.activo = 1
-        ''', (propiedad_id,))
-        
-        row = cursor.fetchone()
-        if not row:
-            return None
-            
-        # Índice ajustado para imagenes (posición 12)
-        imagenes_json = row[12] if len(row) > 12 else '[]'
-        try:
-            imagenes = json.loads(imagenes_json) if imagenes_json and imagenes_json != '[]' else []
-        except json.JSONDecodeError:
-            print(f"⚠️ Error decodificando JSON de imágenes: {imagenes_json}")
-            imagenes = []
-        
-        propiedad = {
-            'id': row[0],
-            'propietario_id': row[1],
-            'titulo_es': row[2],
-            'descripcion_es': row[3],
-            'titulo_en': row[4],
-            'descripcion_en': row[5],
-            'precio': row[6],
-            'ubicacion': row[7],
-            'tipo': row[8],
-            'tipo_es': row[9],
-            'tipo_en': row[10],
-            'estado': row[11],
-            'imagenes': imagenes,
-            'whatsapp': row[13],
-            'fecha_creacion': row[14],
-            'propietario_nombre': row[16] if len(row) > 16 else ''
-        }
-        
-        conn.close()
-        return propiedad
+        ''', (propiedad_id,)).fetchone()
+        return Propiedad.from_row(row) if row else None
     except Exception as e:
         print(f"Error obteniendo propiedad: {e}")
         return None
@@ -311,44 +2512,13 @@ def get_propiedad_by_id(propiedad_id):
 def get_propiedades_by_propietario(propietario_id):
     """Obtiene todas las propiedades de un propietario específico"""
     try:
-        conn = sqlite3.connect(get_db_path())
-        cursor = conn.cursor()
-        cursor.execute('''
+        conn = get_db()
+        rows = conn.execute('''
             SELECT * FROM propiedades 
             WHERE propietario_id = ? AND activo = 1
             ORDER BY fecha_creacion DESC
-        ''', (propietario_id,))
-        rows = cursor.fetchall()
-        
-        propiedades = []
-        for row in rows:
-            # Índice ajustado para imagenes (posición 12)
-            imagenes_json = row[12] if len(row) > 12 else '[]'
-            try:
-                imagenes = json.loads(imagenes_json) if imagenes_json and imagenes_json != '[]' else []
-            except json.JSONDecodeError:
-                imagenes = []
-            
-            propiedades.append({
-                'id': row[0],
-                'propietario_id': row[1],
-                'titulo_es': row[2],
-                'descripcion_es': row[3],
-                'titulo_en': row[4],
-                'descripcion_en': row[5],
-                'precio': row[6],
-                'ubicacion': row[7],
-                'tipo': row[8],
-                'tipo_es': row[9],
-                'tipo_en': row[10],
-                'estado': row[11],
-                'imagenes': imagenes,
-                'whatsapp': row[13],
-                'fecha_creacion': row[14]
-            })
-        
-        conn.close()
-        return propiedades
+        ''', (propietario_id,)).fetchall()
+        return Propiedad.from_rows(rows)
     except Exception as e:
         print(f"Error obteniendo propiedades del propietario: {e}")
         return []
@@ -356,7 +2526,7 @@ def get_propiedades_by_propietario(propietario_id):
 def save_propietario(propietario):
     """Guarda un nuevo propietario"""
     try:
-        conn = sqlite3.connect(get_db_path())
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO propietarios (nombre, email, telefono, fecha_registro)
@@ -369,7 +2539,6 @@ def save_propietario(propietario):
         ))
         propietario_id = cursor.lastrowid
         conn.commit()
-        conn.close()
         return propietario_id
     except Exception as e:
         print(f"Error guardando propietario: {e}")
@@ -378,27 +2547,20 @@ def save_propietario(propietario):
 def save_propiedad(propiedad):
     """Guarda una nueva propiedad con traducciones automáticas"""
     try:
-        # Diccionario de traducciones
-        tipo_translations = {
-            'terreno': {'es': 'Terreno', 'en': 'Land'},
-            'casa': {'es': 'Casa', 'en': 'House'},
-            'apartamento': {'es': 'Apartamento', 'en': 'Apartment'},
-            'local': {'es': 'Local Comercial', 'en': 'Commercial premises'},
-            'oficina': {'es': 'Oficina', 'en': 'Office'},
-        }
-        
         tipo_valor = propiedad.get('tipo', 'terreno')
         
         # Generar traducciones automáticamente
-        tipo_es = tipo_translations.get(tipo_valor, {}).get('es', tipo_valor.title())
-        tipo_en = tipo_translations.get(tipo_valor, {}).get('en', tipo_valor.title())
+        tipo_es = TIPO_TRANSLATIONS.get(tipo_valor, {}).get('es', tipo_valor.title())
+        tipo_en = TIPO_TRANSLATIONS.get(tipo_valor, {}).get('en', tipo_valor.title())
         
-        conn = sqlite3.connect(get_db_path())
+        ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('''
     INSERT INTO propiedades (propietario_id, titulo_es, descripcion_es, titulo_en, descripcion_en, 
-                           precio, ubicacion, tipo, tipo_es, tipo_en, estado, imagenes, whatsapp, fecha_creacion)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                           precio, precio_num, precio_moneda, ubicacion, tipo, tipo_es, tipo_en, estado, imagenes, whatsapp,
+                           fecha_creacion, fecha_actualizacion)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
 ''', (
             propiedad['propietario_id'],
             propiedad['titulo_es'],
@@ -406,6 +2568,7 @@ def save_propiedad(propiedad):
             propiedad['titulo_en'],
             propiedad.get('descripcion_en', ''),
             propiedad.get('precio', ''),
+            *parse_price(propiedad.get('precio', '')),
             propiedad.get('ubicacion', ''),
             tipo_valor,
             tipo_es,
@@ -413,11 +2576,13 @@ def save_propiedad(propiedad):
             propiedad.get('estado', 'disponible'),
             json.dumps(propiedad.get('imagenes', [])),
             propiedad.get('whatsapp', ''),
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            ahora,
+            ahora
         ))
         propiedad_id = cursor.lastrowid
+        update_image_refs(conn, [], propiedad.get('imagenes', []))
         conn.commit()
-        conn.close()
+        invalidate_propiedades(propiedad_id)
         return propiedad_id
     except Exception as e:
         print(f"Error guardando propiedad: {e}")
@@ -426,7 +2591,7 @@ def save_propiedad(propiedad):
 def update_propietario(propietario_id, datos):
     """Actualiza un propietario existente"""
     try:
-        conn = sqlite3.connect(get_db_path())
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('''
             UPDATE propietarios 
@@ -439,7 +2604,6 @@ def update_propietario(propietario_id, datos):
             propietario_id
         ))
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
         print(f"Error actualizando propietario: {e}")
@@ -448,28 +2612,23 @@ def update_propietario(propietario_id, datos):
 def update_propiedad(propiedad_id, datos):
     """Actualiza una propiedad existente con traducciones automáticas"""
     try:
-        # Diccionario de traducciones (mismo que en save_propiedad)
-        tipo_translations = {
-            'terreno': {'es': 'Terreno', 'en': 'Land'},
-            'casa': {'es': 'Casa', 'en': 'House'},
-            'apartamento': {'es': 'Apartamento', 'en': 'Apartment'},
-            'local': {'es': 'Local Comercial', 'en': 'Commercial premises'},
-            'oficina': {'es': 'Oficina', 'en': 'Office'},
-        }
-        
         tipo_valor = datos.get('tipo', 'terreno')
         
         # Generar traducciones automáticamente
-        tipo_es = tipo_translations.get(tipo_valor, {}).get('es', tipo_valor.title())
-        tipo_en = tipo_translations.get(tipo_valor, {}).get('en', tipo_valor.title())
+        tipo_es = TIPO_TRANSLATIONS.get(tipo_valor, {}).get('es', tipo_valor.title())
+        tipo_en = TIPO_TRANSLATIONS.get(tipo_valor, {}).get('en', tipo_valor.title())
         
-        conn = sqlite3.connect(get_db_path())
+        conn = get_db()
+        anterior = conn.execute(
+            'SELECT imagenes FROM propiedades WHERE id = ? AND activo = 1', (propiedad_id,)
+        ).fetchone()
         cursor = conn.cursor()
         cursor.execute('''
     UPDATE propiedades 
     SET titulo_es = ?, descripcion_es = ?, titulo_en = ?, descripcion_en = ?,
-        precio = ?, ubicacion = ?, tipo = ?, tipo_es = ?, tipo_en = ?, 
-        estado = ?, imagenes = ?, whatsapp = ?
+        precio = ?, precio_num = ?, precio_moneda = ?, ubicacion = ?, tipo = ?, tipo_es = ?, tipo_en = ?, 
+        estado = ?, imagenes = ?, whatsapp = ?,
+        revision = revision + 1, fecha_actualizacion = ?
     WHERE id = ? AND activo = 1
 ''', (
             datos['titulo_es'],
@@ -477,6 +2636,7 @@ def update_propiedad(propiedad_id, datos):
             datos['titulo_en'],
             datos.get('descripcion_en', ''),
             datos.get('precio', ''),
+            *parse_price(datos.get('precio', '')),
             datos.get('ubicacion', ''),
             tipo_valor,
             tipo_es,
@@ -484,10 +2644,13 @@ def update_propiedad(propiedad_id, datos):
             datos.get('estado', 'disponible'),
             json.dumps(datos.get('imagenes', [])),
             datos.get('whatsapp', ''),
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             propiedad_id
         ))
+        if anterior is not None:
+            update_image_refs(conn, json.loads(anterior['imagenes'] or '[]'), datos.get('imagenes', []))
         conn.commit()
-        conn.close()
+        invalidate_propiedades(propiedad_id)
         return True
     except Exception as e:
         print(f"Error actualizando propiedad: {e}")
@@ -495,102 +2658,1398 @@ def update_propiedad(propiedad_id, datos):
 
 def delete_propietario(propietario_id):
     try:
-        conn = get_db_connection()
+        conn = get_db()
+        rows = conn.execute(
+            "SELECT id, imagenes FROM propiedades WHERE propietario_id = ?", (propietario_id,)
+        ).fetchall()
+        propiedad_ids = [row[0] for row in rows]
         # Borra propiedades primero
         conn.execute("DELETE FROM propiedades WHERE propietario_id = ?", (propietario_id,))
+        update_image_refs(conn, [r for row in rows for r in json.loads(row['imagenes'] or '[]')], [])
         # Luego el propietario
         conn.execute("DELETE FROM propietarios WHERE id = ?", (propietario_id,))
         conn.commit()
-        conn.close()
+        invalidate_propiedades(*propiedad_ids)
         return True
     except Exception as e:
         print("Error en delete_propietario:", e)
         return False
 
 
-def delete_propiedad(propiedad_id):
-    """Elimina (desactiva) una propiedad"""
-    try:
-        conn = sqlite3.connect(get_db_path())
-        cursor = conn.cursor()
-        cursor.execute('UPDATE propiedades SET activo = 0 WHERE id = ?', (propiedad_id,))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        print(f"Error eliminando propiedad: {e}")
+def delete_propiedad(propiedad_id):
+    """Elimina (desactiva) una propiedad"""
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute('UPDATE propiedades SET activo = 0 WHERE id = ?', (propiedad_id,))
+        conn.commit()
+        invalidate_propiedades(propiedad_id)
+        return True
+    except Exception as e:
+        print(f"Error eliminando propiedad: {e}")
+        return False
+
+# IMPORTACIÓN MASIVA
+ESTADOS_PROPIEDAD = ('disponible', 'reservado', 'vendido')
+IMPORT_CHUNK_SIZE = 500  # referencias por consulta IN (...)
+
+def _import_text(valor):
+    return '' if valor is None else str(valor).strip()
+
+def validate_propietario_import(registro):
+    """Normaliza un propietario a importar; retorna (fila, None) o (None, error)"""
+    if not isinstance(registro, dict):
+        return None, 'Registro inválido'
+    fila = {
+        'ref': _import_text(registro.get('ref')),
+        'nombre': _import_text(registro.get('nombre')),
+        'email': _import_text(registro.get('email')),
+        'telefono': _import_text(registro.get('telefono'))
+    }
+    if not fila['ref']:
+        return None, 'Falta la referencia externa (ref)'
+    if not fila['nombre']:
+        return None, 'Falta el nombre'
+    return fila, None
+
+def validate_propiedad_import(registro):
+    """Normaliza una propiedad a importar; retorna (fila, None) o (None, error)"""
+    if not isinstance(registro, dict):
+        return None, 'Registro inválido'
+    imagenes = registro.get('imagenes') or []
+    if isinstance(imagenes, str):
+        imagenes = [i.strip() for i in imagenes.split(',') if i.strip()]
+    fila = {
+        'ref': _import_text(registro.get('ref')),
+        'propietario_ref': _import_text(registro.get('propietario_ref')),
+        'propietario_id': _import_text(registro.get('propietario_id')),
+        'titulo_es': _import_text(registro.get('titulo_es')),
+        'descripcion_es': _import_text(registro.get('descripcion_es')),
+        'titulo_en': _import_text(registro.get('titulo_en')),
+        'descripcion_en': _import_text(registro.get('descripcion_en')),
+        'precio': _import_text(registro.get('precio')),
+        'ubicacion': _import_text(registro.get('ubicacion')),
+        'tipo': _import_text(registro.get('tipo')).lower() or 'terreno',
+        'estado': _import_text(registro.get('estado')).lower() or 'disponible',
+        'whatsapp': _import_text(registro.get('whatsapp')),
+        'imagenes': [str(i) for i in imagenes] if isinstance(imagenes, list) else None
+    }
+    if not fila['ref']:
+        return None, 'Falta la referencia externa (ref)'
+    if not fila['titulo_es'] or not fila['titulo_en']:
+        return None, 'Faltan titulo_es y/o titulo_en'
+    if not fila['propietario_ref'] and not fila['propietario_id'].isdigit():
+        return None, 'Falta propietario_ref o propietario_id'
+    if fila['estado'] not in ESTADOS_PROPIEDAD:
+        return None, f"Estado inválido: {fila['estado']}"
+    if fila['imagenes'] is None:
+        return None, 'imagenes debe ser una lista o texto separado por comas'
+    return fila, None
+
+def fetch_by_refs(conn, tabla, columnas, refs):
+    """{ref_externa: fila} de los registros existentes, consultando por bloques"""
+    refs = list(dict.fromkeys(refs))
+    existentes = {}
+    for i in range(0, len(refs), IMPORT_CHUNK_SIZE):
+        bloque = refs[i:i + IMPORT_CHUNK_SIZE]
+        marcas = ', '.join('?' for _ in bloque)
+        for row in conn.execute(
+            f'SELECT ref_externa, {columnas} FROM {tabla} WHERE ref_externa IN ({marcas})', bloque
+        ):
+            existentes[row['ref_externa']] = row
+    return existentes
+
+def _validate_import(entidad, registros, validar, resultado):
+    filas = []
+    refs = set()
+    for numero, registro in enumerate(registros, 1):
+        fila, error = validar(registro)
+        if not error and fila['ref'] in refs:
+            error = 'Referencia repetida en el archivo'
+        if error:
+            ref = registro.get('ref') if isinstance(registro, dict) else None
+            resultado['errores'].append({'entidad': entidad, 'fila': numero, 'ref': ref, 'error': error})
+            continue
+        refs.add(fila['ref'])
+        fila['numero'] = numero
+        filas.append(fila)
+    return filas
+
+def import_records(conn, propietarios=(), propiedades=(), validar=False):
+    """Valida e inserta o actualiza por referencia externa en una sola transacción.
+
+    Las filas con errores se omiten y se reportan en 'errores'; con validar=True
+    solo se reporta lo que se haría. Retorna el resumen de la importación.
+    """
+    resultado = {
+        'propietarios': {'insertados': 0, 'actualizados': 0, 'sin_cambios': 0},
+        'propiedades': {'insertados': 0, 'actualizados': 0, 'sin_cambios': 0},
+        'errores': []
+    }
+    filas_propietarios = _validate_import('propietarios', propietarios, validate_propietario_import, resultado)
+    filas_propiedades = _validate_import('propiedades', propiedades, validate_propiedad_import, resultado)
+    ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    actualizadas = []
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if filas_propietarios:
+            existentes = fetch_by_refs(conn, 'propietarios', 'id', [f['ref'] for f in filas_propietarios])
+            cursor = conn.executemany('''
+                INSERT INTO propietarios (nombre, email, telefono, fecha_registro, ref_externa)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (ref_externa) WHERE ref_externa IS NOT NULL DO UPDATE SET
+                    nombre = excluded.nombre, email = excluded.email, telefono = excluded.telefono, activo = 1
+                WHERE (nombre, email, telefono, activo) IS NOT (excluded.nombre, excluded.email, excluded.telefono, 1)
+            ''', [(f['nombre'], f['email'], f['telefono'], ahora, f['ref']) for f in filas_propietarios])
+            _count_import(resultado['propietarios'], len(filas_propietarios), len(existentes), cursor.rowcount)
+
+        if filas_propiedades:
+            # Propietario por referencia (del archivo o ya existente) o por id
+            por_ref = fetch_by_refs(conn, 'propietarios', 'id', [f['propietario_ref'] for f in filas_propiedades if f['propietario_ref']])
+            ids = {f['propietario_id'] for f in filas_propiedades if not f['propietario_ref']}
+            ids_validos = set()
+            for i in range(0, len(ids), IMPORT_CHUNK_SIZE):
+                bloque = list(ids)[i:i + IMPORT_CHUNK_SIZE]
+                marcas = ', '.join('?' for _ in bloque)
+                ids_validos.update(
+                    str(row[0]) for row in conn.execute(f'SELECT id FROM propietarios WHERE id IN ({marcas})', bloque)
+                )
+
+            validas = []
+            for f in filas_propiedades:
+                if f['propietario_ref']:
+                    propietario = por_ref.get(f['propietario_ref'])
+                    f['propietario_id'] = propietario['id'] if propietario else None
+                elif f['propietario_id'] not in ids_validos:
+                    f['propietario_id'] = None
+                if f['propietario_id'] is None:
+                    resultado['errores'].append({
+                        'entidad': 'propiedades', 'fila': f['numero'], 'ref': f['ref'], 'error': 'Propietario no encontrado'
+                    })
+                    continue
+                validas.append(f)
+
+            existentes = fetch_by_refs(conn, 'propiedades', 'id, imagenes', [f['ref'] for f in validas])
+            filas = []
+            for f in validas:
+                traduccion = TIPO_TRANSLATIONS.get(f['tipo'], {})
+                filas.append((
+                    int(f['propietario_id']), f['titulo_es'], f['descripcion_es'], f['titulo_en'], f['descripcion_en'],
+                    f['precio'], *parse_price(f['precio']), f['ubicacion'], f['tipo'],
+                    traduccion.get('es', f['tipo'].title()), traduccion.get('en', f['tipo'].title()),
+                    f['estado'], json.dumps(f['imagenes']), f['whatsapp'], ahora, ahora, f['ref']
+                ))
+            cursor = conn.executemany('''
+                INSERT INTO propiedades (propietario_id, titulo_es, descripcion_es, titulo_en, descripcion_en,
+                                         precio, precio_num, precio_moneda, ubicacion, tipo, tipo_es, tipo_en, estado,
+                                         imagenes, whatsapp, fecha_creacion, fecha_actualizacion, ref_externa)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (ref_externa) WHERE ref_externa IS NOT NULL DO UPDATE SET
+                    propietario_id = excluded.propietario_id,
+                    titulo_es = excluded.titulo_es, descripcion_es = excluded.descripcion_es,
+                    titulo_en = excluded.titulo_en, descripcion_en = excluded.descripcion_en,
+                    precio = excluded.precio, precio_num = excluded.precio_num, precio_moneda = excluded.precio_moneda,
+                    ubicacion = excluded.ubicacion, tipo = excluded.tipo, tipo_es = excluded.tipo_es,
+                    tipo_en = excluded.tipo_en, estado = excluded.estado, imagenes = excluded.imagenes,
+                    whatsapp = excluded.whatsapp, activo = 1,
+                    revision = revision + 1, fecha_actualizacion = excluded.fecha_actualizacion
+                -- Reimportar los mismos datos no cambia la revisión (ni invalida ETags)
+                WHERE (propietario_id, titulo_es, descripcion_es, titulo_en, descripcion_en, precio, ubicacion,
+                       tipo, estado, imagenes, whatsapp, activo)
+                   IS NOT (excluded.propietario_id, excluded.titulo_es, excluded.descripcion_es, excluded.titulo_en,
+                           excluded.descripcion_en, excluded.precio, excluded.ubicacion, excluded.tipo,
+                           excluded.estado, excluded.imagenes, excluded.whatsapp, 1)
+            ''', filas)
+            _count_import(resultado['propiedades'], len(validas), len(existentes), cursor.rowcount)
+
+            anteriores = [r for row in existentes.values() for r in json.loads(row['imagenes'] or '[]')]
+            update_image_refs(conn, anteriores, [r for f in validas for r in f['imagenes']])
+            actualizadas = [row['id'] for row in existentes.values()]
+
+        if validar:
+            conn.rollback()
+            return resultado
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if filas_propiedades:
+        invalidate_propiedades(*actualizadas)
+    return resultado
+
+def _count_import(resumen, total, existentes, cambios):
+    # rowcount del executemany cuenta inserciones y actualizaciones efectivas (sin triggers)
+    resumen['insertados'] = total - existentes
+    resumen['actualizados'] = cambios - resumen['insertados']
+    resumen['sin_cambios'] = existentes - resumen['actualizados']
+
+def split_import_records(datos, entidad='propiedades'):
+    """(propietarios, propiedades) de un objeto {propietarios, propiedades} o de una lista de la entidad"""
+    if isinstance(datos, dict):
+        return datos.get('propietarios', []), datos.get('propiedades', [])
+    if not isinstance(datos, list):
+        raise ValueError('Se esperaba una lista o un objeto con propietarios/propiedades')
+    return (datos, []) if entidad == 'propietarios' else ([], datos)
+
+def parse_import_file(contenido, nombre_archivo='', entidad='propiedades'):
+    """Convierte un archivo JSON o CSV en (propietarios, propiedades)"""
+    if nombre_archivo.lower().endswith('.csv'):
+        return split_import_records(list(csv.DictReader(io.StringIO(contenido.decode('utf-8-sig')))), entidad)
+    return split_import_records(json.loads(contenido), entidad)
+
+@app.cli.command('import-data')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--entidad', type=click.Choice(['propiedades', 'propietarios']), default='propiedades',
+              help='Tipo de registros de un CSV o de una lista JSON')
+@click.option('--validar', is_flag=True, help='Solo valida, sin guardar')
+def import_data_command(archivo, entidad, validar):
+    """Importa propietarios y propiedades desde JSON o CSV (idempotente por ref)"""
+    with open(archivo, 'rb') as f:
+        propietarios, propiedades = parse_import_file(f.read(), archivo, entidad)
+    inicio = time.perf_counter()
+    resultado = import_records(get_db(), propietarios, propiedades, validar=validar)
+    for error in resultado['errores']:
+        click.echo(f"⚠️ {error['entidad']} fila {error['fila']} ({error['ref']}): {error['error']}")
+    for nombre in ('propietarios', 'propiedades'):
+        click.echo(f"{nombre}: {resultado[nombre]}")
+    accion = 'validados' if validar else 'importados'
+    click.echo(f"✅ Registros {accion} en {time.perf_counter() - inicio:.2f}s con {len(resultado['errores'])} error(es)")
+
+# DATOS SINTÉTICOS
+# Volúmenes con forma de producción para reproducir páginas lentas en local
+SEED_LOTE = 5000
+SEED_NOMBRES = ('Ana', 'Luis', 'María', 'José', 'Carmen', 'Jorge', 'Lucía', 'Carlos', 'Sofía', 'Diego', 'Elena', 'Pablo')
+SEED_APELLIDOS = ('García', 'López', 'Pérez', 'Morales', 'Castillo', 'Herrera', 'Méndez', 'Ramírez', 'Cruz', 'Reyes')
+# (valor, peso) para random.choices
+SEED_UBICACIONES = (
+    ('Antigua Guatemala', 3), ('Ciudad de Guatemala', 4), ('Monterrico', 2), ('Lago de Atitlán', 2),
+    ('Quetzaltenango', 1), ('Petén', 1), ('Escuintla', 1), ('Cobán', 1),
+)
+SEED_TIPOS = (('terreno', 40), ('casa', 30), ('apartamento', 15), ('local', 8), ('oficina', 7))
+SEED_ESTADOS = (('disponible', 80), ('reservado', 10), ('vendido', 10))
+SEED_FUENTES = (('landing', 45), ('whatsapp', 25), ('direct', 10), ('fb', 8), ('ig', 7), ('tt', 3), ('in', 2))
+SEED_IDIOMAS = (('espanol', 70), ('ingles', 30))
+SEED_ADJETIVOS = (('amplio', 'spacious'), ('con vista', 'with a view'), ('remodelado', 'renovated'),
+                  ('céntrico', 'central'), ('tranquilo', 'quiet'), ('exclusivo', 'exclusive'))
+SEED_FRASES_ES = ('Acceso pavimentado y servicios básicos.', 'Cerca de escuelas y comercios.',
+                  'Ideal para inversión o vivienda.', 'Seguridad las 24 horas.', 'Documentos en orden, listo para escriturar.')
+SEED_FRASES_EN = ('Paved access and basic utilities.', 'Close to schools and shops.',
+                  'Ideal for investment or living.', '24-hour security.', 'Clean title, ready to transfer.')
+
+def _seed_choice(rng, opciones):
+    valores, pesos = zip(*opciones)
+    return rng.choices(valores, pesos)[0]
+
+def _seed_price(rng):
+    """Precio como lo escriben los usuarios: varias monedas y formatos, a veces sin número"""
+    monto = rng.randint(15, 2500) * 1000
+    formato = rng.random()
+    if formato < 0.45:
+        return f"Q{monto:,}"
+    if formato < 0.65:
+        return f"US${monto // 8:,}"
+    if formato < 0.75:
+        return f"${monto // 8:,}"
+    if formato < 0.82:
+        return f"€{monto // 9:,}".replace(',', '.')
+    if formato < 0.92:
+        return f"GTQ {monto}"
+    return rng.choice(('Consultar', 'Precio a convenir', ''))
+
+def _seed_date(rng, desde, dias):
+    return (desde + timedelta(seconds=rng.randint(0, dias * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+
+def _seed_propiedades(rng, ids_propietarios, cantidad, ahora):
+    inicio = ahora - timedelta(days=3 * 365)
+    for _ in range(cantidad):
+        tipo = _seed_choice(rng, SEED_TIPOS)
+        traduccion = TIPO_TRANSLATIONS[tipo]
+        ubicacion = _seed_choice(rng, SEED_UBICACIONES)
+        adjetivo_es, adjetivo_en = rng.choice(SEED_ADJETIVOS)
+        precio = _seed_price(rng)
+        fecha = _seed_date(rng, inicio, 3 * 365)
+        imagenes = [f"uploads/{rng.getrandbits(256):064x}.jpg" for _ in range(rng.randint(0, 8))]
+        yield (
+            rng.choice(ids_propietarios),
+            f"{traduccion['es']} {adjetivo_es} en {ubicacion}", ' '.join(rng.sample(SEED_FRASES_ES, 3)),
+            f"{adjetivo_en.capitalize()} {traduccion['en'].lower()} in {ubicacion}", ' '.join(rng.sample(SEED_FRASES_EN, 3)),
+            precio, *parse_price(precio), ubicacion, tipo, traduccion['es'], traduccion['en'],
+            _seed_choice(rng, SEED_ESTADOS), json.dumps(imagenes), f"502{rng.randint(30000000, 59999999)}",
+            fecha, fecha, int(rng.random() > 0.03)
+        )
+
+def _seed_prospects(rng, propiedades, cantidad, ahora):
+    inicio = ahora - timedelta(days=365)
+    for numero in range(cantidad):
+        propiedad_id = None
+        propiedad = 'Interés general'
+        if propiedades and rng.random() < 0.8:
+            # Pocas propiedades concentran la mayoría de los prospectos
+            indice = min(int(rng.paretovariate(1.2)) - 1, len(propiedades) - 1)
+            propiedad_id, titulo = propiedades[(indice * 7919) % len(propiedades)]
+            propiedad = f"{titulo} (ID: {propiedad_id})"
+        yield (
+            f"{rng.choice(SEED_NOMBRES)} {rng.choice(SEED_APELLIDOS)}", f"lead{numero}@ejemplo.com",
+            f"+502 4{rng.randint(0, 9999999):07d}", _seed_choice(rng, SEED_FUENTES),
+            _seed_date(rng, inicio, 365), propiedad, propiedad_id, _seed_choice(rng, SEED_IDIOMAS)
+        )
+
+def _insert_batches(conn, sql, filas, lote):
+    while True:
+        bloque = list(itertools.islice(filas, lote))
+        if not bloque:
+            return
+        conn.executemany(sql, bloque)
+
+def seed_data(conn, propietarios=100, propiedades=1000, prospectos=5000, semilla=42, lote=SEED_LOTE):
+    """Agrega propietarios, propiedades bilingües y prospectos sintéticos en una sola transacción.
+
+    Los triggers de FTS, revisiones y métricas se quitan durante la carga y el índice
+    de búsqueda y las métricas se reconstruyen al final, una sola vez.
+    """
+    rng = random.Random(semilla)
+    ahora = datetime.now()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        triggers = conn.execute('''
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'trigger' AND tbl_name IN ('propietarios', 'propiedades', 'prospects')
+        ''').fetchall()
+        for trigger in triggers:
+            conn.execute(f'DROP TRIGGER "{trigger["name"]}"')
+
+        ultimo = conn.execute('SELECT COALESCE(MAX(id), 0) FROM propietarios').fetchone()[0]
+        _insert_batches(conn, 'INSERT INTO propietarios (nombre, email, telefono, fecha_registro) VALUES (?, ?, ?, ?)', (
+            (f"{rng.choice(SEED_NOMBRES)} {rng.choice(SEED_APELLIDOS)}", f"propietario{ultimo + i}@ejemplo.com",
+             f"+502 5{rng.randint(0, 9999999):07d}", _seed_date(rng, ahora - timedelta(days=1500), 365))
+            for i in range(propietarios)
+        ), lote)
+        ids_propietarios = [row[0] for row in conn.execute('SELECT id FROM propietarios WHERE activo = 1')]
+        if not ids_propietarios:
+            propiedades = 0
+
+        ultima = conn.execute('SELECT COALESCE(MAX(id), 0) FROM propiedades').fetchone()[0]
+        _insert_batches(conn, '''
+            INSERT INTO propiedades (propietario_id, titulo_es, descripcion_es, titulo_en, descripcion_en,
+                                     precio, precio_num, precio_moneda, ubicacion, tipo, tipo_es, tipo_en, estado,
+                                     imagenes, whatsapp, fecha_creacion, fecha_actualizacion, activo)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', _seed_propiedades(rng, ids_propietarios, propiedades, ahora), lote)
+        nuevas = conn.execute(
+            'SELECT id, titulo_es FROM propiedades WHERE id > ? AND activo = 1', (ultima,)
+        ).fetchall()
+
+        _insert_batches(conn, '''
+            INSERT INTO prospects (nombre, email, telefono, fuente, fecha, propiedad, propiedad_id, idioma)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', _seed_prospects(rng, [tuple(row) for row in nuevas], prospectos, ahora), lote)
+
+        for trigger in triggers:
+            conn.execute(trigger['sql'])
+        # Lo que mantenían los triggers, de una sola vez
+        conn.execute("INSERT INTO propiedades_fts(propiedades_fts) VALUES('rebuild')")
+        rebuild_metrics(conn)
+        conn.execute('''
+            UPDATE revisiones SET revision = revision + 1, fecha_actualizacion = datetime('now', 'localtime')
+            WHERE nombre = 'propiedades'
+        ''')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    conn.execute('PRAGMA optimize')
+    return {'propietarios': propietarios, 'propiedades': propiedades, 'prospectos': prospectos}
+
+@app.cli.command('seed-data')
+@click.option('--db', 'ruta', type=click.Path(dir_okay=False), default=None,
+              help='Archivo SQLite destino (por defecto DATABASE_PATH); se crea si no existe')
+@click.option('--propietarios', default=100, show_default=True)
+@click.option('--propiedades', default=1000, show_default=True)
+@click.option('--prospectos', default=5000, show_default=True)
+@click.option('--semilla', default=42, show_default=True, help='Misma semilla, mismos datos')
+def seed_data_command(ruta, propietarios, propiedades, prospectos, semilla):
+    """Genera propietarios, propiedades y prospectos sintéticos para pruebas de escala"""
+    if ruta:
+        app.config['DATABASE'] = ruta
+    inicio = time.perf_counter()
+    resumen = seed_data(get_db(), propietarios, propiedades, prospectos, semilla)
+    invalidate_propiedades()
+    click.echo(f"✅ {resumen} generados en {get_db_path()} en {time.perf_counter() - inicio:.1f}s")
+
+# AUTENTICACIÓN DEL CRM
+class AuthBusy(Exception):
+    """El pool de hashing está lleno: demasiados logins simultáneos en este worker"""
+
+class PasswordHasher:
+    """Hash y verificación de contraseñas en un pool pequeño de hilos que acota su CPU por worker"""
+
+    def __init__(self, method, workers=2, queue_size=8, timeout=5.0):
+        self.method = method
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._hash_vacio = None
+        self._stats = {'hashes': 0, 'verificaciones': 0, 'rehashes': 0, 'rechazos': 0,
+                       'en_curso': 0, 'tiempo_total_ms': 0.0, 'tiempo_max_ms': 0.0}
+
+    def _pool(self):
+        # pbkdf2/scrypt de hashlib liberan el GIL: los hilos corren en paralelo sin bloquear otras peticiones
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='auth')
+                self._stats['en_curso'] = 0
+            return self._executor
+
+    def _medir(self, func, *args):
+        inicio = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            ms = (time.perf_counter() - inicio) * 1000
+            with self._lock:
+                self._stats['en_curso'] -= 1
+                self._stats['tiempo_total_ms'] += ms
+                self._stats['tiempo_max_ms'] = max(self._stats['tiempo_max_ms'], ms)
+
+    def _run(self, contador, func, *args):
+        pool = self._pool()
+        with self._lock:
+            if self._stats['en_curso'] >= self.workers + self.queue_size:
+                self._stats['rechazos'] += 1
+                raise AuthBusy()
+            self._stats['en_curso'] += 1
+            self._stats[contador] += 1
+        try:
+            futuro = pool.submit(self._medir, func, *args)
+        except Exception:
+            with self._lock:
+                self._stats['en_curso'] -= 1
+            raise
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturesTimeout:
+            raise AuthBusy()
+
+    def hash(self, password):
+        return self._run('hashes', generate_password_hash, password, self.method)
+
+    def rehash(self, password):
+        return self._run('rehashes', generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run('verificaciones', check_password_hash, password_hash, password)
+
+    def verify_missing(self, password):
+        """Mismo costo que una verificación real cuando el usuario no existe (no revela usuarios)"""
+        if self._hash_vacio is None:
+            self._hash_vacio = self.hash(secrets.token_urlsafe(16))
+        self.verify(self._hash_vacio, password)
         return False
 
+    def needs_rehash(self, password_hash):
+        return not password_hash.startswith(self.method + '$')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['tiempo_total_ms'] = round(stats['tiempo_total_ms'], 3)
+        stats['tiempo_max_ms'] = round(stats['tiempo_max_ms'], 3)
+        return stats
+
+def get_password_hasher():
+    hasher = app.extensions.get('password_hasher')
+    if hasher is None:
+        hasher = PasswordHasher(
+            app.config['PASSWORD_HASH_METHOD'],
+            workers=app.config['AUTH_WORKERS'],
+            queue_size=app.config['AUTH_QUEUE_SIZE'],
+            timeout=app.config['AUTH_TIMEOUT'],
+        )
+        app.extensions['password_hasher'] = hasher
+    return hasher
+
+class TokenBucket:
+    """Limitador en memoria por clave: `rate` fichas por segundo, hasta `burst` acumuladas"""
+
+    def __init__(self, rate, burst, max_claves=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_claves = max_claves
+        self._lock = threading.Lock()
+        self._cubetas = OrderedDict()  # clave -> (fichas, instante)
+        self._stats = {'permitidos': 0, 'rechazados': 0}
+
+    def take(self, clave):
+        """Consume una ficha; retorna (permitido, segundos hasta la siguiente ficha)"""
+        with self._lock:
+            ahora = time.monotonic()
+            fichas, antes = self._cubetas.pop(clave, (self.burst, ahora))
+            fichas = min(self.burst, fichas + (ahora - antes) * self.rate)
+            permitido = fichas >= 1
+            if permitido:
+                fichas -= 1
+                self._stats['permitidos'] += 1
+            else:
+                self._stats['rechazados'] += 1
+            self._cubetas[clave] = (fichas, ahora)
+            while len(self._cubetas) > self.max_claves:
+                self._cubetas.popitem(last=False)
+            return permitido, 0.0 if permitido else (1 - fichas) / self.rate
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, claves=len(self._cubetas))
+
+def get_login_limiter():
+    limiter = app.extensions.get('login_limiter')
+    if limiter is None:
+        limiter = TokenBucket(app.config['LOGIN_RATE_PER_MINUTE'] / 60, app.config['LOGIN_BURST'])
+        app.extensions['login_limiter'] = limiter
+    return limiter
+
+def get_login_ip_limiter():
+    limiter = app.extensions.get('login_ip_limiter')
+    if limiter is None:
+        limiter = TokenBucket(app.config['LOGIN_IP_RATE_PER_MINUTE'] / 60, app.config['LOGIN_IP_BURST'])
+        app.extensions['login_ip_limiter'] = limiter
+    return limiter
+
+def login_allowed(username):
+    """Una ficha por IP y otra por usuario desde esa IP.
+
+    La cubeta por usuario va ligada a la IP: quien falla contraseñas de 'admin'
+    desde otra dirección no bloquea al administrador legítimo.
+    """
+    ip = request.remote_addr
+    por_ip, espera_ip = get_login_ip_limiter().take(ip)
+    por_usuario, espera_usuario = get_login_limiter().take((username.lower(), ip))
+    return por_ip and por_usuario, max(espera_ip, espera_usuario)
+
+def auth_fingerprint(password_hash):
+    # Cambia con la contraseña: las sesiones abiertas con la anterior dejan de valer
+    return hashlib.sha256(password_hash.encode()).hexdigest()[:16]
+
+def crm_user_fingerprint(user_id, refrescar=False):
+    """Huella vigente del usuario CRM activo (o None), cacheada AUTH_CACHE_SECONDS por worker"""
+    cache = app.extensions.setdefault('crm_auth_cache', {})
+    ahora = time.monotonic()
+    entrada = cache.get(user_id)
+    if entrada and entrada[0] > ahora and not refrescar:
+        return entrada[1]
+    row = get_db().execute(
+        'SELECT password_hash FROM usuarios_crm WHERE id = ? AND activo = 1', (user_id,)
+    ).fetchone()
+    huella = auth_fingerprint(row[0]) if row else None
+    cache[user_id] = (ahora + app.config['AUTH_CACHE_SECONDS'], huella)
+    return huella
+
+@app.before_request
+def check_crm_session():
+    # La sesión CRM se cierra si el usuario se desactivó o cambió su contraseña
+    if request.endpoint == 'static' or not session.get('crm_logged_in'):
+        return
+    usuario = session.get('crm_user') or {}
+    huella = session.get('crm_auth')
+    # Solo la coincidencia se toma de la caché: otro worker pudo rehacer el hash hace un momento
+    if not huella or (crm_user_fingerprint(usuario.get('id')) != huella
+                      and crm_user_fingerprint(usuario.get('id'), refrescar=True) != huella):
+        for clave in ('crm_logged_in', 'crm_user', 'crm_auth'):
+            session.pop(clave, None)
+
 def verify_crm_user(username, password):
-    """Verifica credenciales de usuario CRM"""
+    """Verifica credenciales de usuario CRM; rehace el hash si cambió el método configurado"""
+    hasher = get_password_hasher()
     try:
-        conn = sqlite3.connect(get_db_path())
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM usuarios_crm WHERE username = ? AND activo = 1', (username,))
         user = cursor.fetchone()
-        conn.close()
-        
-        if user and user[2] == password:
-            return {'id': user[0], 'username': user[1], 'nombre': user[3]}
-        return None
     except Exception as e:
         print(f"Error verificando usuario: {e}")
         return None
 
-def load_prospects():
-    """Carga todos los prospectos"""
-    try:
-        conn = sqlite3.connect(get_db_path())
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM prospects ORDER BY fecha DESC')
-        
-        prospects = []
-        for row in cursor.fetchall():
-            prospects.append({
-                'id': row[0],
-                'nombre': row[1],
-                'email': row[2],
-                'telefono': row[3],
-                'fuente': row[4],
-                'fecha': row[5],
-                'propiedad': row[6],
-                'propiedad_id': row[7],
-                'idioma': row[8]
-            })
-        
-        conn.close()
-        return prospects
-    except Exception as e:
-        print(f"Error cargando prospectos: {e}")
-        return []
+    if not user:
+        hasher.verify_missing(password)
+        return None
+    if not hasher.verify(user[2], password):
+        return None
 
-def save_prospect(prospect):
-    """Guarda un nuevo prospecto"""
-    try:
-        conn = sqlite3.connect(get_db_path())
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO prospects (nombre, email, telefono, fuente, fecha, propiedad, propiedad_id, idioma)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+    password_hash = user[2]
+    if hasher.needs_rehash(password_hash):
+        password_hash = hasher.rehash(password)
+        try:
+            conn.execute('UPDATE usuarios_crm SET password_hash = ? WHERE id = ?', (password_hash, user[0]))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            password_hash = user[2]
+            print(f"⚠️ No se pudo actualizar el hash de {username}: {e}")
+    app.extensions.get('crm_auth_cache', {}).pop(user[0], None)
+    return {'id': user[0], 'username': user[1], 'nombre': user[3], 'huella': auth_fingerprint(password_hash)}
+
+@app.cli.command('hash-cost')
+@click.option('--metodo', default=None, help='Por defecto PASSWORD_HASH_METHOD, p. ej. pbkdf2:sha256:600000 o scrypt:32768:8:1')
+@click.option('--repeticiones', default=5, show_default=True)
+def hash_cost_command(metodo, repeticiones):
+    """Mide el costo de un hash de contraseña para ajustar el factor de trabajo"""
+    metodo = metodo or app.config['PASSWORD_HASH_METHOD']
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        generate_password_hash('medicion', metodo)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    click.echo(f"✅ {metodo}: mediana {tiempos[len(tiempos) // 2]:.1f} ms, máximo {tiempos[-1]:.1f} ms "
+               f"({app.config['AUTH_WORKERS']} hashes simultáneos por worker)")
+
+def prospect_rows(conn, prospects):
+    """Filas para INSERT en prospects; resuelve en una sola consulta los títulos de las propiedades"""
+    ids = set()
+    for prospect in prospects:
+        if 'propiedad' not in prospect and str(prospect.get('propiedad_id') or '').isdigit():
+            ids.add(int(prospect['propiedad_id']))
+    titulos = {}
+    if ids:
+        marcas = ', '.join('?' for _ in ids)
+        titulos = {
+            row['id']: row['titulo_es']
+            for row in conn.execute(
+                f'SELECT id, titulo_es FROM propiedades WHERE id IN ({marcas}) AND activo = 1', tuple(ids)
+            )
+        }
+
+    filas = []
+    for prospect in prospects:
+        # Sin propiedad (o con un id no numérico) se guarda NULL, nunca ''
+        propiedad_id = prospect.get('propiedad_id')
+        propiedad_id = int(propiedad_id) if str(propiedad_id or '').isdigit() else None
+        propiedad = prospect.get('propiedad')
+        if propiedad is None:
+            titulo = titulos.get(propiedad_id) if propiedad_id is not None else None
+            propiedad = f"{titulo} (ID: {propiedad_id})" if titulo else 'Interés general'
+        filas.append((
             prospect['nombre'],
             prospect.get('email', ''),
             prospect['telefono'],
             prospect.get('fuente', 'direct'),
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            prospect.get('propiedad', ''),
-            prospect.get('propiedad_id', ''),
+            prospect.get('fecha') or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            propiedad,
+            propiedad_id,
             prospect.get('idioma', 'espanol')
         ))
-        
+    return filas
+
+def insert_prospects(conn, prospects):
+    conn.executemany('''
+        INSERT INTO prospects (nombre, email, telefono, fuente, fecha, propiedad, propiedad_id, idioma)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', prospect_rows(conn, prospects))
+
+def save_prospect(prospect):
+    """Guarda un nuevo prospecto"""
+    try:
+        conn = get_db()
+        insert_prospects(conn, [prospect])
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
         print(f"Error guardando prospecto: {e}")
         return False
 
+class LeadWriter:
+    """Cola acotada por worker que agrupa prospectos y los guarda en lotes (una transacción por lote)"""
+
+    def __init__(self, batch_size=50, max_delay=0.2, capacity=1000, put_timeout=0.5,
+                 spool_path='terrazen_prospectos_pendientes', spool_retry=30):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.capacity = capacity
+        self.put_timeout = put_timeout
+        self.spool_path = spool_path
+        self.spool_retry = spool_retry
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._stopping = False
+        self._atexit = False
+        self._reset()
+
+    def _reset(self):
+        self._queue = queue.Queue(maxsize=self.capacity)
+        # Los hilos de las peticiones actualizan estos contadores a la vez que el hilo escritor
+        self._contadores = threading.Lock()
+        self._encolados = 0
+        self._escritos = 0
+        self._lotes = 0
+        self._lote_max = 0
+        self._cola_max = 0
+        self._cola_llena = 0
+        self._directos = 0
+        self._errores = 0
+        self._perdidos = 0
+        self._aplazados = 0
+        self._recuperados = 0
+        self._proximo_reintento = 0.0
+        self._latencia_total = 0.0
+        self._latencia_max = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            # Tras un fork la cola y el hilo del padre no existen en el worker
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._reset()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='lead-writer', daemon=True)
+            self._thread.start()
+            if not self._atexit:
+                atexit.register(self.shutdown)
+                self._atexit = True
+
+    def submit(self, prospect):
+        """Encola un prospecto; si la cola sigue llena tras put_timeout, lo guarda directamente"""
+        self.start()
+        prospect = dict(prospect)
+        prospect.setdefault('fecha', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        item = (prospect, time.perf_counter())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._contadores:
+                self._cola_llena += 1
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                with self._contadores:
+                    self._directos += 1
+                return save_prospect(prospect)
+        with self._contadores:
+            self._encolados += 1
+            self._cola_max = max(self._cola_max, self._queue.qsize())
+        return True
+
+    def shutdown(self, wait=True):
+        """Escribe lo pendiente y detiene el hilo (también se llama al salir del proceso)"""
+        self._stopping = True
+        if self._thread and self._pid == os.getpid():
+            self._thread.join(timeout=30 if wait else 0)
+
+    def _next_batch(self):
+        try:
+            lote = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        # Latencia acotada: el lote se cierra al llenarse o al cumplirse max_delay
+        limite = time.perf_counter() + self.max_delay
+        while len(lote) < self.batch_size:
+            restante = limite - time.perf_counter()
+            try:
+                lote.append(self._queue.get(timeout=restante) if restante > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _insert(self, prospects):
+        """Inserta en una transacción; solo reintenta si la base está bloqueada u ocupada"""
+        for intento in range(3):
+            try:
+                with get_pool().connection() as conn:
+                    insert_prospects(conn, prospects)
+                    conn.commit()
+                return
+            except sqlite3.OperationalError as e:
+                self._errores += 1
+                if intento == 2:
+                    raise
+                print(f"⚠️ Base ocupada guardando {len(prospects)} prospecto(s) (intento {intento + 1}): {e}")
+                time.sleep(0.2 * (intento + 1))
+
+    def _spool_file(self):
+        return f"{self.spool_path}.{os.getpid()}.jsonl"
+
+    def _spool(self, prospects):
+        """Aparta en disco un lote que la base rechazó por estar bloqueada; el visitante ya recibió su respuesta"""
+        try:
+            with open(self._spool_file(), 'a', encoding='utf-8') as archivo:
+                archivo.write(''.join(json.dumps(p, ensure_ascii=False, default=str) + '\n' for p in prospects))
+                archivo.flush()
+                os.fsync(archivo.fileno())
+        except OSError as e:
+            self._perdidos += len(prospects)
+            print(f"❌ Prospectos no guardados ni apartados ({e}): {prospects}")
+            return
+        self._aplazados += len(prospects)
+        print(f"⚠️ {len(prospects)} prospecto(s) apartados en {self._spool_file()} para reintentar")
+
+    def _spooled_files(self):
+        carpeta = os.path.dirname(self.spool_path) or '.'
+        prefijo = os.path.basename(self.spool_path) + '.'
+        try:
+            nombres = os.listdir(carpeta)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            os.path.join(carpeta, nombre) for nombre in nombres
+            if nombre.startswith(prefijo) and nombre.endswith('.jsonl')
+        )
+
+    def _drain_spool(self):
+        """Reintenta los lotes apartados en disco por este o por otros workers"""
+        self._proximo_reintento = time.perf_counter() + self.spool_retry
+        for ruta in self._spooled_files():
+            # Renombrar reclama el archivo: otro worker que drene a la vez ya no lo encuentra,
+            # y lo que se vuelva a apartar va a un archivo nuevo
+            reclamado = f"{ruta[:-len('.jsonl')]}.{os.getpid()}.procesando"
+            try:
+                os.replace(ruta, reclamado)
+            except FileNotFoundError:
+                continue
+            prospects = []
+            with open(reclamado, encoding='utf-8') as archivo:
+                for linea in archivo:
+                    try:
+                        prospects.append(json.loads(linea))
+                    except ValueError:
+                        # Una línea cortada por una caída a media escritura
+                        print(f"❌ Prospecto apartado ilegible en {ruta}: {linea!r}")
+            escritos = self._escritos
+            for inicio in range(0, len(prospects), self.batch_size):
+                self._write([(prospect, None) for prospect in prospects[inicio:inicio + self.batch_size]])
+            self._recuperados += self._escritos - escritos
+            os.remove(reclamado)
+
+    def _write(self, lote):
+        try:
+            self._insert([prospect for prospect, _ in lote])
+        except sqlite3.OperationalError as e:
+            # La base sigue bloqueada tras los reintentos: el lote se guarda en disco, no se pierde
+            print(f"⚠️ Lote de {len(lote)} prospecto(s) no guardado ({e})")
+            self._spool([prospect for prospect, _ in lote])
+            return
+        except Exception as e:
+            # Una fila inválida no arrastra al lote: se guardan una por una y solo se descartan las que fallan solas
+            self._errores += 1
+            print(f"⚠️ Lote de {len(lote)} prospecto(s) rechazado ({e}); se guarda fila por fila")
+            guardados = []
+            for item in lote:
+                try:
+                    self._insert([item[0]])
+                    guardados.append(item)
+                except Exception as e:
+                    self._errores += 1
+                    self._perdidos += 1
+                    print(f"❌ Prospecto no guardado ({e}): {item[0]}")
+            lote = guardados
+            if not lote:
+                return
+
+        ahora = time.perf_counter()
+        self._escritos += len(lote)
+        self._lotes += 1
+        self._lote_max = max(self._lote_max, len(lote))
+        for _, encolado in lote:
+            if encolado is None:
+                continue  # recuperado del disco: su latencia no es la de la cola
+            self._latencia_total += ahora - encolado
+            self._latencia_max = max(self._latencia_max, ahora - encolado)
+
+    def _run(self):
+        while True:
+            lote = self._next_batch()
+            if lote:
+                self._write(lote)
+            elif self._stopping:
+                break
+            elif time.perf_counter() >= self._proximo_reintento:
+                self._drain_spool()
+        # Última oportunidad antes de salir; lo que siga fallando queda en disco para el próximo arranque
+        self._drain_spool()
+
+    def stats(self):
+        with self._contadores:
+            cola_max, encolados = self._cola_max, self._encolados
+            cola_llena, directos = self._cola_llena, self._directos
+        return {
+            'pid': os.getpid(),
+            'activo': bool(self._thread and self._thread.is_alive() and self._pid == os.getpid()),
+            'capacidad': self.capacity,
+            'tamano_lote': self.batch_size,
+            'espera_max_ms': round(self.max_delay * 1000),
+            'en_cola': self._queue.qsize(),
+            'cola_max': cola_max,
+            'encolados': encolados,
+            'escritos': self._escritos,
+            'lotes': self._lotes,
+            'lote_promedio': round(self._escritos / self._lotes, 2) if self._lotes else 0,
+            'lote_max': self._lote_max,
+            'cola_llena': cola_llena,
+            'escrituras_directas': directos,
+            'errores': self._errores,
+            'perdidos': self._perdidos,
+            'aplazados': self._aplazados,
+            'recuperados': self._recuperados,
+            'latencia_promedio_ms': round(self._latencia_total / self._escritos * 1000, 2) if self._escritos else 0,
+            'latencia_max_ms': round(self._latencia_max * 1000, 2),
+        }
+
+def get_lead_writer():
+    writer = app.extensions.get('lead_writer')
+    if writer is None:
+        writer = LeadWriter(
+            batch_size=app.config['LEAD_BATCH_SIZE'],
+            max_delay=app.config['LEAD_BATCH_MS'] / 1000,
+            capacity=app.config['LEAD_QUEUE_SIZE'],
+            put_timeout=app.config['LEAD_QUEUE_TIMEOUT'],
+            spool_path=app.config['LEAD_SPOOL_PATH'],
+            spool_retry=app.config['LEAD_SPOOL_RETRY'],
+        )
+        app.extensions['lead_writer'] = writer
+    return writer
+
+# CONSOLA DE PROSPECTOS
+PROSPECTOS_POR_PAGINA = 50
+FUENTES_PROSPECTO = ('direct', 'landing', 'whatsapp', 'fb', 'ig', 'in', 'tt')
+FUENTES_REDES_SOCIALES = ('fb', 'in', 'tt', 'ig')
+
+def prospect_filters(args):
+    """Filtros de la consola de prospectos a partir de los parámetros de la URL"""
+    filtros = {
+        'fuente': args.get('fuente', '').strip(),
+        'idioma': args.get('idioma', '').strip(),
+        'propiedad_id': args.get('propiedad_id', type=int),
+        'desde': '',
+        'hasta': ''
+    }
+    for campo in ('desde', 'hasta'):
+        valor = args.get(campo, '').strip()
+        try:
+            datetime.strptime(valor, "%Y-%m-%d")
+            filtros[campo] = valor
+        except ValueError:
+            pass
+    return filtros
+
+def prospects_where(filtros):
+    """Cláusula WHERE y parámetros para los filtros de prospectos"""
+    condiciones = []
+    params = []
+    if filtros.get('fuente'):
+        condiciones.append('fuente = ?')
+        params.append(filtros['fuente'])
+    if filtros.get('idioma'):
+        condiciones.append('idioma = ?')
+        params.append(filtros['idioma'])
+    if filtros.get('propiedad_id') is not None:
+        condiciones.append('propiedad_id = ?')
+        params.append(filtros['propiedad_id'])
+    if filtros.get('desde'):
+        condiciones.append('fecha >= ?')
+        params.append(f"{filtros['desde']} 00:00:00")
+    if filtros.get('hasta'):
+        # Día completo: hasta el inicio del día siguiente
+        hasta = datetime.strptime(filtros['hasta'], "%Y-%m-%d") + timedelta(days=1)
+        condiciones.append('fecha < ?')
+        params.append(hasta.strftime("%Y-%m-%d %H:%M:%S"))
+    where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+    return where, params
+
+def encode_prospect_cursor(prospect):
+    return f"{prospect['fecha']}|{prospect['id']}"
+
+def search_prospects(filtros, limit=PROSPECTOS_POR_PAGINA, despues=None, antes=None):
+    """Página de prospectos (más recientes primero) por keyset; retorna (lista, hay_mas).
+
+    `despues` avanza hacia prospectos más antiguos que el cursor y `antes` retrocede
+    hacia los más recientes; hay_mas indica si quedan filas en esa dirección.
+    """
+    try:
+        where, params = prospects_where(filtros)
+        orden = 'DESC'
+        posicion = decode_cursor(despues) if despues else None
+        if posicion:
+            comparacion = '<'
+        else:
+            posicion = decode_cursor(antes) if antes else None
+            comparacion = '>'
+            if posicion:
+                orden = 'ASC'
+        if posicion:
+            where = f"{where} AND" if where else 'WHERE'
+            where = f"{where} (fecha, id) {comparacion} (?, ?)"
+            params.extend(posicion)
+
+        rows = get_db().execute(f'''
+            SELECT * FROM prospects
+            {where}
+            ORDER BY fecha {orden}, id {orden}
+            LIMIT ?
+        ''', (*params, limit + 1)).fetchall()
+
+        prospects = Prospect.from_rows(rows[:limit])
+        if orden == 'ASC':
+            prospects.reverse()
+        return prospects, len(rows) > limit
+    except Exception as e:
+        print(f"Error buscando prospectos: {e}")
+        return [], False
+
+def prospect_stats(filtros):
+    """Totales por fuente de los prospectos filtrados, calculados en SQL"""
+    stats = {'total': 0, 'whatsapp': 0, 'landing': 0, 'redes': 0}
+    try:
+        if filtros.get('propiedad_id') is None:
+            # Fuente, idioma y rango de días existen en los agregados: no se recorre prospects
+            where, params = metrics_where(filtros)
+            consulta = f'SELECT fuente, SUM(total) AS total FROM metricas_prospectos {where} GROUP BY fuente'
+        else:
+            where, params = prospects_where(filtros)
+            consulta = f'SELECT fuente, COUNT(*) AS total FROM prospects {where} GROUP BY fuente'
+        rows = get_db().execute(consulta, params).fetchall()
+        for row in rows:
+            stats['total'] += row['total']
+            if row['fuente'] in ('whatsapp', 'landing'):
+                stats[row['fuente']] += row['total']
+            elif row['fuente'] in FUENTES_REDES_SOCIALES:
+                stats['redes'] += row['total']
+    except Exception as e:
+        print(f"Error contando prospectos: {e}")
+    return stats
+
+# MÉTRICAS DEL CRM
+# Contadores mantenidos por triggers (migración 13): el dashboard lee agregados
+# pequeños en vez de agrupar prospects y propiedades en cada carga
+METRICAS_DIAS = 30
+METRICAS_DIAS_MAX = 365
+METRICAS_TOP = 10
+
+def rebuild_metrics(conn):
+    """Recalcula desde cero las tablas de métricas (backfill y reparación)"""
+    conn.execute('DELETE FROM metricas_prospectos')
+    conn.execute('DELETE FROM metricas_propiedades')
+    conn.execute('DELETE FROM metricas_propietarios')
+    conn.execute('''
+        INSERT INTO metricas_prospectos (dia, fuente, idioma, total)
+        SELECT substr(fecha, 1, 10), COALESCE(fuente, ''), COALESCE(idioma, ''), COUNT(*)
+        FROM prospects
+        GROUP BY 1, 2, 3
+    ''')
+    conn.execute('''
+        INSERT INTO metricas_propiedades (propiedad_id, prospectos)
+        SELECT propiedad_id, COUNT(*) FROM prospects
+        WHERE typeof(propiedad_id) = 'integer'
+        GROUP BY propiedad_id
+    ''')
+    conn.execute('''
+        INSERT INTO metricas_propietarios (propietario_id, propiedades, prospectos)
+        SELECT p.propietario_id, SUM(p.activo IS 1), COALESCE(SUM(m.prospectos), 0)
+        FROM propiedades p
+        LEFT JOIN metricas_propiedades m ON m.propiedad_id = p.id
+        WHERE p.propietario_id IS NOT NULL
+        GROUP BY p.propietario_id
+    ''')
+
+@app.cli.command('rebuild-metrics')
+def rebuild_metrics_command():
+    """Recalcula las métricas agregadas a partir de prospects y propiedades"""
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rebuild_metrics(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    click.echo("✅ Métricas recalculadas")
+
+def metrics_where(filtros):
+    """Filtros de la consola de prospectos traducidos a metricas_prospectos (granularidad diaria)"""
+    condiciones = []
+    params = []
+    for campo in ('fuente', 'idioma'):
+        if filtros.get(campo):
+            condiciones.append(f'{campo} = ?')
+            params.append(filtros[campo])
+    if filtros.get('desde'):
+        condiciones.append('dia >= ?')
+        params.append(filtros['desde'])
+    if filtros.get('hasta'):
+        condiciones.append('dia <= ?')
+        params.append(filtros['hasta'])
+    where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+    return where, params
+
+def get_metrics(dias=METRICAS_DIAS, top=METRICAS_TOP):
+    """Totales, prospectos por día/fuente/idioma de los últimos `dias` y rankings de propiedades y propietarios"""
+    hoy = datetime.now().date()
+    desde = hoy - timedelta(days=dias - 1)
+    metricas = {
+        'dias': dias,
+        'desde': desde.isoformat(),
+        'totales': {'prospectos': 0, 'prospectos_hoy': 0, 'prospectos_periodo': 0, 'propiedades': 0, 'propietarios': 0},
+        'por_dia': [],
+        'por_fuente': {},
+        'por_idioma': {},
+        'top_propiedades': [],
+        'top_propietarios': []
+    }
+    try:
+        conn = get_db()
+        totales = metricas['totales']
+        row = conn.execute('''
+            SELECT COALESCE(SUM(total), 0) AS prospectos,
+                   COALESCE(SUM(CASE WHEN dia = ? THEN total END), 0) AS prospectos_hoy,
+                   COALESCE(SUM(CASE WHEN dia >= ? THEN total END), 0) AS prospectos_periodo
+            FROM metricas_prospectos
+        ''', (hoy.isoformat(), desde.isoformat())).fetchone()
+        totales.update(dict(row))
+        totales['propiedades'] = conn.execute(
+            'SELECT COALESCE(SUM(propiedades), 0) FROM metricas_propietarios'
+        ).fetchone()[0]
+        totales['propietarios'] = conn.execute(
+            'SELECT COUNT(*) FROM propietarios WHERE activo = 1'
+        ).fetchone()[0]
+
+        # Días sin prospectos aparecen con 0 para graficar el periodo completo
+        por_dia = dict(conn.execute('''
+            SELECT dia, SUM(total) FROM metricas_prospectos
+            WHERE dia >= ? GROUP BY dia
+        ''', (desde.isoformat(),)).fetchall())
+        for i in range(dias):
+            dia = (desde + timedelta(days=i)).isoformat()
+            metricas['por_dia'].append({'dia': dia, 'total': por_dia.get(dia, 0)})
+
+        for campo in ('fuente', 'idioma'):
+            rows = conn.execute(f'''
+                SELECT {campo}, SUM(total) AS total FROM metricas_prospectos
+                WHERE dia >= ? GROUP BY {campo} ORDER BY total DESC
+            ''', (desde.isoformat(),)).fetchall()
+            metricas[f'por_{campo}'] = {(row[0] or 'sin_' + campo): row[1] for row in rows}
+
+        metricas['top_propiedades'] = [dict(row) for row in conn.execute('''
+            SELECT p.id, p.titulo_es, p.titulo_en, m.prospectos
+            FROM metricas_propiedades m
+            JOIN propiedades p ON p.id = m.propiedad_id
+            WHERE p.activo = 1 AND m.prospectos > 0
+            ORDER BY m.prospectos DESC
+            LIMIT ?
+        ''', (top,))]
+        metricas['top_propietarios'] = [dict(row) for row in conn.execute('''
+            SELECT pr.id, pr.nombre, m.propiedades, m.prospectos
+            FROM metricas_propietarios m
+            JOIN propietarios pr ON pr.id = m.propietario_id
+            WHERE pr.activo = 1
+            ORDER BY m.prospectos DESC
+            LIMIT ?
+        ''', (top,))]
+    except Exception as e:
+        print(f"Error obteniendo métricas: {e}")
+    return metricas
+
+# BÚSQUEDA DE PROPIEDADES
+PROPIEDADES_POR_PAGINA = 24
+
+def parse_price_range(filtro_precio):
+    """Convierte "min-max" en (min, max); max es None para el rango abierto"""
+    try:
+        min_p, max_p = filtro_precio.split('-')
+        min_p = int(min_p)
+        max_p = int(max_p)
+    except (ValueError, AttributeError):
+        return None
+    # "500000-1000000" es la opción "Más de Q500,000"
+    return (min_p, None) if max_p == 1000000 else (min_p, max_p)
+
+def encode_cursor(propiedad):
+    return f"{propiedad['fecha_creacion']}|{propiedad['id']}"
+
+def decode_cursor(cursor):
+    try:
+        fecha, propiedad_id = cursor.rsplit('|', 1)
+        return fecha, int(propiedad_id)
+    except (ValueError, AttributeError):
+        return None
+
+def fts_query(q):
+    """Convierte texto libre en una consulta FTS5 segura (cada palabra como prefijo)"""
+    palabras = re.findall(r'\w+', q or '')
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+def propiedades_search_sql(tipo='', ubicacion='', precio='', limit=PROPIEDADES_POR_PAGINA, offset=0, cursor=None, q=''):
+    """Construye el SELECT filtrado y paginado del listado público"""
+    where = ['p.activo = 1']
+    params = []
+
+    # Búsqueda de texto: ordena por relevancia (bm25) en vez de por fecha
+    busqueda = fts_query(q)
+    if busqueda:
+        where.append('propiedades_fts MATCH ?')
+        params.append(busqueda)
+
+    if tipo:
+        # Los valores del filtro son códigos ("casa") o nombres traducidos ("local comercial")
+        codigo = next(
+            (c for c, t in TIPO_TRANSLATIONS.items() if tipo in (c, t['es'].lower(), t['en'].lower())),
+            None
+        )
+        if codigo:
+            where.append('p.tipo = ?')
+            params.append(codigo)
+        else:
+            where.append('(unicode_lower(p.tipo_es) = ? OR unicode_lower(p.tipo_en) = ?)')
+            params.extend([tipo, tipo])
+
+    if ubicacion:
+        # Mismo criterio que el filtro en Python original: ambos lados con str.lower()
+        where.append('instr(unicode_lower(p.ubicacion), ?) > 0')
+        params.append(ubicacion)
+
+    rango = parse_price_range(precio) if precio else None
+    if rango:
+        # El rango viene en quetzales; se traduce a cada moneda para comparar
+        # montos enteros en su propia moneda con el índice (precio_moneda, precio_num)
+        min_p, max_p = rango
+        if max_p is None:
+            # "Más de ...": coincide con gran parte del catálogo, así que conviene
+            # recorrer el índice por fecha y cortar con el LIMIT
+            condiciones = []
+            for moneda, tasa in TIPOS_DE_CAMBIO.items():
+                condiciones.append('(p.precio_moneda = ? AND p.precio_num >= ?)')
+                params.extend([moneda, math.ceil(min_p / tasa)])
+            where.append('(' + ' OR '.join(condiciones) + ')')
+        else:
+            # Rango acotado: una búsqueda por rango en el índice por cada moneda
+            rangos = []
+            for moneda, tasa in TIPOS_DE_CAMBIO.items():
+                rangos.append(
+                    'SELECT id FROM propiedades WHERE activo = 1 '
+                    'AND precio_moneda = ? AND precio_num BETWEEN ? AND ?'
+                )
+                params.extend([moneda, math.ceil(min_p / tasa), math.floor(max_p / tasa)])
+            where.append('p.id IN (' + ' UNION ALL '.join(rangos) + ')')
+
+    # Paginación por keyset (cursor) o por desplazamiento (offset). Los resultados
+    # de búsqueda se ordenan por relevancia, así que solo admiten offset
+    posicion = decode_cursor(cursor) if cursor and not busqueda else None
+    if posicion:
+        where.append('(p.fecha_creacion < ? OR (p.fecha_creacion = ? AND p.id > ?))')
+        params.extend([posicion[0], posicion[0], posicion[1]])
+        offset = 0
+
+    if busqueda:
+        origen = 'propiedades_fts JOIN propiedades p ON p.id = propiedades_fts.rowid'
+        orden = 'propiedades_fts.rank, p.id'
+    else:
+        origen = 'propiedades p'
+        orden = 'p.fecha_creacion DESC, p.id'
+
+    sql = f'''
+        SELECT p.*, pr.nombre as propietario_nombre
+        FROM {origen}
+        LEFT JOIN propietarios pr ON p.propietario_id = pr.id
+        WHERE {' AND '.join(where)}
+        ORDER BY {orden}
+        LIMIT ? OFFSET ?
+    '''
+    params.extend([limit, offset])
+    return sql, tuple(params)
+
+def search_propiedades(tipo='', ubicacion='', precio='', limit=PROPIEDADES_POR_PAGINA, offset=0, cursor=None, q=''):
+    """Busca propiedades activas filtrando y paginando en SQL; retorna (propiedades, hay_mas)"""
+    try:
+        # Se pide una fila extra para saber si existe otra página
+        sql, params = propiedades_search_sql(tipo, ubicacion, precio, limit + 1, offset, cursor, q)
+        rows = get_db().execute(sql, params).fetchall()
+        propiedades = Propiedad.from_rows(rows[:limit])
+        return propiedades, len(rows) > limit
+    except Exception as e:
+        print(f"Error buscando propiedades: {e}")
+        return [], False
+
+HOT_QUERIES['listado_filtrado_tipo'] = propiedades_search_sql(tipo='casa', precio='100000-200000')
+HOT_QUERIES['listado_rango_precio'] = propiedades_search_sql(precio='100000-200000')
+HOT_QUERIES['listado_precio_minimo'] = propiedades_search_sql(precio='500000-1000000')
+HOT_QUERIES['listado_cursor'] = propiedades_search_sql(cursor='2024-01-01 00:00:00|10')
+
+# EXPORTACIÓN (CSV / NDJSON en streaming)
+EXPORT_ENTIDADES = ('prospectos', 'propietarios', 'propiedades')
+EXPORT_FORMATOS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+EXPORT_BATCH_SIZE = 500
+
+def export_query(entidad, args):
+    """SELECT y parámetros de una exportación, con los mismos filtros que sus pantallas"""
+    if entidad == 'prospectos':
+        where, params = prospects_where(prospect_filters(args))
+        return f'SELECT * FROM prospects {where} ORDER BY fecha DESC, id DESC', tuple(params)
+    if entidad == 'propietarios':
+        return 'SELECT * FROM propietarios WHERE activo = 1 ORDER BY nombre', ()
+    # LIMIT -1: sin límite en SQLite
+    return propiedades_search_sql(
+        tipo=args.get('tipo', '').strip().lower(),
+        ubicacion=args.get('ubicacion', '').strip().lower(),
+        precio=args.get('precio', '').strip(),
+        limit=-1,
+        q=args.get('q', '').strip()
+    )
+
+def export_batches(pool, sql, params):
+    """Primero las columnas y luego lotes de filas leídos del cursor; memoria constante"""
+    # La respuesta se sigue generando después de la vista al ritmo del cliente: una
+    # conexión fuera del pool evita que una descarga lenta ocupe un lugar del pool
+    with pool.reader() as conn:
+        cursor = conn.execute(sql, params)
+        yield [d[0] for d in cursor.description]
+        while True:
+            filas = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not filas:
+                break
+            yield filas
+
+def csv_chunks(lotes):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')  # BOM para que Excel detecte UTF-8
+    writer.writerow(next(lotes))
+    for filas in lotes:
+        writer.writerows(filas)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def ndjson_chunks(lotes):
+    columnas = next(lotes)
+    for filas in lotes:
+        lineas = []
+        for fila in filas:
+            registro = dict(zip(columnas, fila))
+            if 'imagenes' in registro:
+                try:
+                    registro['imagenes'] = json.loads(registro['imagenes'] or '[]')
+                except json.JSONDecodeError:
+                    pass
+            lineas.append(json.dumps(registro, ensure_ascii=False))
+        yield ('\n'.join(lineas) + '\n').encode('utf-8')
+
+def gzip_chunks(chunks):
+    """Comprime al vuelo, bloque por bloque (formato gzip)"""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        datos = compresor.compress(chunk)
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+HOT_QUERIES['busqueda_texto'] = propiedades_search_sql(q='casa antigua', tipo='casa')
+
 # RUTAS PÚBLICAS
 @app.route('/')
 def home():
@@ -609,86 +4068,265 @@ def propiedades_list():
         session['language'] = lang
     else:
         lang = session.get('language', 'espanol')
-    
-    print(f"IDIOMA ACTUAL: {lang}")  # Para debug
+
+    validadores = None
+    revision = get_catalog_revision()
+    if revision:
+        validadores = page_validators(revision, lang)
+        respuesta = not_modified(*validadores)
+        if respuesta:
+            return respuesta
+
+    clave = page_cache_key(lang)
+    respuesta = cached_page(clave, 'listado')
+    if respuesta:
+        return with_validators(respuesta, *validadores) if validadores else respuesta
 
     filtro_tipo = request.args.get('tipo', '').strip().lower()
     filtro_ubicacion = request.args.get('ubicacion', '').strip().lower()
     filtro_precio = request.args.get('precio', '').strip()
+    busqueda = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    page = max(page, 1)
 
-    propiedades = get_all_propiedades()
+    propiedades, hay_mas = search_propiedades(
+        tipo=filtro_tipo,
+        ubicacion=filtro_ubicacion,
+        precio=filtro_precio,
+        limit=PROPIEDADES_POR_PAGINA,
+        offset=(page - 1) * PROPIEDADES_POR_PAGINA,
+        q=busqueda
+    )
 
-    def parse_price(raw_price):
-        if not raw_price:
-            return 0
-        clean = (
-            str(raw_price)
-            .replace("$", "")
-            .replace("Q", "")
-            .replace("€", "")
-            .replace(",", "")
-            .replace(" ", "")
-            .strip()
-        )
-        try:
-            return int(float(clean))
-        except:
-            return 0
+    # Enlaces de paginación conservando los filtros actuales
+    args = request.args.to_dict()
+    args.pop('page', None)
+    args.pop('parcial', None)
+    pagina_anterior = url_for('propiedades_list', page=page - 1, **args) if page > 1 else None
+    pagina_siguiente = url_for('propiedades_list', page=page + 1, **args) if hay_mas else None
 
-    propiedades_filtradas = []
+    attach_variantes(propiedades, solo_portada=True)
 
-    for p in propiedades:
+    # Solo se renderiza el idioma activo; ?parcial=1 entrega ese bloque para el
+    # selector de idioma del cliente (la clave de caché ya incluye idioma y argumentos)
+    plantilla = 'partials/propiedades_contenido.html' if request.args.get('parcial') == '1' else 'propiedades_list.html'
+    html = render_template(
+        plantilla,
+        language=lang,
+        propiedades=propiedades,
+        filtro_tipo=filtro_tipo,
+        filtro_ubicacion=filtro_ubicacion,
+        filtro_precio=filtro_precio,
+        busqueda=busqueda,
+        page=page,
+        pagina_anterior=pagina_anterior,
+        pagina_siguiente=pagina_siguiente
+    )
+    respuesta = cache_page(clave, 'listado', html)
+    return with_validators(respuesta, *validadores) if validadores else respuesta
 
-        tipo_es = (p.get('tipo_es') or '').lower()
-        tipo_en = (p.get('tipo_en') or '').lower()
-        ubicacion = (p.get('ubicacion') or '').lower()
-        precio = parse_price(p.get('precio'))
+@app.route('/propiedades/buscar')
+def buscar_propiedades():
+    """Búsqueda de texto completo en JSON (mismos filtros que el listado)"""
+    busqueda = request.args.get('q', '').strip()
+    if not fts_query(busqueda):
+        return jsonify({'success': False, 'error': 'Parámetro q requerido'}), 400
 
-        if filtro_tipo and filtro_tipo != tipo_es and filtro_tipo != tipo_en:
-            continue
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    page = max(request.args.get('page', 1, type=int), 1)
 
-        if filtro_ubicacion and filtro_ubicacion not in ubicacion:
-            continue
+    propiedades, hay_mas = search_propiedades(
+        tipo=request.args.get('tipo', '').strip().lower(),
+        ubicacion=request.args.get('ubicacion', '').strip().lower(),
+        precio=request.args.get('precio', '').strip(),
+        limit=limit,
+        offset=(page - 1) * limit,
+        q=busqueda
+    )
 
-        if filtro_precio:
-            try:
-                min_p, max_p = filtro_precio.split('-')
-                min_p = int(min_p)
-                max_p = int(max_p)
-
-                if max_p == 1000000:
-                    if precio < min_p:
-                        continue
-                else:
-                    if not (min_p <= precio <= max_p):
-                        continue
-            except:
-                pass
+    return jsonify({
+        'success': True,
+        'page': page,
+        'hay_mas': hay_mas,
+        'resultados': [{
+            'id': p['id'],
+            'titulo_es': p['titulo_es'],
+            'titulo_en': p['titulo_en'],
+            'ubicacion': p['ubicacion'],
+            'precio': p['precio'],
+            'tipo': p['tipo'],
+            'imagen': url_for('static', filename=p['imagenes'][0]) if p['imagenes'] else None,
+            'url': url_for('propiedad_detalle', propiedad_id=p['id'])
+        } for p in propiedades]
+    })
 
-        propiedades_filtradas.append(p)
+# API JSON v1
+API_LIMIT_MAX = 100
+API_CAMPOS_POR_DEFECTO = ('id', 'titulo', 'precio', 'ubicacion', 'tipo', 'estado', 'portada', 'url')
 
-    return render_template(
-        'propiedades_list.html',
-        propiedades=propiedades_filtradas,
-        filtro_tipo=filtro_tipo,
-        filtro_ubicacion=filtro_ubicacion,
-        filtro_precio=filtro_precio
+def _api_portada(p, lang):
+    if not p['imagenes']:
+        return None
+    # Miniatura más pequeña de la primera imagen, o el original si aún no tiene variantes
+    formatos = p.get('variantes', {}).get(p['imagenes'][0], {}).get('formatos', {})
+    for formato in ('webp', 'jpeg'):
+        if formatos.get(formato):
+            return url_for('static', filename=formatos[formato][0][1])
+    return url_for('static', filename=p['imagenes'][0])
+
+API_CAMPOS = {
+    'id': lambda p, lang: p['id'],
+    'titulo': lambda p, lang: p[f'titulo_{lang}'],
+    'descripcion': lambda p, lang: p[f'descripcion_{lang}'],
+    'precio': lambda p, lang: p['precio'],
+    # Los valores ya normalizados al guardar: los mismos que usan los filtros de precio
+    'monto': lambda p, lang: p['precio_num'],
+    'moneda': lambda p, lang: p['precio_moneda'],
+    'ubicacion': lambda p, lang: p['ubicacion'],
+    'tipo': lambda p, lang: p['tipo'],
+    'tipo_nombre': lambda p, lang: p[f'tipo_{lang}'],
+    'estado': lambda p, lang: p['estado'],
+    'whatsapp': lambda p, lang: p['whatsapp'],
+    'fecha': lambda p, lang: p['fecha_creacion'],
+    'portada': _api_portada,
+    'imagenes': lambda p, lang: [url_for('static', filename=ruta) for ruta in p['imagenes']],
+    'url': lambda p, lang: url_for('propiedad_detalle', propiedad_id=p['id']),
+}
+
+def api_language():
+    """Idioma de la API: ?lang=es|en (o espanol|ingles); si no, el de la sesión"""
+    lang = request.args.get('lang', '').lower()
+    if lang in ('es', 'espanol'):
+        return 'es'
+    if lang in ('en', 'ingles'):
+        return 'en'
+    return 'en' if session.get('language') == 'ingles' else 'es'
+
+def api_fields():
+    """Campos pedidos en ?fields=id,titulo,...; retorna (campos, desconocidos)"""
+    pedidos = [c.strip() for c in request.args.get('fields', '').split(',') if c.strip()]
+    if not pedidos:
+        return API_CAMPOS_POR_DEFECTO, []
+    return tuple(dict.fromkeys(c for c in pedidos if c in API_CAMPOS)), [c for c in pedidos if c not in API_CAMPOS]
+
+def serialize_propiedad(p, lang, campos):
+    return {campo: API_CAMPOS[campo](p, lang) for campo in campos}
+
+def api_response(datos, status=200):
+    """JSON compacto (sin espacios ni escapes de acentos)"""
+    cuerpo = json.dumps(datos, ensure_ascii=False, separators=(',', ':'))
+    return Response(cuerpo, status=status, mimetype='application/json')
+
+def api_error(mensaje, status):
+    return api_response({'error': mensaje}, status)
+
+@app.route('/api/v1/propiedades')
+def api_propiedades():
+    """Listado de propiedades activas con filtros, campos (?fields=), idioma (?lang=) y ?cursor="""
+    campos, desconocidos = api_fields()
+    if desconocidos:
+        return api_error(f"Campos desconocidos: {', '.join(desconocidos)}", 400)
+    lang = api_language()
+    limit = min(max(request.args.get('limit', PROPIEDADES_POR_PAGINA, type=int), 1), API_LIMIT_MAX)
+    busqueda = request.args.get('q', '').strip()
+
+    # Cursor opaco: "fecha|id" recorre el índice; con búsqueda de texto (orden por
+    # relevancia) es "o:desplazamiento"
+    cursor = request.args.get('cursor', '')
+    offset = 0
+    if cursor.startswith('o:') and cursor[2:].isdigit():
+        offset, cursor = int(cursor[2:]), None
+    elif cursor and not decode_cursor(cursor):
+        return api_error('Cursor inválido', 400)
+
+    validadores = None
+    revision = get_catalog_revision()
+    if revision:
+        validadores = page_validators(revision, lang)
+        respuesta = not_modified(*validadores)
+        if respuesta:
+            return respuesta
+
+    propiedades, hay_mas = search_propiedades(
+        tipo=request.args.get('tipo', '').strip().lower(),
+        ubicacion=request.args.get('ubicacion', '').strip().lower(),
+        precio=request.args.get('precio', '').strip(),
+        limit=limit,
+        offset=offset,
+        cursor=cursor or None,
+        q=busqueda
     )
+    if 'portada' in campos:
+        attach_variantes(propiedades, solo_portada=True)
+
+    siguiente = None
+    if hay_mas and propiedades:
+        siguiente = f"o:{offset + limit}" if fts_query(busqueda) else encode_cursor(propiedades[-1])
+
+    respuesta = api_response({
+        'data': [serialize_propiedad(p, lang, campos) for p in propiedades],
+        'next_cursor': siguiente
+    })
+    return with_validators(respuesta, *validadores) if validadores else respuesta
+
+@app.route('/api/v1/propiedades/<int:propiedad_id>')
+def api_propiedad(propiedad_id):
+    """Detalle de una propiedad activa; todos los campos salvo que se pida ?fields="""
+    campos, desconocidos = api_fields()
+    if desconocidos:
+        return api_error(f"Campos desconocidos: {', '.join(desconocidos)}", 400)
+    if not request.args.get('fields'):
+        campos = tuple(API_CAMPOS)
+    lang = api_language()
+
+    revision = get_propiedad_revision(propiedad_id)
+    if not revision:
+        return api_error('Propiedad no encontrada', 404)
+    validadores = page_validators(revision, lang)
+    respuesta = not_modified(*validadores)
+    if respuesta:
+        return respuesta
+
+    propiedad = get_propiedad_by_id(propiedad_id)
+    if not propiedad:
+        return api_error('Propiedad no encontrada', 404)
+    if 'portada' in campos:
+        attach_variantes([propiedad], solo_portada=True)
+
+    respuesta = api_response({'data': serialize_propiedad(propiedad, lang, campos)})
+    return with_validators(respuesta, *validadores)
 
 # SOLO UNA DEFINICIÓN DE propiedad_detalle
 @app.route('/propiedad/<int:propiedad_id>')
 def propiedad_detalle(propiedad_id):
     """Landing page individual dinámica para cada propiedad"""
-    propiedad = get_propiedad_by_id(propiedad_id)
-    if not propiedad:
-        return "Propiedad no encontrada", 404
-    
 # Detectar idioma del navegador
     if 'language' not in session:
         browser_lang = request.accept_languages.best_match(['es', 'en'])
         session['language'] = 'espanol' if browser_lang == 'es' else 'ingles'
-    
-    return render_template('propiedad_landing.html', propiedad=propiedad)
+
+    revision = get_propiedad_revision(propiedad_id)
+    if not revision:
+        return "Propiedad no encontrada", 404
+
+    validadores = page_validators(revision, session['language'])
+    respuesta = not_modified(*validadores)
+    if respuesta:
+        return respuesta
+
+    clave = page_cache_key(session['language'])
+    etiqueta = f'propiedad:{propiedad_id}'
+    respuesta = cached_page(clave, etiqueta)
+    if respuesta:
+        return with_validators(respuesta, *validadores)
+
+    propiedad = get_propiedad_by_id(propiedad_id)
+    if not propiedad:
+        return "Propiedad no encontrada", 404
+
+    attach_variantes([propiedad])
+    html = render_template('propiedad_landing.html', propiedad=propiedad)
+    return with_validators(cache_page(clave, etiqueta, html), *validadores)
 
 # CONFIGURACIÓN DE IDIOMA GLOBAL 
 @app.route('/set_language/<language>')
@@ -718,24 +4356,21 @@ def prospect_form():
             fuente = request.form.get('fuente', 'direct')
             propiedad_id = request.form.get('propiedad_id', '')
             
-            # Obtener información de la propiedad si existe
-            propiedad_info = ''
-            if propiedad_id:
-                propiedad_obj = get_propiedad_by_id(propiedad_id)
-                if propiedad_obj:
-                    propiedad_info = f"{propiedad_obj['titulo_es']} (ID: {propiedad_id})"
-            
+            # El título de la propiedad se resuelve al escribir el lote
             prospecto = {
                 'nombre': nombre,
                 'email': email,
                 'telefono': telefono,
                 'fuente': fuente,
-                'propiedad': propiedad_info or 'Interés general',
                 'propiedad_id': propiedad_id,
                 'idioma': language
             }
             
-            if save_prospect(prospecto):
+            guardado = (
+                get_lead_writer().submit(prospecto) if app.config['LEAD_BATCHING']
+                else save_prospect(prospecto)
+            )
+            if guardado:
                 return redirect(url_for('thank_you'))
             else:
                 return "Error al guardar el prospecto", 500
@@ -766,8 +4401,17 @@ def crm_login():
         username = request.form['username']
         password = request.form['password']
         
-        user = verify_crm_user(username, password)
+        permitido, espera = login_allowed(username)
+        if not permitido:
+            segundos = math.ceil(espera)
+            return render_template('crm_login.html', error='bloqueado', espera=segundos), 429, {'Retry-After': str(segundos)}
+        try:
+            user = verify_crm_user(username, password)
+        except AuthBusy:
+            return render_template('crm_login.html', error='ocupado'), 503, {'Retry-After': '1'}
         if user:
+            rotate_session()
+            session['crm_auth'] = user.pop('huella')
             session['crm_logged_in'] = True
             session['crm_user'] = user
             return redirect(url_for('crm_dashboard'))
@@ -785,6 +4429,7 @@ def crm_dashboard():
     propietarios = get_all_propietarios()
     return render_template('crm_dashboard.html', 
                          propietarios=propietarios, 
+                         metricas=get_metrics(),
                          user=session.get('crm_user'))
 
 @app.route('/crm/propietarios', methods=['GET', 'POST'])
@@ -861,8 +4506,7 @@ def crm_editar_propietario(propietario_id):
         else:
             return "Error al actualizar propietario", 500
     
-    propietarios = get_all_propietarios()
-    propietario_actual = next((p for p in propietarios if p['id'] == propietario_id), None)
+    propietario_actual = get_propietario_by_id(propietario_id)
     
     if not propietario_actual:
         return "Propietario no encontrado", 404
@@ -886,14 +4530,11 @@ def crm_detalle_propietario(propietario_id):
     if not session.get('crm_logged_in'):
         return redirect(url_for('crm_login'))
     
-    propietarios = get_all_propietarios()
-    propietario_actual = next((p for p in propietarios if p['id'] == propietario_id), None)
+    propietario_actual, propiedades_propietario = get_propietario_con_propiedades(propietario_id)
     
     if not propietario_actual:
         return "Propietario no encontrado", 404
     
-    propiedades_propietario = get_propiedades_by_propietario(propietario_id)
-    
     return render_template('crm_detalle_propietario.html',
                          propietario=propietario_actual,
                          propiedades=propiedades_propietario)
@@ -1001,8 +4642,7 @@ def crm_editar_propiedad(propiedad_id):
         else:
             return "Error al actualizar propiedad", 500
     
-    propiedades = get_all_propiedades()
-    propiedad_actual = next((p for p in propiedades if p['id'] == propiedad_id), None)
+    propiedad_actual = get_propiedad_by_id(propiedad_id)
     
     if not propiedad_actual:
         return "Propiedad no encontrada", 404
@@ -1028,6 +4668,7 @@ def crm_logout():
     """Logout del CRM"""
     session.pop('crm_logged_in', None)
     session.pop('crm_user', None)
+    session.pop('crm_auth', None)
     return redirect(url_for('home'))
 
 # RUTAS DE PROSPECTOS (SIMPLIFICADO)
@@ -1037,12 +4678,157 @@ def admin_prospectos():
     if not session.get('crm_logged_in'):
         return redirect(url_for('crm_login'))
     
-    prospects = load_prospects()
-    return render_template('admin_prospectos.html', prospects=prospects)
+    filtros = prospect_filters(request.args)
+    despues = request.args.get('despues')
+    antes = request.args.get('antes')
+    prospects, hay_mas = search_prospects(filtros, PROSPECTOS_POR_PAGINA, despues=despues, antes=antes)
+
+    # Enlaces por keyset conservando los filtros actuales
+    args = {k: v for k, v in request.args.items() if k not in ('despues', 'antes') and v}
+    retrocediendo = bool(antes and not despues)
+    pagina_anterior = pagina_siguiente = None
+    if prospects:
+        if (despues and not retrocediendo) or (retrocediendo and hay_mas):
+            pagina_anterior = url_for('admin_prospectos', antes=encode_prospect_cursor(prospects[0]), **args)
+        if retrocediendo or hay_mas:
+            pagina_siguiente = url_for('admin_prospectos', despues=encode_prospect_cursor(prospects[-1]), **args)
+
+    return render_template(
+        'admin_prospectos.html',
+        prospects=prospects,
+        stats=prospect_stats(filtros),
+        filtros=filtros,
+        fuentes=FUENTES_PROSPECTO,
+        pagina_anterior=pagina_anterior,
+        pagina_siguiente=pagina_siguiente,
+        primera_pagina=url_for('admin_prospectos', **args) if pagina_anterior else None
+    )
+
+@app.route('/crm/export_<entidad>')
+def crm_export(entidad):
+    """Descarga CSV o NDJSON (?formato=) de prospectos, propietarios o propiedades; ?gzip=1 comprime"""
+    if not session.get('crm_logged_in'):
+        return redirect(url_for('crm_login'))
+    if entidad not in EXPORT_ENTIDADES:
+        return "Exportación no encontrada", 404
+
+    formato = request.args.get('formato', 'csv')
+    if formato not in EXPORT_FORMATOS:
+        return "Formato no soportado", 400
+
+    sql, params = export_query(entidad, request.args)
+    lotes = export_batches(get_pool(), sql, params)
+    chunks = csv_chunks(lotes) if formato == 'csv' else ndjson_chunks(lotes)
+
+    nombre = f"{entidad}_{datetime.now().strftime('%Y%m%d_%H%M')}.{formato}"
+    mimetype = EXPORT_FORMATOS[formato]
+    if request.args.get('gzip') == '1':
+        chunks = gzip_chunks(chunks)
+        nombre += '.gz'
+        mimetype = 'application/gzip'
+
+    return Response(chunks, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{nombre}"',
+        'Cache-Control': 'no-store'
+    })
+
+@app.route('/crm/importar', methods=['POST'])
+def crm_importar():
+    """Importación masiva: JSON {propietarios, propiedades} o archivo JSON/CSV (campo archivo, ?entidad=)"""
+    if not session.get('crm_logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    entidad = request.values.get('entidad', 'propiedades')
+    validar = request.values.get('validar') == '1'
+    try:
+        if request.is_json:
+            propietarios, propiedades = split_import_records(request.get_json(), entidad)
+        elif 'archivo' in request.files:
+            archivo = request.files['archivo']
+            propietarios, propiedades = parse_import_file(archivo.read(), archivo.filename or '', entidad)
+        else:
+            return jsonify({'success': False, 'error': 'No hay datos para importar'}), 400
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'success': False, 'error': f'Archivo inválido: {e}'}), 400
+
+    try:
+        resultado = import_records(get_db(), propietarios, propiedades, validar=validar)
+    except Exception as e:
+        print(f"Error en importación masiva: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'validacion': validar, **resultado})
+
+@app.route('/crm/db_pool')
+def crm_db_pool():
+    """Ocupación y tiempos de espera del pool de conexiones de este worker"""
+    if not session.get('crm_logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+    return jsonify(get_pool().stats())
+
+@app.route('/crm/leads')
+def crm_leads():
+    """Profundidad de la cola, tamaño de lotes y latencia de la ingesta de prospectos de este worker"""
+    if not session.get('crm_logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+    return jsonify(get_lead_writer().stats())
+
+@app.route('/crm/metricas')
+def crm_metricas():
+    """Métricas agregadas del dashboard; ?dias=N define el periodo"""
+    if not session.get('crm_logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+    dias = min(max(request.args.get('dias', METRICAS_DIAS, type=int), 1), METRICAS_DIAS_MAX)
+    return jsonify(get_metrics(dias))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Métricas de este worker en formato de texto de Prometheus (sesión CRM o token)"""
+    token = app.config['METRICS_TOKEN']
+    autorizado = session.get('crm_logged_in') or (
+        token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+    )
+    if not autorizado:
+        return Response('No autorizado\n', status=401, mimetype='text/plain')
+    cuerpo = get_request_metrics().render(runtime_gauges())
+    return Response(cuerpo, mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/crm/page_cache')
+def crm_page_cache():
+    """Aciertos, fallos y ocupación de la caché de páginas de este worker"""
+    if not session.get('crm_logged_in'):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+    return jsonify(get_page_cache().stats())
 
 # INICIALIZACIÓN
-init_db()
-create_default_crm_user()
+def configure_app():
+    """Aplica los ajustes que reemplazan objetos de la app en vez de leerse en cada petición"""
+    # Se puede llamar varias veces: ProxyFix envuelve siempre la aplicación WSGI original
+    wsgi = app.wsgi_app.app if isinstance(app.wsgi_app, ProxyFix) else app.wsgi_app
+    saltos = app.config['TRUSTED_PROXY_HOPS']
+    app.wsgi_app = ProxyFix(wsgi, x_for=saltos, x_proto=saltos) if saltos else wsgi
+    if app.config['SESSION_BACKEND'] == 'servidor':
+        app.session_interface = ServerSessionInterface()
+    else:
+        app.session_interface = SecureCookieSessionInterface()
+    if not app.config['PAGE_CACHE_VERSION']:
+        app.config['PAGE_CACHE_VERSION'] = templates_fingerprint()
+
+configure_app()  # "flask --app app" y los scripts usan el módulo directamente
+
+def create_app(config=None):
+    """Fábrica para gunicorn ("app:create_app()") y herramientas: configura sin abrir la base"""
+    if config:
+        app.config.update(config)
+    configure_app()
+    return app
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Aplica migraciones pendientes y crea el usuario CRM por defecto (paso de despliegue)"""
+    inicio = time.perf_counter()
+    get_db()
+    click.echo(f"✅ Base {get_db_path()} en versión {get_schema_version(get_db())} "
+               f"({(time.perf_counter() - inicio) * 1000:.0f} ms)")
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
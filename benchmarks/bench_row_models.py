@@ -0,0 +1,109 @@
+"""Benchmark: filas de propiedades como dict armado por posición (antes) vs modelo Propiedad (__slots__)
+
+Uso: python benchmarks/bench_row_models.py [filas]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Base de datos temporal: no toca terrazen.db
+DIRECTORIO = tempfile.mkdtemp(prefix='bench_terrazen_')
+os.environ['DATABASE_PATH'] = os.path.join(DIRECTORIO, 'bench.db')
+os.environ['PAGE_CACHE_PATH'] = os.path.join(DIRECTORIO, 'cache.db')
+os.environ['JOB_WORKERS'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as terrazen  # noqa: E402
+
+def legacy_dict(row):
+    """Copia del armado anterior (get_all_propiedades antes del modelo)"""
+    imagenes_json = row[12] if len(row) > 12 else '[]'
+    try:
+        imagenes = json.loads(imagenes_json) if imagenes_json and imagenes_json != '[]' else []
+    except json.JSONDecodeError:
+        imagenes = []
+    return {
+        'id': row[0],
+        'propietario_id': row[1],
+        'titulo_es': row[2],
+        'descripcion_es': row[3],
+        'titulo_en': row[4],
+        'descripcion_en': row[5],
+        'precio': row[6],
+        'ubicacion': row[7],
+        'tipo': row[8],
+        'tipo_es': row[9],
+        'tipo_en': row[10],
+        'estado': row[11],
+        'imagenes': imagenes,
+        'whatsapp': row[13],
+        'fecha_creacion': row[14],
+        'propietario_nombre': row['propietario_nombre'] or ''
+    }
+
+def legacy(filas):
+    return [legacy_dict(row) for row in filas]
+
+def modelo(filas):
+    return terrazen.Propiedad.from_rows(filas)
+
+def modelo_con_imagenes(filas):
+    propiedades = terrazen.Propiedad.from_rows(filas)
+    for propiedad in propiedades:
+        propiedad.imagenes
+    return propiedades
+
+def cargar_filas(conn, cantidad):
+    propietario = conn.execute(
+        "INSERT INTO propietarios (nombre, email, telefono, fecha_registro) VALUES ('Bench', '', '', '2024-01-01 00:00:00')"
+    ).lastrowid
+    imagenes = json.dumps([f"uploads/{i:064x}.jpg" for i in range(5)])
+    conn.executemany('''
+        INSERT INTO propiedades (propietario_id, titulo_es, descripcion_es, titulo_en, descripcion_en, precio,
+                                 ubicacion, tipo, tipo_es, tipo_en, estado, imagenes, whatsapp, fecha_creacion)
+        VALUES (?, ?, ?, ?, ?, 'Q100,000', 'Antigua', 'casa', 'Casa', 'House', 'disponible', ?, '', '2024-01-01 00:00:00')
+    ''', [(propietario, f'Casa {i}', 'Descripción ' * 20, f'House {i}', 'Description ' * 20, imagenes)
+          for i in range(cantidad)])
+    conn.commit()
+    return conn.execute('''
+        SELECT p.*, pr.nombre as propietario_nombre
+        FROM propiedades p LEFT JOIN propietarios pr ON p.propietario_id = pr.id
+        WHERE p.activo = 1
+    ''').fetchall()
+
+def medir(construir, filas, repeticiones=5):
+    """(µs por fila, mejor de N; bytes retenidos por fila)"""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        construir(filas)
+        mejor = min(mejor, time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    resultado = construir(filas)
+    retenidos = tracemalloc.get_traced_memory()[0] - antes
+    tracemalloc.stop()
+    del resultado
+    return mejor / len(filas) * 1e6, retenidos / len(filas)
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with terrazen.app.app_context():
+        filas = cargar_filas(terrazen.get_db(), cantidad)
+
+    print(f"{cantidad} filas de propiedades (5 imágenes cada una)")
+    print(f"{'construcción':<28}{'µs/fila':>10}{'bytes/fila':>12}")
+    for nombre, construir in (
+        ('dict por posición (antes)', legacy),
+        ('Propiedad', modelo),
+        ('Propiedad + imagenes', modelo_con_imagenes),
+    ):
+        tiempo, memoria = medir(construir, filas)
+        print(f"{nombre:<28}{tiempo:>10.2f}{memoria:>12.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""Benchmark de rutas públicas y del CRM: latencia p50/p95/p99 y throughput por escenario
+
+Uso:
+    python benchmarks/bench_rutas.py --escala 1k                      # cliente de pruebas de Flask
+    python benchmarks/bench_rutas.py --escala 50k --modo gunicorn --workers 4 --concurrencia 16
+    python benchmarks/bench_rutas.py --escala 1k --guardar-base       # guarda la línea base
+    python benchmarks/bench_rutas.py --escala 1k --comparar           # compara contra la línea base
+
+Escalas: 1k, 50k y 500k propiedades y prospectos (benchmarks/datos.py). La base sembrada se
+genera una vez en benchmarks/.datos/ y cada corrida trabaja sobre una copia. Las líneas base se
+guardan en benchmarks/baselines/<escala>-<modo>.json; --comparar termina con código 1 si el p95
+de algún escenario empeora más que --tolerancia.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRECTORIO_BASES = os.path.join(RAIZ, 'benchmarks', 'baselines')
+CRM_USUARIO = ('admin', 'admin123')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--escala', default='1k', help='1k, 50k o 500k')
+    parser.add_argument('--modo', choices=('cliente', 'gunicorn'), default='cliente')
+    parser.add_argument('--peticiones', type=int, default=200, help='peticiones medidas por escenario')
+    parser.add_argument('--calentamiento', type=int, default=10, help='peticiones descartadas por escenario')
+    parser.add_argument('--workers', type=int, default=4, help='workers de gunicorn')
+    parser.add_argument('--concurrencia', type=int, default=8, help='clientes simultáneos (modo gunicorn)')
+    parser.add_argument('--escenarios', default='', help='lista separada por comas (por defecto todos)')
+    parser.add_argument('--sin-cache', action='store_true', help='desactiva la caché de páginas')
+    parser.add_argument('--regenerar', action='store_true', help='vuelve a sembrar la base de la escala')
+    parser.add_argument('--guardar-base', action='store_true', help='guarda el resultado como línea base')
+    parser.add_argument('--comparar', action='store_true', help='compara contra la línea base guardada')
+    parser.add_argument('--tolerancia', type=float, default=0.10, help='empeoramiento de p95 tolerado (0.10 = 10%%)')
+    return parser.parse_args()
+
+# ESCENARIOS
+# nombre -> función(rng, datos) que retorna (método, ruta, formulario o None); datos viene de cargar_datos()
+FILTROS_TIPO = ('', 'terreno', 'casa', 'apartamento', 'oficina')
+FILTROS_UBICACION = ('', 'antigua', 'guatemala', 'monterrico')
+FILTROS_PRECIO = ('', '1-100000', '100000-200000', '200000-500000', '500000-1000000')
+BUSQUEDAS = ('casa', 'antigua', 'vista', 'terreno atitlan', 'remodelado', 'land', 'exclusive')
+
+def _listado_filtros(rng, datos):
+    args = {
+        'tipo': rng.choice(FILTROS_TIPO),
+        'ubicacion': rng.choice(FILTROS_UBICACION),
+        'precio': rng.choice(FILTROS_PRECIO),
+        'page': rng.choice((1, 1, 1, 2, 3)),
+    }
+    return 'GET', '/propiedades?' + urlencode({k: v for k, v in args.items() if v}), None
+
+def _prospecto(rng, datos):
+    formulario = {
+        'nombre': f"Bench {rng.randint(1, 10 ** 6)}",
+        'email': 'bench@ejemplo.com',
+        'telefono': f"5{rng.randint(0, 9999999):07d}",
+        'fuente': rng.choice(('landing', 'whatsapp', 'fb')),
+        'propiedad_id': str(rng.choice(datos['propiedades'])),
+    }
+    return 'POST', '/prospecto', formulario
+
+ESCENARIOS = {
+    'listado': lambda rng, datos: ('GET', '/propiedades', None),
+    'listado_ingles': lambda rng, datos: ('GET', '/propiedades?lang=ingles', None),
+    'listado_filtros': _listado_filtros,
+    'busqueda': lambda rng, datos: ('GET', '/propiedades?' + urlencode({'q': rng.choice(BUSQUEDAS)}), None),
+    'detalle': lambda rng, datos: ('GET', f"/propiedad/{rng.choice(datos['propiedades'])}", None),
+    'api_listado': lambda rng, datos: ('GET', '/api/v1/propiedades?' + urlencode({'tipo': rng.choice(FILTROS_TIPO), 'limit': 24}), None),
+    'prospecto_post': _prospecto,
+    'crm_dashboard': lambda rng, datos: ('GET', '/crm/dashboard', None),
+    'crm_propiedades': lambda rng, datos: ('GET', '/crm/propiedades', None),
+    'crm_prospectos': lambda rng, datos: ('GET', '/prospectos?' + urlencode({'fuente': rng.choice(('', 'landing', 'whatsapp'))}), None),
+    'crm_propietario': lambda rng, datos: ('GET', f"/crm/propietarios/{rng.choice(datos['propietarios'])}", None),
+    'crm_editar_propiedad': lambda rng, datos: ('GET', f"/crm/propiedades/editar/{rng.choice(datos['propiedades'])}", None),
+}
+
+def cargar_datos(ruta_db):
+    """Ids existentes para armar las rutas de detalle (muestra acotada)"""
+    conn = sqlite3.connect(ruta_db)
+    try:
+        return {
+            'propiedades': [r[0] for r in conn.execute('SELECT id FROM propiedades WHERE activo = 1 ORDER BY random() LIMIT 2000')],
+            'propietarios': [r[0] for r in conn.execute('SELECT id FROM propietarios WHERE activo = 1 ORDER BY random() LIMIT 500')],
+        }
+    finally:
+        conn.close()
+
+def resumir(latencias, segundos, errores):
+    ordenadas = sorted(latencias)
+    cuantiles = statistics.quantiles(ordenadas, n=100, method='inclusive') if len(ordenadas) > 1 else ordenadas * 99
+    return {
+        'peticiones': len(ordenadas),
+        'errores': errores,
+        'p50_ms': round(cuantiles[49] * 1000, 3),
+        'p95_ms': round(cuantiles[94] * 1000, 3),
+        'p99_ms': round(cuantiles[98] * 1000, 3),
+        'max_ms': round(ordenadas[-1] * 1000, 3),
+        'req_s': round(len(ordenadas) / segundos, 1) if segundos else 0,
+    }
+
+# CLIENTE DE PRUEBAS DE FLASK (un proceso, secuencial: latencia de la aplicación sin red)
+def correr_cliente(args, ruta_db, escenarios, datos):
+    os.environ['DATABASE_PATH'] = ruta_db
+    import app as terrazen
+
+    terrazen.app.config['DATABASE'] = ruta_db
+    if args.sin_cache:
+        terrazen.app.config['PAGE_CACHE_ENABLED'] = False
+    cliente = terrazen.app.test_client()
+    cliente.post('/crm/login', data=dict(zip(('username', 'password'), CRM_USUARIO)))
+    if cliente.get('/crm/dashboard').status_code != 200:
+        sys.exit('No se pudo iniciar sesión en el CRM con el usuario por defecto')
+
+    resultados = {}
+    for nombre in escenarios:
+        rng = random.Random(nombre)
+        latencias = []
+        errores = 0
+        for i in range(args.calentamiento + args.peticiones):
+            metodo, ruta, formulario = ESCENARIOS[nombre](rng, datos)
+            inicio = time.perf_counter()
+            respuesta = cliente.open(ruta, method=metodo, data=formulario)
+            respuesta.get_data()
+            duracion = time.perf_counter() - inicio
+            if i >= args.calentamiento:
+                latencias.append(duracion)
+                errores += respuesta.status_code >= 400
+        resultados[nombre] = resumir(latencias, sum(latencias), errores)
+        imprimir_fila(nombre, resultados[nombre])
+    # Escribe los prospectos pendientes antes de descartar la copia de la base
+    terrazen.get_lead_writer().shutdown()
+    return resultados
+
+# GUNICORN (varios workers y clientes concurrentes por HTTP)
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def iniciar_gunicorn(args, ruta_db, directorio):
+    puerto = puerto_libre()
+    entorno = dict(os.environ, DATABASE_PATH=ruta_db, PAGE_CACHE_PATH=os.path.join(directorio, 'cache.db'))
+    if args.sin_cache:
+        entorno['PAGE_CACHE_ENABLED'] = '0'
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '-b', f'127.0.0.1:{puerto}',
+         '--log-level', 'warning', 'app:app'],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL
+    )
+    limite = time.time() + 60
+    while time.time() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError('gunicorn terminó al arrancar')
+        try:
+            with socket.create_connection(('127.0.0.1', puerto), timeout=0.5):
+                return proceso, puerto
+        except OSError:
+            time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError('gunicorn no respondió en 60s')
+
+def peticion_http(puerto, metodo, ruta, formulario=None, cookie=None):
+    conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=60)
+    try:
+        cuerpo = urlencode(formulario) if formulario else None
+        cabeceras = {'Content-Type': 'application/x-www-form-urlencoded'} if cuerpo else {}
+        if cookie:
+            cabeceras['Cookie'] = cookie
+        conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+        respuesta = conexion.getresponse()
+        respuesta.read()
+        return respuesta.status, respuesta.getheader('Set-Cookie')
+    finally:
+        conexion.close()
+
+def correr_gunicorn(args, ruta_db, escenarios, datos, directorio):
+    proceso, puerto = iniciar_gunicorn(args, ruta_db, directorio)
+    try:
+        _, set_cookie = peticion_http(puerto, 'POST', '/crm/login', dict(zip(('username', 'password'), CRM_USUARIO)))
+        cookie = set_cookie.split(';', 1)[0] if set_cookie else None
+        if peticion_http(puerto, 'GET', '/crm/dashboard', cookie=cookie)[0] != 200:
+            sys.exit('No se pudo iniciar sesión en el CRM con el usuario por defecto')
+
+        resultados = {}
+        for nombre in escenarios:
+            rng = random.Random(nombre)
+            lock = threading.Lock()
+            peticiones = [ESCENARIOS[nombre](rng, datos) for _ in range(args.calentamiento + args.peticiones)]
+            latencias = []
+            errores = [0]
+
+            def ejecutar(indice):
+                metodo, ruta, formulario = peticiones[indice]
+                inicio = time.perf_counter()
+                try:
+                    status, _ = peticion_http(puerto, metodo, ruta, formulario, cookie)
+                except OSError:
+                    status = 599
+                duracion = time.perf_counter() - inicio
+                if indice >= args.calentamiento:
+                    with lock:
+                        latencias.append(duracion)
+                        errores[0] += status >= 400
+
+            with ThreadPoolExecutor(args.concurrencia) as pool:
+                list(pool.map(ejecutar, range(args.calentamiento)))
+                inicio = time.perf_counter()
+                list(pool.map(ejecutar, range(args.calentamiento, len(peticiones))))
+                total = time.perf_counter() - inicio
+            resultados[nombre] = resumir(latencias, total, errores[0])
+            imprimir_fila(nombre, resultados[nombre])
+        return resultados
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+
+# REPORTE Y LÍNEA BASE
+def imprimir_cabecera():
+    print(f"{'escenario':<22}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errores':>9}")
+
+def imprimir_fila(nombre, r):
+    print(f"{nombre:<22}{r['peticiones']:>6}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+          f"{r['req_s']:>10.1f}{r['errores']:>9}")
+
+def metadatos(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'escala': args.escala,
+        'modo': args.modo,
+        'peticiones': args.peticiones,
+        'workers': args.workers if args.modo == 'gunicorn' else 1,
+        'concurrencia': args.concurrencia if args.modo == 'gunicorn' else 1,
+        'cache_paginas': not args.sin_cache,
+        'commit': commit,
+        'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'maquina': platform.node(),
+    }
+
+def comparar(base, resultados, tolerancia):
+    """Imprime la variación contra la línea base; retorna los escenarios con p95 peor que la tolerancia"""
+    regresiones = []
+    print(f"\n{'escenario':<22}{'p50':>10}{'p95':>10}{'p99':>10}{'req/s':>10}")
+    for nombre, actual in resultados.items():
+        anterior = base['resultados'].get(nombre)
+        if not anterior:
+            print(f"{nombre:<22}{'(nuevo)':>10}")
+            continue
+        variacion = {
+            campo: (actual[campo] - anterior[campo]) / anterior[campo] if anterior[campo] else 0.0
+            for campo in ('p50_ms', 'p95_ms', 'p99_ms', 'req_s')
+        }
+        marca = ''
+        if variacion['p95_ms'] > tolerancia:
+            regresiones.append(nombre)
+            marca = '  << regresión'
+        print(f"{nombre:<22}" + ''.join(f"{variacion[c]:>+10.1%}" for c in ('p50_ms', 'p95_ms', 'p99_ms', 'req_s')) + marca)
+    return regresiones
+
+def main():
+    args = parse_args()
+    escenarios = [e.strip() for e in args.escenarios.split(',') if e.strip()] or list(ESCENARIOS)
+    desconocidos = [e for e in escenarios if e not in ESCENARIOS]
+    if desconocidos:
+        sys.exit(f"Escenarios desconocidos: {', '.join(desconocidos)}")
+
+    directorio = tempfile.mkdtemp(prefix='bench_rutas_')
+    os.environ.setdefault('PAGE_CACHE_PATH', os.path.join(directorio, 'cache.db'))
+    os.environ.setdefault('SESSION_DB_PATH', os.path.join(directorio, 'sesiones.db'))
+    os.environ.setdefault('JOB_WORKERS', '0')
+    os.environ['DATABASE_PATH'] = os.path.join(directorio, 'arranque.db')
+    sys.path.insert(0, RAIZ)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import datos as datos_sinteticos
+
+    inicio = time.perf_counter()
+    sembrada = datos_sinteticos.base_sembrada(args.escala, regenerar=args.regenerar)
+    print(f"Base {args.escala}: {sembrada} ({time.perf_counter() - inicio:.1f}s)")
+    ruta_db = datos_sinteticos.copiar_base(sembrada, os.path.join(directorio, 'bench.db'))
+    datos = cargar_datos(ruta_db)
+
+    imprimir_cabecera()
+    if args.modo == 'cliente':
+        resultados = correr_cliente(args, ruta_db, escenarios, datos)
+    else:
+        resultados = correr_gunicorn(args, ruta_db, escenarios, datos, directorio)
+
+    informe = {'meta': metadatos(args), 'resultados': resultados}
+    ruta_base = os.path.join(DIRECTORIO_BASES, f"{args.escala}-{args.modo}.json")
+    codigo = 0
+    if args.comparar:
+        if not os.path.exists(ruta_base):
+            sys.exit(f"No hay línea base en {ruta_base}; ejecute con --guardar-base")
+        with open(ruta_base, encoding='utf-8') as f:
+            base = json.load(f)
+        print(f"\nContra la línea base {base['meta'].get('commit')} ({base['meta'].get('fecha')}):")
+        regresiones = comparar(base, resultados, args.tolerancia)
+        if regresiones:
+            print(f"\nRegresiones de p95 > {args.tolerancia:.0%}: {', '.join(regresiones)}")
+            codigo = 1
+    if args.guardar_base:
+        os.makedirs(DIRECTORIO_BASES, exist_ok=True)
+        with open(ruta_base, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f"\nLínea base guardada en {ruta_base}")
+    sys.exit(codigo)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Bases sembradas por escala para los benchmarks (generadas con seed_data de app.py)
+
+Se guardan en benchmarks/.datos/ y se reutilizan entre corridas.
+"""
+import os
+import shutil
+
+DIRECTORIO_DATOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.datos')
+
+# escala -> (propietarios, propiedades, prospectos)
+ESCALAS = {
+    '1k': (50, 1000, 1000),
+    '50k': (1000, 50000, 50000),
+    '500k': (5000, 500000, 500000),
+}
+
+def base_sembrada(escala, regenerar=False):
+    """Ruta de la base sembrada para la escala (se genera la primera vez)"""
+    import app as terrazen
+
+    ruta = os.path.join(DIRECTORIO_DATOS, f'{escala}.db')
+    if os.path.exists(ruta) and not regenerar:
+        return ruta
+    os.makedirs(DIRECTORIO_DATOS, exist_ok=True)
+    for sufijo in ('', '-wal', '-shm', '.tmp', '.tmp-wal', '.tmp-shm'):
+        if os.path.exists(ruta + sufijo):
+            os.remove(ruta + sufijo)
+
+    terrazen.app.config['DATABASE'] = ruta + '.tmp'
+    with terrazen.app.app_context():
+        terrazen.seed_data(terrazen.get_db(), *ESCALAS[escala])
+        terrazen.get_db().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    terrazen.get_pool().close_all()
+    os.replace(ruta + '.tmp', ruta)
+    for sufijo in ('-wal', '-shm'):
+        if os.path.exists(ruta + '.tmp' + sufijo):
+            os.remove(ruta + '.tmp' + sufijo)
+    return ruta
+
+def copiar_base(origen, destino):
+    """Copia de trabajo: las corridas escriben prospectos y no deben alterar la base sembrada"""
+    shutil.copyfile(origen, destino)
+    return destino
@@ -0,0 +1,24 @@
+"""Configuración de gunicorn: la base se prepara una vez en el maestro y los workers arrancan sin tocarla"""
+import time
+
+wsgi_app = 'app:create_app()'
+
+def on_starting(server):
+    # Maestro, antes del primer fork: migraciones y usuario por defecto una sola vez.
+    # Los workers heredan el módulo importado y el pool ya preparado.
+    from app import app, get_db, get_pool
+
+    inicio = time.perf_counter()
+    with app.app_context():
+        get_db()
+    get_pool().close_all()
+    server.log.info("Base preparada en %.0f ms", (time.perf_counter() - inicio) * 1000)
+
+def pre_fork(server, worker):
+    worker.inicio_arranque = time.perf_counter()
+
+def post_worker_init(worker):
+    # Del fork hasta que el worker puede aceptar peticiones; se publica en /metrics
+    arranque_ms = round((time.perf_counter() - worker.inicio_arranque) * 1000, 3)
+    worker.wsgi.extensions['arranque_worker_ms'] = arranque_ms
+    worker.log.info("Worker %s listo en %.1f ms", worker.pid, arranque_ms)
@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# Importar app.py no abre la base, pero sus rutas por defecto no deben caer en el repositorio
+_temporal = tempfile.mkdtemp(prefix='terrazen_tests_')
+os.environ.setdefault('DATABASE_PATH', os.path.join(_temporal, 'import.db'))
+os.environ.setdefault('PAGE_CACHE_PATH', os.path.join(_temporal, 'cache.db'))
+os.environ.setdefault('SESSION_DB_PATH', os.path.join(_temporal, 'sesiones.db'))
+os.environ.setdefault('LEAD_SPOOL_PATH', os.path.join(_temporal, 'prospectos_pendientes'))
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+os.environ.setdefault('JOB_WORKERS', '0')
+
+import app as terrazen  # noqa: E402
+
+EXTENSIONES = ('page_cache', 'session_store', 'lead_writer',
+               'password_hasher', 'login_limiter', 'login_ip_limiter', 'crm_auth_cache')
+
+@pytest.fixture
+def app(tmp_path):
+    """La aplicación con base, caché y sesiones propias de cada prueba"""
+    anterior = dict(terrazen.app.config)
+    terrazen.create_app(dict(
+        TESTING=True,
+        DATABASE=str(tmp_path / 'terrazen.db'),
+        PAGE_CACHE_PATH=str(tmp_path / 'cache.db'),
+        SESSION_DB_PATH=str(tmp_path / 'sesiones.db'),
+        UPLOAD_FOLDER=str(tmp_path / 'uploads'),
+        LEAD_SPOOL_PATH=str(tmp_path / 'prospectos_pendientes'),
+        TRUSTED_PROXY_HOPS=1,
+    ))
+    for nombre in EXTENSIONES:
+        terrazen.app.extensions.pop(nombre, None)
+    yield terrazen.app
+    writer = terrazen.app.extensions.pop('lead_writer', None)
+    if writer is not None:
+        writer.shutdown()
+    terrazen.get_pool().close_all()
+    for nombre in EXTENSIONES:
+        terrazen.app.extensions.pop(nombre, None)
+    terrazen.app.config.clear()
+    terrazen.create_app(anterior)
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        yield terrazen.get_db()
+
+@pytest.fixture
+def crm(client):
+    """Cliente con sesión iniciada en el CRM (usuario por defecto)"""
+    respuesta = client.post('/crm/login', data={'username': 'admin', 'password': 'admin123'})
+    assert respuesta.status_code == 302
+    return client
@@ -0,0 +1,22 @@
+import app as terrazen
+
+def test_monto_y_moneda_vienen_de_las_columnas_normalizadas(app, client, db):
+    db.execute('''
+        INSERT INTO propiedades (titulo_es, descripcion_es, titulo_en, descripcion_en, precio, precio_num,
+                                 precio_moneda, ubicacion, tipo_es, tipo_en, estado, fecha_creacion,
+                                 fecha_actualizacion, activo)
+        VALUES ('Casa', '', 'House', '', '€150.000', 150000, 'EUR', 'Antigua', 'Casa', 'House', 'venta',
+                '2024-01-01 10:00:00', '2024-01-01 10:00:00', 1)
+    ''')
+    db.commit()
+    datos = client.get('/api/v1/propiedades?fields=precio,monto,moneda').get_json()['data']
+    assert datos == [{'precio': '€150.000', 'monto': 150000, 'moneda': 'EUR'}]
+
+def test_monto_no_vuelve_a_interpretar_el_texto(app, client, db, monkeypatch):
+    from test_prospectos import crear_propiedad
+    crear_propiedad(db)
+    db.execute("UPDATE propiedades SET precio_num = 1000000, precio_moneda = 'GTQ'")
+    db.commit()
+    monkeypatch.setattr(terrazen, 'parse_price', lambda *a: (_ for _ in ()).throw(AssertionError('parse_price')))
+    datos = client.get('/api/v1/propiedades?fields=monto,moneda').get_json()['data']
+    assert datos == [{'monto': 1000000, 'moneda': 'GTQ'}]
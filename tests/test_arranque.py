@@ -0,0 +1,57 @@
+import sqlite3
+import threading
+
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import app as terrazen
+
+def test_primer_prospecto_en_lote_prepara_la_base(app, client):
+    # Worker recién creado: la primera petición escribe por el LeadWriter, sin pasar por get_db()
+    app.config['LEAD_BATCHING'] = True
+    respuesta = client.post('/prospecto', data={'nombre': 'Ana', 'telefono': '5555'})
+    assert respuesta.status_code == 302
+    writer = terrazen.get_lead_writer()
+    writer.shutdown()
+    assert writer.stats()['perdidos'] == 0
+    conn = sqlite3.connect(app.config['DATABASE'])
+    assert conn.execute('SELECT nombre FROM prospects').fetchall() == [('Ana',)]
+
+def test_conexiones_simultaneas_esperan_la_preparacion(app):
+    errores = []
+    barrera = threading.Barrier(6)
+
+    def consultar():
+        barrera.wait()
+        try:
+            with terrazen.get_pool().connection() as conn:
+                conn.execute('SELECT COUNT(*) FROM metricas_prospectos').fetchone()
+        except Exception as e:
+            errores.append(e)
+
+    with app.app_context():
+        terrazen.get_pool()
+    hilos = [threading.Thread(target=consultar) for _ in range(6)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert errores == []
+    conn = sqlite3.connect(app.config['DATABASE'])
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == terrazen.MIGRATIONS[-1][0]
+    assert conn.execute('SELECT COUNT(*) FROM usuarios_crm').fetchone()[0] == 1
+
+def test_create_app_aplica_la_configuracion_recibida(app):
+    terrazen.create_app({'SESSION_BACKEND': 'cookie', 'TRUSTED_PROXY_HOPS': 0, 'PAGE_CACHE_VERSION': 'v2'})
+    assert type(app.session_interface) is SecureCookieSessionInterface
+    assert not isinstance(app.wsgi_app, ProxyFix)
+    with app.test_request_context('/propiedades?b=2&a=1'):
+        assert terrazen.page_cache_key('es') == 'v2:/propiedades?a=1&b=2#es'
+
+    terrazen.create_app({'SESSION_BACKEND': 'servidor', 'TRUSTED_PROXY_HOPS': 2})
+    assert isinstance(app.session_interface, terrazen.ServerSessionInterface)
+    # Reconfigurar no anida un ProxyFix dentro de otro
+    assert isinstance(app.wsgi_app, ProxyFix) and not isinstance(app.wsgi_app.app, ProxyFix)
+    assert app.wsgi_app.x_for == 2
+    respuesta = app.test_client().get('/crm/login', headers={'X-Forwarded-For': '203.0.113.9, 10.0.0.1'})
+    assert respuesta.status_code == 200
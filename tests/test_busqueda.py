@@ -0,0 +1,23 @@
+import pytest
+
+def crear_en(db, ubicacion, tipo_es='Casa'):
+    db.execute('''
+        INSERT INTO propiedades (titulo_es, descripcion_es, titulo_en, descripcion_en, precio, precio_num,
+                                 precio_moneda, ubicacion, tipo, tipo_es, tipo_en, estado, fecha_creacion,
+                                 fecha_actualizacion, activo)
+        VALUES ('Casa', '', 'House', '', 'Q100,000', 100000, 'GTQ', ?, 'otro', ?, 'Other', 'venta',
+                '2024-01-01 10:00:00', '2024-01-01 10:00:00', 1)
+    ''', (ubicacion, tipo_es))
+    db.commit()
+
+@pytest.mark.parametrize('filtro', ['Petén', 'PETÉN', 'petén', 'flores, pet'])
+def test_filtro_de_ubicacion_ignora_mayusculas_acentuadas(app, client, db, filtro):
+    crear_en(db, 'Flores, PETÉN')
+    crear_en(db, 'Sololá')
+    datos = client.get('/api/v1/propiedades', query_string={'ubicacion': filtro, 'fields': 'ubicacion'}).get_json()['data']
+    assert datos == [{'ubicacion': 'Flores, PETÉN'}]
+
+def test_filtro_de_tipo_traducido_ignora_mayusculas_acentuadas(app, client, db):
+    crear_en(db, 'Sololá', tipo_es='ÁTICO')
+    datos = client.get('/api/v1/propiedades', query_string={'tipo': 'Ático', 'fields': 'ubicacion'}).get_json()['data']
+    assert datos == [{'ubicacion': 'Sololá'}]
@@ -0,0 +1,78 @@
+import sqlite3
+
+import app as terrazen
+from test_prospectos import crear_propiedad
+
+def test_set_descarta_si_la_etiqueta_cambio(app, tmp_path):
+    cache = terrazen.PageCache(str(tmp_path / 'c.db'), 1024 * 1024, 1024 * 1024)
+    cuerpo, origen, version = cache.get('clave', 'listado')
+    assert (cuerpo, origen) == (None, 'MISS')
+    cache.invalidate('listado')
+    assert cache.set('clave', 'listado', b'viejo', version) is False
+    assert cache.get('clave', 'listado')[0] is None
+    _, _, version = cache.get('clave', 'listado')
+    assert cache.set('clave', 'listado', b'nuevo', version) is True
+    assert cache.get('clave', 'listado')[:2] == (b'nuevo', 'HIT-MEMORIA')
+
+def test_total_de_bytes_del_almacen_sin_sumar_la_tabla(app, tmp_path):
+    cache = terrazen.PageCache(str(tmp_path / 'c.db'), 1024 * 1024, 250)
+
+    def total():
+        db = cache._db()
+        suma = db.execute('SELECT COALESCE(SUM(bytes), 0) FROM entradas').fetchone()[0]
+        assert cache.stats()['bytes_disco'] == suma
+        return suma
+
+    for clave, etiqueta in (('a', 'listado'), ('b', 'listado'), ('c', 'propiedad:1')):
+        cache.set(clave, etiqueta, b'x' * 100, cache.get(clave, etiqueta)[2])
+    # El tercer cuerpo supera el presupuesto de 250 bytes: se desaloja el menos usado
+    assert total() == 200
+    cache.set('c', 'propiedad:1', b'x' * 10, cache.get('c', 'propiedad:1')[2])
+    assert total() == 110
+    cache.invalidate('propiedad:1')
+    assert total() == 100
+
+def test_total_de_bytes_de_un_almacen_anterior(app, tmp_path):
+    ruta = str(tmp_path / 'c.db')
+    conn = sqlite3.connect(ruta)
+    conn.execute('CREATE TABLE entradas (clave TEXT PRIMARY KEY, etiqueta TEXT NOT NULL, cuerpo BLOB NOT NULL, '
+                 'bytes INTEGER NOT NULL, ultimo_uso REAL NOT NULL)')
+    conn.execute("INSERT INTO entradas VALUES ('a', 'listado', x'00', 40, 0), ('b', 'listado', x'00', 2, 0)")
+    conn.commit()
+    conn.close()
+    assert terrazen.PageCache(ruta, 1024, 1024).stats()['bytes_disco'] == 42
+
+def test_escritura_durante_el_render_no_queda_en_cache(app, client, db, monkeypatch):
+    propiedad_id = crear_propiedad(db)
+    original = terrazen.attach_variantes
+
+    def con_escritura(*args, **kwargs):
+        # Otra petición actualiza la propiedad mientras esta renderiza la versión anterior
+        terrazen.invalidate_propiedades(propiedad_id)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(terrazen, 'attach_variantes', con_escritura)
+    assert client.get(f'/propiedad/{propiedad_id}').headers['X-Cache'] == 'MISS'
+    monkeypatch.setattr(terrazen, 'attach_variantes', original)
+    assert client.get(f'/propiedad/{propiedad_id}').headers['X-Cache'] == 'MISS'
+    assert client.get(f'/propiedad/{propiedad_id}').headers['X-Cache'] == 'HIT-MEMORIA'
+
+def test_variantes_nuevas_cambian_el_etag(app, client, db):
+    propiedad_id = crear_propiedad(db)
+    db.execute('UPDATE propiedades SET imagenes = ? WHERE id = ?', ('["uploads/foto.jpg"]', propiedad_id))
+    db.commit()
+    antes = {ruta: client.get(ruta) for ruta in (f'/propiedad/{propiedad_id}', '/propiedades')}
+
+    variantes = {'ancho': 800, 'alto': 600, 'formatos': {
+        'webp': [[400, 'uploads/variantes/foto_400.webp']],
+        'jpeg': [[400, 'uploads/variantes/foto_400.jpg']],
+    }}
+    terrazen._image_job_result({'ruta': 'uploads/foto.jpg'}, variantes)
+
+    for ruta, respuesta in antes.items():
+        assert respuesta.status_code == 200 and respuesta.headers['ETag']
+        nueva = client.get(ruta, headers={'If-None-Match': respuesta.headers['ETag']})
+        # El navegador que vio la página con el original no debe quedarse con un 304
+        assert nueva.status_code == 200, ruta
+        assert nueva.headers['ETag'] != respuesta.headers['ETag']
+    assert b'foto_400.webp' in client.get(f'/propiedad/{propiedad_id}').data
@@ -0,0 +1,22 @@
+import app as terrazen
+
+def test_descarga_lenta_no_ocupa_el_pool(app, crm, db):
+    db.executemany(
+        "INSERT INTO prospects (nombre, telefono, fuente, fecha, propiedad, idioma) "
+        "VALUES (?, '5555', 'direct', '2024-02-01 10:00:00', 'Interés general', 'espanol')",
+        [(f'Prospecto {i}',) for i in range(terrazen.EXPORT_BATCH_SIZE * 3)]
+    )
+    db.commit()
+
+    en_uso = terrazen.get_pool().stats()['in_use']  # la conexión de esta prueba
+    respuesta = crm.get('/crm/export_prospectos', buffered=False)
+    chunks = iter(respuesta.response)
+    next(chunks)  # el cliente leyó el primer bloque y se detuvo
+    stats = terrazen.get_pool().stats()
+    assert stats['in_use'] == en_uso
+    assert stats['readers'] == 1
+
+    resto = b''.join(chunks)
+    respuesta.close()
+    assert resto.count(b'\n') >= terrazen.EXPORT_BATCH_SIZE * 2
+    assert terrazen.get_pool().stats()['readers'] == 0
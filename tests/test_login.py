@@ -0,0 +1,31 @@
+def login(client, password, ip):
+    return client.post('/crm/login', data={'username': 'admin', 'password': password},
+                       headers={'X-Forwarded-For': ip})
+
+def test_fallos_desde_otra_ip_no_bloquean_al_administrador(app, client):
+    atacante = app.test_client()
+    codigos = [login(atacante, 'incorrecta', '203.0.113.9').status_code for _ in range(8)]
+    assert codigos[-1] == 429
+    assert login(client, 'admin123', '198.51.100.7').status_code == 302
+
+def test_cada_cliente_tras_el_proxy_tiene_su_propia_cubeta(app):
+    # Todas las peticiones llegan desde el router; X-Forwarded-For distingue a los clientes
+    for i in range(30):
+        respuesta = login(app.test_client(), 'incorrecta', f'198.51.100.{i}')
+        assert respuesta.status_code == 200
+
+def test_limite_por_usuario_e_ip(app):
+    cliente = app.test_client()
+    codigos = [login(cliente, 'incorrecta', '203.0.113.9').status_code for _ in range(8)]
+    assert codigos[:5] == [200] * 5
+    assert codigos[5:] == [429] * 3
+    assert 'Retry-After' in login(cliente, 'incorrecta', '203.0.113.9').headers
+
+def test_limite_por_ip_con_varios_usuarios(app):
+    cliente = app.test_client()
+    codigos = [
+        cliente.post('/crm/login', data={'username': f'usuario{i}', 'password': 'x'},
+                     headers={'X-Forwarded-For': '203.0.113.9'}).status_code
+        for i in range(app.config['LOGIN_IP_BURST'] + 2)
+    ]
+    assert codigos[-1] == 429
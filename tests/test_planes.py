@@ -0,0 +1,10 @@
+import app as terrazen
+
+def test_consultas_frecuentes_usan_indices_en_base_vacia(db):
+    assert terrazen.check_query_plans(db) == []
+
+def test_consultas_frecuentes_usan_indices_con_datos(db):
+    # Con datos y estadísticas (PRAGMA optimize) el planificador puede elegir otros planes
+    terrazen.seed_data(db, propietarios=20, propiedades=300, prospectos=1000)
+    db.execute('ANALYZE')
+    assert terrazen.check_query_plans(db) == []
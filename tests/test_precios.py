@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+import app as terrazen
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('Q150,000', (150000, 'GTQ')),
+    ('$ 90000', (90000, 'USD')),
+    ('US$1,250,000', (1250000, 'USD')),
+    ('GTQ 1.500.000', (1500000, 'GTQ')),
+    ('€150.000', (150000, 'EUR')),
+    ('150.000 EUR', (150000, 'EUR')),
+    ('€ 2.500', (2500, 'EUR')),
+    ('Q 1,500.000', (1500000, 'GTQ')),
+    ('Q1,500.50', (1500, 'GTQ')),
+    ('1.500,50 EUR', (1500, 'EUR')),
+    ('Q 99.5', (99, 'GTQ')),
+    ('Consultar', (None, None)),
+    ('', (None, None)),
+    ('inf', (None, None)),
+    ('-inf', (None, None)),
+    ('nan', (None, None)),
+    ('1e400', (None, None)),
+    ('$1e30', (None, None)),
+    ('Q9223372036854775807', (None, None)),
+    ('Q 10.000.000.000.000.000.000', (None, None)),
+    ('Q1e18', (10 ** 18, 'GTQ')),
+])
+def test_parse_price(texto, esperado):
+    assert terrazen.parse_price(texto) == esperado
+
+def test_precio_europeo_sembrado():
+    # seed_data escribe los euros con punto de miles: "€16.666"
+    precios = [terrazen._seed_price(random.Random(semilla)) for semilla in range(300)]
+    euros = [p for p in precios if p.startswith('€')]
+    assert euros
+    for precio in euros:
+        assert terrazen.parse_price(precio)[0] >= 1000, precio
+
+def test_migracion_de_precios_tolera_textos_fuera_de_rango(db):
+    db.execute('''
+        INSERT INTO propiedades (titulo_es, descripcion_es, titulo_en, descripcion_en, precio, precio_num,
+                                 precio_moneda, ubicacion, tipo_es, tipo_en, estado, fecha_creacion,
+                                 fecha_actualizacion, activo)
+        VALUES ('Casa', '', 'House', '', '1e400', 1, 'GTQ', 'Antigua', 'Casa', 'House', 'venta',
+                '2024-01-01 10:00:00', '2024-01-01 10:00:00', 1)
+    ''')
+    terrazen._migration_precio_miles(db)
+    assert tuple(db.execute('SELECT precio_num, precio_moneda FROM propiedades').fetchone()) == (None, None)
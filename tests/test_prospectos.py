@@ -0,0 +1,96 @@
+import sqlite3
+
+import app as terrazen
+
+def crear_propiedad(db, titulo='Casa en Antigua'):
+    cursor = db.execute('''
+        INSERT INTO propiedades (titulo_es, descripcion_es, titulo_en, descripcion_en, precio, ubicacion,
+                                 tipo_es, tipo_en, estado, fecha_creacion, fecha_actualizacion, activo)
+        VALUES (?, '', ?, '', 'Q 1,000,000', 'Antigua', 'Casa', 'House', 'venta',
+                '2024-01-01 10:00:00', '2024-01-01 10:00:00', 1)
+    ''', (titulo, titulo))
+    db.commit()
+    return cursor.lastrowid
+
+def test_prospecto_sin_propiedad(app, client, db):
+    app.config['LEAD_BATCHING'] = False
+    respuesta = client.post('/prospecto', data={'nombre': 'Ana', 'telefono': '5555', 'propiedad_id': ''})
+    assert respuesta.status_code == 302
+    fila = db.execute('SELECT propiedad_id, propiedad FROM prospects').fetchone()
+    assert fila['propiedad_id'] is None
+    assert fila['propiedad'] == 'Interés general'
+    assert db.execute('SELECT SUM(total) FROM metricas_prospectos').fetchone()[0] == 1
+
+def test_prospecto_sin_propiedad_en_lote(app, client, db):
+    app.config['LEAD_BATCHING'] = True
+    propiedad_id = crear_propiedad(db)
+    client.post('/prospecto', data={'nombre': 'Ana', 'telefono': '5555', 'propiedad_id': ''})
+    client.post('/prospecto', data={'nombre': 'Luis', 'telefono': '5556', 'propiedad_id': str(propiedad_id)})
+    writer = terrazen.get_lead_writer()
+    writer.shutdown()
+    assert writer.stats()['perdidos'] == 0
+    filas = db.execute('SELECT nombre, propiedad_id FROM prospects ORDER BY id').fetchall()
+    assert [tuple(f) for f in filas] == [('Ana', None), ('Luis', propiedad_id)]
+    assert db.execute('SELECT prospectos FROM metricas_propiedades WHERE propiedad_id = ?',
+                      (propiedad_id,)).fetchone()[0] == 1
+
+def test_migrar_base_con_propiedad_id_vacio(app):
+    # Base en la versión 12 (antes de las métricas) con prospectos guardados con propiedad_id = ''
+    conn = sqlite3.connect(app.config['DATABASE'], isolation_level=None)
+    for version, _, migrate in terrazen.MIGRATIONS:
+        if version > 12:
+            break
+        conn.execute('BEGIN')
+        migrate(conn)
+        conn.execute(f'PRAGMA user_version = {version}')
+        conn.execute('COMMIT')
+    propiedad_id = crear_propiedad(conn)
+    conn.executemany('''
+        INSERT INTO prospects (nombre, telefono, fuente, fecha, propiedad, propiedad_id, idioma)
+        VALUES (?, '5555', 'direct', '2024-02-01 10:00:00', 'Interés general', ?, 'espanol')
+    ''', [('Ana', ''), ('Luis', propiedad_id), ('Eva', '')])
+    conn.close()
+
+    with app.app_context():
+        db = terrazen.get_db()
+        assert terrazen.get_schema_version(db) == terrazen.MIGRATIONS[-1][0]
+        assert db.execute("SELECT COUNT(*) FROM prospects WHERE propiedad_id IS NULL").fetchone()[0] == 2
+        assert [tuple(f) for f in db.execute('SELECT propiedad_id, prospectos FROM metricas_propiedades')] == [(propiedad_id, 1)]
+        assert db.execute('SELECT SUM(total) FROM metricas_prospectos').fetchone()[0] == 3
+
+def test_lote_con_fila_invalida_guarda_las_demas(app, db):
+    writer = terrazen.get_lead_writer()
+    for nombre in ('Ana', None, 'Luis'):
+        writer.submit({'nombre': nombre, 'telefono': '5555'})
+    writer.shutdown()
+    stats = writer.stats()
+    assert stats['escritos'] == 2
+    assert stats['perdidos'] == 1
+    # El error de integridad no se reintenta: un fallo del lote y otro de la fila inválida
+    assert stats['errores'] == 2
+    assert [f[0] for f in db.execute('SELECT nombre FROM prospects ORDER BY id')] == ['Ana', 'Luis']
+
+def test_lote_con_base_bloqueada_se_aparta_y_se_recupera(app, db, monkeypatch):
+    insertar = terrazen.insert_prospects
+
+    def bloqueada(conn, prospects):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(terrazen, 'insert_prospects', bloqueada)
+    writer = terrazen.get_lead_writer()
+    for nombre in ('Ana', 'Luis'):
+        writer.submit({'nombre': nombre, 'telefono': '5555'})
+    writer.shutdown()
+    stats = writer.stats()
+    assert stats['perdidos'] == 0
+    assert stats['aplazados'] >= 2
+    assert writer._spooled_files()
+    assert db.execute('SELECT COUNT(*) FROM prospects').fetchone()[0] == 0
+
+    # El siguiente arranque (otro proceso o el mismo worker) drena lo apartado
+    monkeypatch.setattr(terrazen, 'insert_prospects', insertar)
+    writer.start()
+    writer.shutdown()
+    assert writer.stats()['recuperados'] == 2
+    assert writer._spooled_files() == []
+    assert [f[0] for f in db.execute('SELECT nombre FROM prospects ORDER BY id')] == ['Ana', 'Luis']
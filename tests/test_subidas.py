@@ -0,0 +1,28 @@
+import io
+import os
+
+import app as terrazen
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+def archivos_subidos(app):
+    carpeta = app.config['UPLOAD_FOLDER']
+    return sorted(os.listdir(carpeta)) if os.path.isdir(carpeta) else []
+
+def test_importar_csv_no_usa_el_stream_de_imagenes(app, crm):
+    filas = 'nombre,email,telefono\n' + 'Ana,ana@ejemplo.com,5555\n'
+    relleno = '#' * (terrazen.MAX_FILE_SIZE + 1024)
+    respuesta = crm.post('/crm/importar?entidad=propietarios&validar=1', data={
+        'archivo': (io.BytesIO((filas + relleno).encode()), 'propietarios.csv'),
+    }, content_type='multipart/form-data')
+    # Más grande que el límite por imagen: no debe responder el 413 de imágenes
+    assert respuesta.status_code != 413
+    assert 'imagen' not in respuesta.get_json().get('error', '')
+    assert archivos_subidos(app) == []
+
+def test_subir_imagen_usa_el_stream_a_disco(app, crm):
+    respuesta = crm.post('/upload_images', data={
+        'images[]': (io.BytesIO(PNG), 'foto.png'),
+    }, content_type='multipart/form-data')
+    assert respuesta.get_json()['success'] is True
+    assert any(nombre.endswith('.png') for nombre in archivos_subidos(app))